@@ -8,11 +8,10 @@ shawn.s.murdzek@noaa.gov
 # Import Modules
 #---------------------------------------------------------------------------------------------------
 
-import numpy as np
 import datetime as dt
 import xarray as xr
 
-import pyDA_utils.gsi_fcts as gsi
+import osse_utils.gsi_diag as gd
 
 
 #---------------------------------------------------------------------------------------------------
@@ -31,30 +30,39 @@ in_fnames = {"0.95" : [f"{parent1}/rrfs.{t.strftime('%Y%m%d/%H/diag_conv_t_ges.%
 pmin = 700
 pmax = 1050
 
+# Observation types
+uas_typ = [136]
+aircft_typ = [130, 131, 133, 134, 135]
+
+# Number of diag files to read at once
+nworkers = 4
+
 
 #---------------------------------------------------------------------------------------------------
 # Main Program
 #---------------------------------------------------------------------------------------------------
 
-for key in in_fnames:
-
-    # Read in GSI diag files
-    diag_full = gsi.read_diag(in_fnames[key], ftype='netcdf')
-    diag = diag_full.loc[np.logical_and(diag_full['Pressure'] >= pmin, diag_full['Pressure'] <= pmax), :]
-    omb_uas = {'omb': ((f"dum"), diag.loc[diag['Observation_Type'] == 136, 'Obs_Minus_Forecast_adjusted'].values)}
-    omb_aircft = {'omb': ((f"dum"), diag.loc[(diag['Observation_Type'] == 130) |
-                                             (diag['Observation_Type'] == 131) |
-                                             (diag['Observation_Type'] == 133) |
-                                             (diag['Observation_Type'] == 134) |
-                                             (diag['Observation_Type'] == 135), 'Obs_Minus_Forecast_adjusted'].values)}
-
-    # Save to netCDF
-    for omb, typ, tag in zip([omb_uas, omb_aircft], ['UAS', 'commercial aircraft'], ['uas', 'aircft']):
-        ds = xr.Dataset(omb)
-        ds['omb'].attrs['units'] = 'K'
-        ds['omb'].attrs['layer'] = f"{pmax} - {pmin} hPa"
-        ds['omb'].attrs['desc'] = f"{typ} temperature obs - bgd for the spring_uas_35km_autocorr{key} experiment"
-        ds.to_netcdf(f"omb_t_{tag}_A{key}.nc")
+# Worker processes re-import this script, so only run when executed directly
+if __name__ == '__main__':
+
+    for key in in_fnames:
+
+        # Read in GSI diag files, only retaining UAS and aircraft obs in the desired layer
+        diag = gd.read_diag_stream(in_fnames[key], 
+                                   ['Observation_Type', 'Obs_Minus_Forecast_adjusted'],
+                                   filters={'Pressure': (pmin, pmax),
+                                            'Observation_Type': uas_typ + aircft_typ},
+                                   nworkers=nworkers)
+        omb_uas = {'omb': ((f"dum"), diag.loc[diag['Observation_Type'].isin(uas_typ), 'Obs_Minus_Forecast_adjusted'].values)}
+        omb_aircft = {'omb': ((f"dum"), diag.loc[diag['Observation_Type'].isin(aircft_typ), 'Obs_Minus_Forecast_adjusted'].values)}
+
+        # Save to netCDF
+        for omb, typ, tag in zip([omb_uas, omb_aircft], ['UAS', 'commercial aircraft'], ['uas', 'aircft']):
+            ds = xr.Dataset(omb)
+            ds['omb'].attrs['units'] = 'K'
+            ds['omb'].attrs['layer'] = f"{pmax} - {pmin} hPa"
+            ds['omb'].attrs['desc'] = f"{typ} temperature obs - bgd for the spring_uas_35km_autocorr{key} experiment"
+            ds.to_netcdf(f"omb_t_{tag}_A{key}.nc")
 
 
 """
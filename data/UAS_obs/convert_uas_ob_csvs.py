@@ -0,0 +1,28 @@
+"""
+Convert UAS Prepbufr CSV Files to Binary Format
+
+Writes a .npy file next to each prepbufr CSV in this directory tree (see osse_utils/bufr_io.py).
+Plotting scripts read the binary files when they are available, which is much faster than parsing
+the CSVs. Run from this directory after untarring uas_obs.tar.gz.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import osse_utils.bufr_io as bio
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+written = bio.convert_tree('.')
+print(f"\nConverted {len(written)} files")
+
+
+"""
+End convert_uas_ob_csvs.py
+"""
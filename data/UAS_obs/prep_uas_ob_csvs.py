@@ -11,6 +11,7 @@ shawn.s.murdzek@noaa.gov
 #---------------------------------------------------------------------------------------------------
 
 from pyDA_utils import bufr
+import osse_utils.bufr_io as bio
 
 
 #---------------------------------------------------------------------------------------------------
@@ -32,17 +33,17 @@ in_data = '/work/noaa/wrfruc/murdzek/nature_run_spring/obs/uas_obs_{n:d}km/super
 #---------------------------------------------------------------------------------------------------
 
 for d, t in zip(uas_density, times):
+    # Only keep UAS thermodynamic obs
     if d == 35:
-        df = bufr.bufrCSV('/work/noaa/wrfruc/murdzek/nature_run_spring/obs/uas_obs_35km/combine_obs/superob_uas/202204292100.rap.fake.prepbufr.csv').df
+        df_new = bio.read_bufr_csv('/work/noaa/wrfruc/murdzek/nature_run_spring/obs/uas_obs_35km/combine_obs/superob_uas/202204292100.rap.fake.prepbufr.csv',
+                                   filters={'TYP': 136})
     else:
-        df = bufr.bufrCSV(in_data.format(n=d, t=t)).df
-
-    # Only keep UAS thermodynamic obs
-    df_new = df.loc[df['TYP'] == 136, :]
+        df_new = bio.read_bufr_csv(in_data.format(n=d, t=t), filters={'TYP': 136})
 
-    # Save new DataFrame
+    # Save new DataFrame as a CSV and in binary format
     fname = f'./uas_obs_{d}km/superob_uas/{t}.rap.fake.prepbufr.csv'
     bufr.df_to_csv(df_new, fname)
+    bio.write_bufr_npy(df_new, bio.npy_fname(fname))
 
 
 """
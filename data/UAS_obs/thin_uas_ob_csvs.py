@@ -0,0 +1,67 @@
+"""
+Create Coarser UAS Networks by Thinning the 35-km UAS Obs
+
+Selects a subset of the 35-km UAS sites with approximately the desired spacing and keeps the UAS
+obs from those sites (see osse_utils/uas_thinning.py). This avoids regenerating UAS obs from the
+nature run for each new network. Run from this directory after untarring uas_obs.tar.gz.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+
+from pyDA_utils import bufr
+import osse_utils.bufr_io as bio
+import osse_utils.uas_sites as us
+import osse_utils.uas_thinning as uth
+
+
+#---------------------------------------------------------------------------------------------------
+# Inputs
+#---------------------------------------------------------------------------------------------------
+
+# Target UAS spatial densities (km)
+uas_density = [300, 150, 100, 75, 50]
+
+# Time stamps
+times = ['202204292100']
+
+# Input 35-km UAS obs (include {t} placeholder for time stamp)
+in_data = './uas_obs_35km/superob_uas/{t}.rap.fake.prepbufr.csv'
+
+# Output directory (include {n} placeholder for UAS spatial density)
+out_dir = './uas_obs_{n:d}km_thinned'
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+cat = us.load_catalog()
+
+for d in uas_density:
+    sites = uth.thin_sites(cat, d)
+    print(f"{d}-km network: {len(sites)} sites")
+
+    # Save the selected site locations
+    os.makedirs(f"{out_dir.format(n=d)}/superob_uas", exist_ok=True)
+    cat.sites(uth.base_spacing, sites).to_csv(f"{out_dir.format(n=d)}/uas_site_locs_{d}km.txt",
+                                              index=False)
+
+    for t in times:
+        df = bio.read_bufr(in_data.format(t=t), filters={'TYP': uth.uas_typ})
+        df_new = uth.thin_obs(df, cat, sites)
+
+        # Save new DataFrame as a CSV and in binary format
+        fname = f"{out_dir.format(n=d)}/superob_uas/{t}.rap.fake.prepbufr.csv"
+        bufr.df_to_csv(df_new, fname)
+        bio.write_bufr_npy(df_new, bio.npy_fname(fname))
+
+
+"""
+End thin_uas_ob_csvs.py
+"""
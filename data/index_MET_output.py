@@ -0,0 +1,33 @@
+"""
+Index MET Output Archives
+
+Alternative to untar_link_MET_output.sh. Rather than extracting each archive and linking the
+GridStat output, this script re-packs the GridStat files from each archive so that they can be read
+individually (see osse_utils/met_archive.py). Plotting scripts then read MET output directly from
+MET_output_zipped. Run from this directory.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import glob
+import os
+
+import osse_utils.met_archive as ma
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+for tar_fname in sorted(glob.glob(f"{ma.zipped_dir}/*.tar.gz")):
+    exp = os.path.basename(tar_fname)[:-len('.tar.gz')]
+    ma.build_index(exp)
+
+
+"""
+End index_MET_output.py
+"""
@@ -0,0 +1,38 @@
+"""
+Pack MET Output into One File per Experiment
+
+Converts all GridStat text output for each experiment into a single netCDF file in
+MET_output_packed (see osse_utils/met_pack.py). Experiments are read from MET_output_unzipped if
+they have been extracted and from the archives in MET_output_zipped otherwise. Plotting scripts read
+from the packs when the GridStat text files are not on disk. Run from this directory.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import glob
+import os
+
+import osse_utils.met_archive as ma
+import osse_utils.met_pack as mp
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+exps = set(os.path.basename(f)[:-len('.tar.gz')] for f in glob.glob(f"{ma.zipped_dir}/*.tar.gz"))
+if os.path.isdir(ma.unzipped_dir):
+    exps = exps | set(d for d in os.listdir(ma.unzipped_dir)
+                      if os.path.isdir(os.path.join(ma.unzipped_dir, d)))
+
+for exp in sorted(exps):
+    mp.pack_experiment(exp)
+
+
+"""
+End pack_MET_output.py
+"""
@@ -0,0 +1,495 @@
+"""
+Make All Figures
+
+Runs each figure script as its own process, building independent figures in parallel. Figures are
+only rebuilt if the script, any of its inputs, or the shared code (osse_utils and the submodules)
+have changed since the last successful build, or if any of its outputs are missing (use --force to
+rebuild everything). Output from each script is saved to logs/{task}.log and timing
+information is saved to logs/build_summary.json.
+
+Must have the proper Python environment (from python-environment.yml) loaded first. Run from the
+root directory of this repo:
+
+    python make_all_plots.py                # build all out-of-date figures
+    python make_all_plots.py -j 4           # use at most 4 concurrent scripts
+    python make_all_plots.py --force RMSEvsUAS
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+import datetime as dt
+import concurrent.futures as cf
+
+
+#---------------------------------------------------------------------------------------------------
+# Input Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Root directory of this repo
+root = os.path.dirname(os.path.abspath(__file__))
+
+# Common inputs
+yml = 'plot_code/verif_sim_info.yml'
+met = 'data/MET_output_unzipped'
+uas_obs = 'data/UAS_obs'
+uas_sites = 'data/UAS_sites'
+work2 = '/work2/noaa/wrfruc/murdzek/RRFS_OSSE'
+diag_dir = f"{work2}/real_data_app_orion/winter/rrfs.20220201/NCO_dirs/ptmp/prod/rrfs.20220201/12"
+gridstat_dir = f"{work2}/metplus_verif_grid_NR/{{app}}/{{season}}/upper_air/output/GridStat"
+
+# Directory for log files
+log_dir = 'logs'
+
+# Shared code imported by the figure scripts. Changes to any of these rebuild every task
+code_dirs = ['osse_utils']
+submodules = ['pyDA_utils', 'metplus_OSSE_scripts']
+
+# Tasks. Each task is a script that is run from the directory it lives in. Inputs are files or
+# directories (relative to root or absolute) that the script reads. Outputs are files (relative to
+# root) that the script creates; a task is rebuilt if any of them are missing. Deps are other tasks
+# that must finish successfully before the task is run.
+tasks = {'DA_obs_error':
+            {'script': 'plot_code/DA_obs_error.py',
+             'inputs': ['data/errtable.rrfs'],
+             'outputs': ['figs/DAerrUAS.pdf']},
+         'diag_ob_locs':
+            {'script': 'plot_code/diag_ob_locs.py',
+             'inputs': [f"{diag_dir}/diag_conv_t_ges.2022020112.nc4",
+                        f"{diag_dir}/rrfs.t12z.natlev.f000.conus_3km.grib2"],
+             'outputs': ['figs/TOBdist.pdf']},
+         'full_troposphere_verif_vprof':
+            {'script': 'plot_code/full_troposphere_verif_vprof.py',
+             'inputs': [yml, met],
+             'outputs': ['figs/FullTropRMSE.pdf']},
+         'lower_troposphere_rmse_vs_uas_number':
+            {'script': 'plot_code/lower_troposphere_rmse_vs_uas_number.py',
+             'inputs': [yml, met],
+             'outputs': ['figs/RMSEvsUAS.pdf']},
+         'lower_troposphere_verif_vprofs_3rows':
+            {'script': 'plot_code/lower_troposphere_verif_vprofs_3rows.py',
+             'inputs': [yml, met],
+             'outputs': [f"figs/Vprof3row{stat}{fhr}.pdf" for stat in ['RMSE', 'Bias']
+                         for fhr in [0, 6]]},
+         'lower_troposphere_verif_vprofs_no_aircft':
+            {'script': 'plot_code/lower_troposphere_verif_vprofs_no_aircft.py',
+             'inputs': [yml, met],
+             'outputs': ['figs/VprofNoAircft.pdf']},
+         'lower_troposphere_verif_vprofs_test_errors':
+            {'script': 'plot_code/lower_troposphere_verif_vprofs_test_errors.py',
+             'inputs': [yml, met],
+             'outputs': ['figs/VprofUASErrTest.pdf']},
+         'plot_raw_superob_uas_vprofs':
+            {'script': 'plot_code/plot_raw_superob_uas_vprofs.py',
+             'inputs': [uas_obs],
+             'outputs': ['figs/UASRawVsSuperob.pdf']},
+         'plot_uas_aircft_omb':
+            {'script': 'plot_code/plot_uas_aircft_omb.py',
+             'inputs': ['data/OMB'],
+             'outputs': ['figs/ombUASaircft.pdf']},
+         'plot_uas_number_vs_pressure':
+            {'script': 'plot_code/plot_uas_number_vs_pressure.py',
+             'inputs': [uas_obs],
+             'outputs': ['figs/UASnumberVSprs.pdf']},
+         'plot_uas_sites':
+            {'script': 'plot_code/plot_uas_sites.py',
+             'inputs': [uas_sites],
+             'outputs': ['figs/SiteLocs.pdf']},
+         'postage_stamp_ceil_qv':
+            {'script': 'plot_code/postage_stamp_ceil_qv.py',
+             'inputs': ['data/GRIB2_output', uas_sites],
+             'outputs': ['figs/Ceil22Fcst.png', 'figs/SPFH22P900Fcst.png']},
+         'severe_wx_parameter_dieoff_pct':
+            {'script': 'plot_code/severe_wx_parameter_dieoff_pct.py',
+             'inputs': [yml, met],
+             'outputs': ['figs/SevereWxDieoffPct.pdf']},
+         'RRFS_ctrl_pct_diffs':
+            {'script': 'other_code/RRFS_ctrl_pct_diffs.py',
+             'inputs': [gridstat_dir.format(app=a, season=s) for s in ['spring', 'winter']
+                        for a in [f"app_orion/{s}_2iter", 'rrfs-workflow_orion']],
+             'outputs': [f"{log_dir}/RRFS_ctrl_pct_diffs.log"]}}
+
+# File containing input fingerprints from the last successful build of each task
+state_fname = '.make_all_plots_state.json'
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def default_workers():
+    """
+    Number of concurrent scripts to run. Use the Slurm allocation if available
+    """
+
+    for var in ['SLURM_CPUS_ON_NODE', 'SLURM_CPUS_PER_TASK']:
+        if var in os.environ:
+            try:
+                return max(int(os.environ[var]), 1)
+            except ValueError:
+                pass
+    return os.cpu_count() or 1
+
+
+def profiling_enabled():
+    """
+    Check whether figure scripts should be run with instrumentation (see osse_utils/profiling.py)
+    """
+
+    return os.environ.get('OSSE_PROFILE', '') not in ['', '0']
+
+
+def fingerprint_path(path, hsh):
+    """
+    Add the names, sizes, and modification times of all files in a path to a hash
+
+    Hidden files (e.g., caches written by the figure scripts themselves) are skipped. Missing paths
+    are included in the hash as missing so that creating them later triggers a rebuild.
+
+    Parameters
+    ----------
+    path : string
+        File or directory
+    hsh : hashlib hash object
+        Hash to update
+
+    Returns
+    -------
+    None
+
+    """
+
+    if os.path.isfile(path):
+        s = os.stat(path)
+        hsh.update(f"{path}|{s.st_size}|{s.st_mtime_ns}\n".encode())
+    elif os.path.isdir(path):
+        for dirpath, dirnames, fnames in os.walk(path, followlinks=True):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for f in sorted(fnames):
+                if f.startswith('.'):
+                    continue
+                full = os.path.join(dirpath, f)
+                try:
+                    s = os.stat(full)
+                except FileNotFoundError:
+                    # Broken symlink
+                    hsh.update(f"{full}|broken\n".encode())
+                    continue
+                hsh.update(f"{full}|{s.st_size}|{s.st_mtime_ns}\n".encode())
+    else:
+        hsh.update(f"{path}|missing\n".encode())
+
+
+def fingerprint_code():
+    """
+    Compute a fingerprint for the shared code used by all figure scripts
+
+    Includes the names, sizes, and modification times of the Python files in code_dirs, as well as
+    the checked-out commit and any uncommitted changes of each submodule.
+
+    Returns
+    -------
+    string
+        Hex digest
+
+    """
+
+    hsh = hashlib.sha1()
+    for d in code_dirs:
+        for dirpath, dirnames, fnames in os.walk(d):
+            dirnames[:] = sorted(x for x in dirnames if not x.startswith(('.', '__pycache__')))
+            for f in sorted(fnames):
+                if f.endswith('.py'):
+                    fingerprint_path(os.path.join(dirpath, f), hsh)
+    for m in submodules:
+        for cmd in [['rev-parse', 'HEAD'], ['diff', 'HEAD']]:
+            # Uninitialized submodules have no .git, and git would use this repo instead
+            out = b'missing'
+            if os.path.exists(os.path.join(m, '.git')):
+                try:
+                    out = subprocess.run(['git', '-C', m] + cmd, capture_output=True).stdout
+                except OSError:
+                    pass
+            hsh.update(f"{m}|{' '.join(cmd)}|".encode() + out + b'\n')
+    return hsh.hexdigest()
+
+
+def outputs_exist(name):
+    """
+    Check whether all outputs of a task exist
+    """
+
+    return all(os.path.isfile(f) for f in tasks[name].get('outputs', []))
+
+
+def fingerprint_task(name, dep_prints, code_print=''):
+    """
+    Compute a fingerprint for a task from its script, inputs, dependencies, and the shared code
+
+    Parameters
+    ----------
+    name : string
+        Task name
+    dep_prints : dictionary
+        Fingerprints of tasks that have already been computed
+    code_print : string, optional
+        Fingerprint of the shared code (from fingerprint_code)
+
+    Returns
+    -------
+    string
+        Hex digest
+
+    """
+
+    hsh = hashlib.sha1()
+    hsh.update(f"code|{code_print}\n".encode())
+    fingerprint_path(tasks[name]['script'], hsh)
+    for path in tasks[name]['inputs']:
+        fingerprint_path(path, hsh)
+    for d in tasks[name].get('deps', []):
+        hsh.update(f"{d}|{dep_prints[d]}\n".encode())
+    return hsh.hexdigest()
+
+
+def sort_tasks(names):
+    """
+    Sort tasks so that every task comes after its dependencies
+
+    Parameters
+    ----------
+    names : list of strings
+        Task names
+
+    Returns
+    -------
+    list of strings
+        Sorted task names
+
+    """
+
+    ordered = []
+    visiting = set()
+
+    def visit(n):
+        if n in ordered:
+            return
+        if n in visiting:
+            raise ValueError(f"dependency cycle involving {n}")
+        visiting.add(n)
+        for d in tasks[n].get('deps', []):
+            visit(d)
+        visiting.remove(n)
+        ordered.append(n)
+
+    for n in names:
+        visit(n)
+    return ordered
+
+
+def run_task(name, env):
+    """
+    Run a single figure script, saving its output to a log file
+
+    Parameters
+    ----------
+    name : string
+        Task name
+    env : dictionary
+        Environment variables for the script
+
+    Returns
+    -------
+    tuple
+        Return code and elapsed time (s)
+
+    """
+
+    script = os.path.join(root, tasks[name]['script'])
+    log_fname = os.path.join(root, log_dir, f"{name}.log")
+    cmd = [sys.executable, '-u', os.path.basename(script)]
+    if profiling_enabled():
+        cmd = [sys.executable, '-u', '-m', 'osse_utils.profiling', os.path.basename(script)]
+    start = time.time()
+    with open(log_fname, 'w') as log:
+        log.write(f"Running {tasks[name]['script']} ({dt.datetime.now().strftime('%Y%m%d %H:%M:%S')})\n\n")
+        log.flush()
+        proc = subprocess.run(cmd,
+                              cwd=os.path.dirname(script), env=env,
+                              stdout=log, stderr=subprocess.STDOUT)
+    return proc.returncode, time.time() - start
+
+
+def build(names, nworkers=1, force=False, dry_run=False):
+    """
+    Build figures, running independent scripts concurrently
+
+    Parameters
+    ----------
+    names : list of strings
+        Tasks to build. Dependencies are added automatically
+    nworkers : integer, optional
+        Maximum number of scripts to run at the same time
+    force : boolean, optional
+        Option to rebuild tasks even if they are up to date
+    dry_run : boolean, optional
+        Option to only print which tasks would be run
+
+    Returns
+    -------
+    dictionary
+        Status and elapsed time for each task
+
+    """
+
+    os.chdir(root)
+    names = sort_tasks(names)
+
+    # Determine which tasks are out of date
+    try:
+        with open(state_fname, 'r') as fptr:
+            state = json.load(fptr)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+    code_print = fingerprint_code()
+    prints = {}
+    stale = set()
+    for n in names:
+        prints[n] = fingerprint_task(n, prints, code_print=code_print)
+        if (force or (state.get(n, None) != prints[n]) or (not outputs_exist(n)) or
+            any(d in stale for d in tasks[n].get('deps', []))):
+            stale.add(n)
+
+    summary = {n: {'status': 'up to date', 'time': 0.} for n in names if n not in stale}
+    for n in names:
+        if n in stale:
+            print(f"{n}: {'would run' if dry_run else 'queued'}")
+        else:
+            print(f"{n}: up to date")
+    if dry_run or (len(stale) == 0):
+        return summary
+
+    # Environment for the figure scripts. Limit threading within each script b/c many scripts run
+    # at the same time
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join([p for p in [env.get('PYTHONPATH', ''), root] if p])
+    env.setdefault('MPLBACKEND', 'Agg')
+    if profiling_enabled() and (env['OSSE_PROFILE'] != '1'):
+        # Scripts run from their own directories, so the report directory must be absolute
+        env['OSSE_PROFILE'] = os.path.abspath(env['OSSE_PROFILE'])
+    if nworkers > 1:
+        for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+            env.setdefault(var, '1')
+
+    # Run tasks as their dependencies finish
+    os.makedirs(log_dir, exist_ok=True)
+    pending = [n for n in names if n in stale]
+    running = {}
+    done = set(n for n in names if n not in stale)
+    with cf.ThreadPoolExecutor(max_workers=nworkers) as pool:
+        while (len(pending) > 0) or (len(running) > 0):
+            for n in list(pending):
+                deps = tasks[n].get('deps', [])
+                if any(summary.get(d, {}).get('status', '') in ['failed', 'skipped'] for d in deps):
+                    pending.remove(n)
+                    summary[n] = {'status': 'skipped', 'time': 0.}
+                    print(f"{n}: skipped (dependency failed)")
+                elif all(d in done for d in deps):
+                    pending.remove(n)
+                    print(f"{n}: started")
+                    running[pool.submit(run_task, n, env)] = n
+            if len(running) == 0:
+                continue
+            finished, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for fut in finished:
+                n = running.pop(fut)
+                code, elapsed = fut.result()
+                if code == 0:
+                    done.add(n)
+                    state[n] = prints[n]
+                    summary[n] = {'status': 'ok', 'time': elapsed}
+                    print(f"{n}: finished in {elapsed:.1f} s")
+                else:
+                    state.pop(n, None)
+                    summary[n] = {'status': 'failed', 'time': elapsed}
+                    print(f"{n}: FAILED after {elapsed:.1f} s (see {log_dir}/{n}.log)")
+
+                # Save state after each task so that progress is retained if the build is killed
+                with open(state_fname, 'w') as fptr:
+                    json.dump(state, fptr, indent=2)
+
+    with open(os.path.join(log_dir, 'build_summary.json'), 'w') as fptr:
+        json.dump(summary, fptr, indent=2)
+
+    return summary
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Make all figures for the UAS spatial density paper')
+    parser.add_argument('tasks', nargs='*', default=list(tasks.keys()),
+                        help='Tasks to run (default: all). Options: ' + ', '.join(tasks.keys()))
+    parser.add_argument('-j', '--jobs', type=int, default=default_workers(),
+                        help='Maximum number of scripts to run at once')
+    parser.add_argument('-f', '--force', action='store_true', help='Rebuild up-to-date figures')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='Only list tasks that would run')
+    args = parser.parse_args()
+
+    for t in args.tasks:
+        if t not in tasks:
+            parser.error(f"unknown task {t}")
+
+    # Profiles are only written by scripts that run, so rebuild everything when profiling
+    force = args.force
+    if profiling_enabled() and not force:
+        print('OSSE_PROFILE is set, so all requested figures are rebuilt')
+        force = True
+
+    start = time.time()
+    summary = build(args.tasks, nworkers=args.jobs, force=force, dry_run=args.dry_run)
+
+    if not args.dry_run:
+        print()
+        print(f"{'task':45s} {'status':>12s} {'time (s)':>10s}")
+        for n in summary:
+            print(f"{n:45s} {summary[n]['status']:>12s} {summary[n]['time']:10.1f}")
+        print(f"\nTotal elapsed time = {time.time() - start:.1f} s")
+
+        if profiling_enabled():
+            import osse_utils.profiling as prof
+            # Only use reports from scripts that ran in this build
+            ran = [os.path.splitext(os.path.basename(tasks[n]['script']))[0] for n in summary
+                   if summary[n]['status'] in ['ok', 'failed']]
+            prof_summary = prof.combine_reports(scripts=ran, since=start)
+            cats = ['read', 'subset', 'stats', 'plot', 'cartopy', 'savefig', 'other']
+            print()
+            print(f"{'script':45s} {'time (s)':>10s} " + ' '.join(f"{c:>8s}" for c in cats) +
+                  f" {'peak MB':>8s}")
+            for n in prof_summary:
+                s = prof_summary[n]
+                print(f"{n:45s} {s['time']:10.1f} " +
+                      ' '.join(f"{s['categories'].get(c, 0):8.1f}" for c in cats) +
+                      f" {s['peak_rss'] / 1e6:8.0f}")
+            print(f"Profiles saved to {prof.report_dir()}")
+
+        if any(summary[n]['status'] == 'failed' for n in summary):
+            sys.exit(1)
+
+
+"""
+End make_all_plots.py
+"""
@@ -0,0 +1,5 @@
+"""
+Shared helper modules for the UAS OSSE spatial density paper analysis code
+
+shawn.s.murdzek@noaa.gov
+"""
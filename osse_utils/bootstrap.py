@@ -0,0 +1,228 @@
+"""
+Fast Bootstrap Confidence Intervals for Percent Differences
+
+metplus_tools.confidence_interval_bootstrap_pct_diff calls a Python function once per resample,
+which is too slow for 10000 resamples at every level, lead time, and experiment. Here, all resample
+indices are drawn at once as an integer matrix and the percent differences are computed for every
+resample using array reductions. Moving-block resampling is available to account for
+autocorrelation in the hourly verification time series.
+
+Example (paired, 3-hr blocks, time x level arrays):
+
+    import osse_utils.bootstrap as bs
+    ci = bs.bootstrap_ci(uas_rmse, ctrl_rmse, fct='pct_diff_1', block_length=3, seed=42)
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import concurrent.futures as cf
+
+
+#---------------------------------------------------------------------------------------------------
+# Statistics
+#---------------------------------------------------------------------------------------------------
+
+def pct_diff_1(exp, ctrl, axis=-1):
+    """
+    Percent difference of the means: 100 * (mean(exp) - mean(ctrl)) / mean(ctrl)
+    """
+
+    ctrl_mean = np.mean(ctrl, axis=axis)
+    return 1e2 * (np.mean(exp, axis=axis) - ctrl_mean) / ctrl_mean
+
+
+def pct_diff_2(exp, ctrl, axis=-1):
+    """
+    Mean of the percent differences: 100 * mean((exp - ctrl) / ctrl)
+    """
+
+    return 1e2 * np.mean((exp - ctrl) / ctrl, axis=axis)
+
+
+def mean_diff(exp, ctrl, axis=-1):
+    """
+    Mean difference: mean(exp - ctrl)
+    """
+
+    return np.mean(exp - ctrl, axis=axis)
+
+
+stat_fcts = {'pct_diff_1': pct_diff_1,
+             'pct_diff_2': pct_diff_2,
+             'mean_diff': mean_diff}
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def resample_indices(n, n_resamples, block_length=1, rng=None):
+    """
+    Draw bootstrap resample indices
+
+    Parameters
+    ----------
+    n : integer
+        Number of samples in the time series
+    n_resamples : integer
+        Number of bootstrap resamples
+    block_length : integer, optional
+        Block length for the moving-block bootstrap. A block length of 1 is the standard bootstrap
+    rng : np.random.Generator, optional
+        Random number generator. A new, unseeded generator is created if not provided
+
+    Returns
+    -------
+    np.array
+        Resample indices with shape (n_resamples, n)
+
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+    if (block_length < 1) or (block_length > n):
+        raise ValueError(f"block_length must be between 1 and {n}")
+
+    if block_length == 1:
+        return rng.integers(0, n, size=(n_resamples, n))
+
+    nblocks = -(-n // block_length)
+    starts = rng.integers(0, n - block_length + 1, size=(n_resamples, nblocks))
+    idx = starts[:, :, np.newaxis] + np.arange(block_length)
+    return idx.reshape(n_resamples, nblocks * block_length)[:, :n]
+
+
+def _bootstrap_chunk(exp, ctrl, fct, n_resamples, block_length, paired, seed):
+    """
+    Compute the bootstrap statistic for one chunk of resamples
+
+    Parameters
+    ----------
+    exp, ctrl : np.array
+        Experiment and control time series, with time as the first axis
+    fct : string or function
+        Statistic (see bootstrap_ci)
+    n_resamples : integer
+        Number of resamples in this chunk
+    block_length : integer
+        Moving-block length
+    paired : boolean
+        Option to use the same resample indices for exp and ctrl
+    seed : np.random.SeedSequence
+        Seed for this chunk
+
+    Returns
+    -------
+    np.array
+        Statistic for each resample. First axis is the resample
+
+    """
+
+    if isinstance(fct, str):
+        fct = stat_fcts[fct]
+    rng = np.random.default_rng(seed)
+    idx_exp = resample_indices(exp.shape[0], n_resamples, block_length=block_length, rng=rng)
+    if paired:
+        idx_ctrl = idx_exp
+    else:
+        idx_ctrl = resample_indices(ctrl.shape[0], n_resamples, block_length=block_length, rng=rng)
+
+    # Indexing with a 2D array gives shape (resample, time, ...). Reduce over time
+    return fct(exp[idx_exp], ctrl[idx_ctrl], axis=1)
+
+
+def bootstrap_distribution(exp, ctrl, fct='pct_diff_1', n_resamples=10000, block_length=1,
+                           paired=True, seed=None, chunk_size=1000, nworkers=1):
+    """
+    Compute the bootstrap distribution of a statistic comparing two time series
+
+    Parameters
+    ----------
+    exp : np.array
+        Experiment time series. Time is the first axis. Additional axes (e.g., pressure level) are
+        handled simultaneously
+    ctrl : np.array
+        Control time series. Same shape as exp if paired = True
+    fct : string or function, optional
+        Statistic. Either the name of a function in stat_fcts or a function with the signature
+        fct(exp, ctrl, axis) that reduces over the given axis
+    n_resamples : integer, optional
+        Number of bootstrap resamples
+    block_length : integer, optional
+        Block length for the moving-block bootstrap (1 = standard bootstrap)
+    paired : boolean, optional
+        Option to resample exp and ctrl together
+    seed : integer, optional
+        Seed for the random number generator. The output for a given seed does not depend on
+        chunk_size or nworkers
+    chunk_size : integer, optional
+        Number of resamples evaluated at once. Limits memory usage
+    nworkers : integer, optional
+        Number of processes used to evaluate chunks. fct must be picklable if nworkers > 1
+
+    Returns
+    -------
+    np.array
+        Statistic for each resample. First axis is the resample
+
+    """
+
+    exp = np.asarray(exp, dtype=float)
+    ctrl = np.asarray(ctrl, dtype=float)
+    if paired and (exp.shape != ctrl.shape):
+        raise ValueError('exp and ctrl must have the same shape for a paired bootstrap')
+
+    # Each chunk of resamples gets its own seed so results are reproducible regardless of how
+    # chunks are distributed
+    sizes = [chunk_size] * (n_resamples // chunk_size)
+    if n_resamples % chunk_size > 0:
+        sizes.append(n_resamples % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(exp, ctrl, fct, s, block_length, paired, sd) for s, sd in zip(sizes, seeds)]
+
+    if nworkers > 1:
+        with cf.ProcessPoolExecutor(max_workers=nworkers) as pool:
+            out = list(pool.map(_bootstrap_chunk, *zip(*args)))
+    else:
+        out = [_bootstrap_chunk(*a) for a in args]
+
+    return np.concatenate(out, axis=0)
+
+
+def bootstrap_ci(exp, ctrl, level=0.95, fct='pct_diff_1', n_resamples=10000, block_length=1,
+                 paired=True, seed=None, chunk_size=1000, nworkers=1):
+    """
+    Compute percentile bootstrap confidence intervals for a statistic comparing two time series
+
+    Parameters
+    ----------
+    exp, ctrl : np.array
+        Experiment and control time series (see bootstrap_distribution)
+    level : float, optional
+        Confidence level
+    Other parameters : see bootstrap_distribution
+
+    Returns
+    -------
+    np.array
+        Lower and upper bounds of the confidence interval. Shape is the same as exp with the time
+        axis removed and a new last axis of length 2
+
+    """
+
+    dist = bootstrap_distribution(exp, ctrl, fct=fct, n_resamples=n_resamples,
+                                  block_length=block_length, paired=paired, seed=seed,
+                                  chunk_size=chunk_size, nworkers=nworkers)
+    ci = np.nanpercentile(dist, [50 * (1 - level), 50 * (1 + level)], axis=0)
+
+    return np.moveaxis(ci, 0, -1)
+
+
+"""
+End bootstrap.py
+"""
@@ -0,0 +1,320 @@
+"""
+Fast Readers for Prepbufr CSV Files
+
+pyDA_utils.bufr.bufrCSV always reads every column of a prepbufr CSV and lets pandas guess the
+dtypes, which is slow and memory-hungry for the dense UAS networks. read_bufr_csv only parses the
+requested columns, uses fixed dtypes, and applies row filters chunk by chunk so that rows that are
+not needed are never kept in memory. As in bufrCSV, whitespace is stripped from column names (e.g.,
+' nmsg' becomes 'nmsg') and the prepbufr missing value (1e11) is replaced by NaN before filtering.
+
+Prepbufr CSVs can also be converted to a binary format: a NumPy structured array (.npy) with one
+field per CSV column, using the same dtypes as read_bufr_csv. These files can be memory-mapped, so
+only the requested columns are read from disk. read_bufr uses the binary file when it is present
+and up to date and falls back to the CSV otherwise.
+
+Example:
+
+    import osse_utils.bufr_io as bio
+    df = bio.read_bufr_csv(fname, columns=['POB'], filters={'TYP': 136})
+    bio.convert_tree('../data/UAS_obs')   # write .npy files next to every prepbufr CSV
+    df = bio.read_bufr(fname, columns=['POB'], filters={'TYP': 136})
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import numpy as np
+import pandas as pd
+
+from osse_utils.filters import filter_mask
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# String columns
+str_cols = ['SID', 'PRVSTG', 'SPRVSTG']
+
+# Integer columns (these are never missing)
+int_cols = ['nmsg', 'subset', 'ntb', 'TYP']
+
+# Float columns
+float_cols = ['cycletime', 'XOB', 'YOB', 'DHR', 'ELV', 'SAID', 'T29', 'POB', 'QOB', 'TOB', 'ZOB',
+              'UOB', 'VOB', 'PWO', 'MXGS', 'HOVI', 'CEILING', 'MXTM', 'MNTM', 'TOCC', 'PMO', 'XDR',
+              'YDR', 'HRDR', 'PQM', 'QQM', 'TQM', 'ZQM', 'WQM', 'PWQ', 'PMQ', 'POE', 'QOE', 'TOE',
+              'WOE', 'PWE', 'TDO', 'RHOB', 'WSPD', 'WDIR']
+
+# Missing value in prepbufr CSVs
+bufr_missing = 1e11
+
+# dtypes used when parsing known columns. Columns not listed here are inferred by pandas. Integer 
+# columns are parsed as floats (some files write them as, e.g., 136.0) and converted afterwards
+bufr_dtypes = {}
+for c in str_cols:
+    bufr_dtypes[c] = str
+for c in int_cols + float_cols:
+    bufr_dtypes[c] = np.float64
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def read_bufr_csv(fname, columns=None, filters={}, chunksize=250000):
+    """
+    Read a prepbufr CSV file, parsing only the requested columns and rows
+
+    Parameters
+    ----------
+    fname : string
+        Prepbufr CSV file name
+    columns : list of strings, optional
+        Columns to return. Set to None to return all columns
+    filters : dictionary, optional
+        Row filters (see osse_utils.filters), e.g., {'TYP': 136, 'SID': {"'UA000038'"}}. Filter
+        columns do not need to be in columns
+    chunksize : integer, optional
+        Number of rows parsed at once when filtering
+
+    Returns
+    -------
+    pd.DataFrame
+        Observations
+
+    """
+
+    # Column names in the file can have leading or trailing whitespace (e.g., ' nmsg'). Unnamed
+    # columns come from the trailing comma at the end of each line and are dropped (as in
+    # bufr.bufrCSV)
+    header = pd.read_csv(fname, nrows=0).columns
+    names = {c.strip(): c for c in header if not c.startswith('Unnamed')}
+    if columns is None:
+        wanted = list(names.keys())
+    else:
+        wanted = list(columns) + [c for c in filters if c not in columns]
+    missing_cols = [c for c in wanted if c not in names]
+    if len(missing_cols) > 0:
+        raise ValueError(f"columns {missing_cols} are not in {fname}")
+    usecols = [names[c] for c in wanted]
+    dtypes = {names[c]: bufr_dtypes[c] for c in wanted if c in bufr_dtypes}
+
+    if len(filters) == 0:
+        df = _clean(pd.read_csv(fname, usecols=usecols, dtype=dtypes))
+    else:
+        pieces = []
+        for chunk in pd.read_csv(fname, usecols=usecols, dtype=dtypes, chunksize=chunksize):
+            chunk = _clean(chunk)
+            pieces.append(chunk.loc[filter_mask(chunk, filters)])
+        df = pd.concat(pieces, ignore_index=True)
+
+    for c in int_cols:
+        if c in df.columns:
+            df[c] = df[c].astype(np.int64)
+
+    # Return columns in the requested order
+    if columns is not None:
+        df = df[list(columns)]
+
+    return df
+
+
+def _clean(df):
+    """
+    Strip whitespace from column names and replace prepbufr missing values with NaN
+    """
+
+    df = df.rename(columns=lambda c: c.strip())
+    for c in df.columns:
+        if pd.api.types.is_numeric_dtype(df[c]):
+            if c not in int_cols:
+                df[c] = df[c].where(df[c].values != bufr_missing)
+        else:
+            vals = pd.to_numeric(df[c], errors='coerce')
+            df[c] = df[c].where(vals.values != bufr_missing)
+
+    return df
+
+
+def npy_fname(csv_fname):
+    """
+    Binary file name corresponding to a prepbufr CSV file name
+    """
+
+    base, ext = os.path.splitext(csv_fname)
+    if ext == '.csv':
+        return f"{base}.npy"
+    return f"{csv_fname}.npy"
+
+
+def write_bufr_npy(df, fname):
+    """
+    Save prepbufr observations to a binary (.npy) file
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Prepbufr observations (e.g., output from read_bufr_csv or bufr.bufrCSV)
+    fname : string
+        Output file name
+
+    Returns
+    -------
+    None
+
+    """
+
+    df = _clean(df)
+    fields = []
+    for c in df.columns:
+        if c in str_cols or not pd.api.types.is_numeric_dtype(df[c]):
+            vals = df[c].fillna('').astype(str).values
+            nchar = max(1, max([len(v) for v in vals], default=1))
+            fields.append((c, f"U{nchar}"))
+        elif c in int_cols:
+            fields.append((c, np.int64))
+        else:
+            fields.append((c, np.float64))
+
+    arr = np.empty(len(df), dtype=fields)
+    for c, _ in fields:
+        if arr.dtype[c].kind == 'U':
+            arr[c] = df[c].fillna('').astype(str).values
+        else:
+            arr[c] = df[c].values
+
+    # Write to a temporary file first so readers never see a partial file
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    with open(tmp_fname, 'wb') as fptr:
+        np.save(fptr, arr)
+    os.replace(tmp_fname, fname)
+
+
+def _npy_field(arr, names, col, mask=None):
+    """
+    Read one column from a binary prepbufr array, replacing missing values with NaN
+    """
+
+    vals = arr[names[col]] if mask is None else arr[names[col]][mask]
+    if vals.dtype.kind == 'U':
+        vals = vals.astype(object)
+        vals[(vals == '') | (vals == '100000000000.0')] = np.nan
+    else:
+        vals = np.array(vals)
+        if (vals.dtype.kind == 'f') and (col not in int_cols):
+            vals[vals == bufr_missing] = np.nan
+
+    return vals
+
+
+def read_bufr_npy(fname, columns=None, filters={}, mmap=True):
+    """
+    Read prepbufr observations from a binary (.npy) file
+
+    Parameters
+    ----------
+    fname : string
+        Binary file name
+    columns : list of strings, optional
+        Columns to return. Set to None to return all columns
+    filters : dictionary, optional
+        Row filters (see osse_utils.filters)
+    mmap : boolean, optional
+        Option to memory-map the file so that only the requested columns and rows are read
+
+    Returns
+    -------
+    pd.DataFrame
+        Observations
+
+    """
+
+    arr = np.load(fname, mmap_mode=('r' if mmap else None))
+
+    # Files written before column names were stripped can have names like ' nmsg'
+    names = {c.strip(): c for c in arr.dtype.names}
+    if columns is None:
+        columns = list(names.keys())
+
+    mask = filter_mask({c: _npy_field(arr, names, c) for c in filters}, filters)
+    out = {c: _npy_field(arr, names, c, mask=mask) for c in columns}
+
+    return pd.DataFrame(out, columns=columns)
+
+
+def read_bufr(fname, columns=None, filters={}):
+    """
+    Read a prepbufr CSV file, using the binary version of the file if it is available and newer
+    than the CSV
+
+    Parameters
+    ----------
+    fname : string
+        Prepbufr CSV file name
+    columns : list of strings, optional
+        Columns to return. Set to None to return all columns
+    filters : dictionary, optional
+        Row filters (see osse_utils.filters)
+
+    Returns
+    -------
+    pd.DataFrame
+        Observations
+
+    """
+
+    bin_fname = npy_fname(fname)
+    if os.path.isfile(bin_fname):
+        if (not os.path.isfile(fname)) or (os.path.getmtime(bin_fname) >= os.path.getmtime(fname)):
+            return read_bufr_npy(bin_fname, columns=columns, filters=filters)
+
+    return read_bufr_csv(fname, columns=columns, filters=filters)
+
+
+def convert_tree(top, pattern='.prepbufr.csv', overwrite=False, verbose=True):
+    """
+    Write binary versions of all prepbufr CSV files in a directory tree
+
+    Parameters
+    ----------
+    top : string
+        Top-level directory
+    pattern : string, optional
+        Suffix of the CSV files to convert
+    overwrite : boolean, optional
+        Option to rewrite binary files that are already up to date
+    verbose : boolean, optional
+        Option to print each file as it is converted
+
+    Returns
+    -------
+    list of strings
+        Binary files that were written
+
+    """
+
+    written = []
+    for dirpath, _, fnames in os.walk(top):
+        for f in sorted(fnames):
+            if not f.endswith(pattern):
+                continue
+            csv_fname = os.path.join(dirpath, f)
+            bin_fname = npy_fname(csv_fname)
+            if ((not overwrite) and os.path.isfile(bin_fname) and
+                (os.path.getmtime(bin_fname) >= os.path.getmtime(csv_fname))):
+                continue
+            if verbose:
+                print(f"converting {csv_fname}")
+            write_bufr_npy(read_bufr_csv(csv_fname), bin_fname)
+            written.append(bin_fname)
+
+    return written
+
+
+"""
+End bufr_io.py
+"""
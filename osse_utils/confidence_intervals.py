@@ -0,0 +1,147 @@
+"""
+Vectorized Confidence Intervals for the Mean
+
+metplus_tools.confidence_interval_mean computes one confidence interval at a time, so profiles with
+many experiments, pressure levels, and forecast leads spend most of their time in Python loops.
+The functions here compute the same t-distribution confidence intervals for an entire array of
+time series at once (e.g., time x level or experiment x time x level).
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import scipy.stats as ss
+
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def lag1_autocorr(data, axis=-2):
+    """
+    Compute the lag-1 autocorrelation of many time series at once
+
+    Equivalent to np.corrcoef(x[1:], x[:-1])[0, 1] for each time series x. Pairs that include a NaN
+    are excluded.
+
+    Parameters
+    ----------
+    data : np.array
+        Time series
+    axis : integer, optional
+        Time axis
+
+    Returns
+    -------
+    np.array
+        Lag-1 autocorrelation. Shape is the same as data, but with the time axis removed
+
+    """
+
+    data = np.moveaxis(np.asarray(data, dtype=float), axis, -1)
+    x = data[..., 1:]
+    y = data[..., :-1]
+    valid = np.isfinite(x) & np.isfinite(y)
+    n = valid.sum(axis=-1)
+    x = np.where(valid, x, 0)
+    y = np.where(valid, y, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        xm = x.sum(axis=-1) / n
+        ym = y.sum(axis=-1) / n
+        xa = np.where(valid, x - xm[..., np.newaxis], 0)
+        ya = np.where(valid, y - ym[..., np.newaxis], 0)
+        r = (xa * ya).sum(axis=-1) / np.sqrt((xa**2).sum(axis=-1) * (ya**2).sum(axis=-1))
+
+    return r
+
+
+def effective_sample_size(n, r1):
+    """
+    Effective sample size for a time series with lag-1 autocorrelation r1 (Wilks 2011, eqn 5.12)
+
+    Parameters
+    ----------
+    n : integer or np.array
+        Sample size
+    r1 : float or np.array
+        Lag-1 autocorrelation
+
+    Returns
+    -------
+    float or np.array
+        Effective sample size
+
+    """
+
+    return n * (1. - r1) / (1. + r1)
+
+
+def confidence_interval_mean_batch(data, level=0.95, option='t_dist', ci_kw={}, axis=-2):
+    """
+    Compute confidence intervals for the mean of many time series at once
+
+    Vectorized version of metplus_tools.confidence_interval_mean. The t-distribution options
+    (including acct_lag_corr) are computed in a single pass over the array. Other options fall back
+    to calling metplus_tools.confidence_interval_mean for each time series. In both cases, NaNs are
+    removed from each time series before computing the confidence interval, so the lag-1
+    autocorrelation pairs the valid values on either side of a gap.
+
+    Parameters
+    ----------
+    data : np.array
+        Time series. Typically 2D (time x level) or 3D (experiment x time x level)
+    level : float, optional
+        Confidence level
+    option : string, optional
+        Confidence interval method (see metplus_tools.confidence_interval_mean)
+    ci_kw : dictionary, optional
+        Other keyword arguments for the confidence interval method. Only 'acct_lag_corr' is
+        vectorized
+    axis : integer, optional
+        Time axis. Default is the second-to-last axis
+
+    Returns
+    -------
+    np.array
+        Lower and upper bounds of the confidence intervals. Shape is the same as data with the time
+        axis removed and a new last axis of length 2
+
+    """
+
+    data = np.moveaxis(np.asarray(data, dtype=float), axis, -1)
+
+    # Fall back to the scalar function for options that are not vectorized
+    if (option != 't_dist') or ci_kw.get('mats_ste', False):
+        ci = np.zeros(data.shape[:-1] + (2,))
+        for idx in np.ndindex(data.shape[:-1]):
+            x = data[idx]
+            ci[idx] = mt.confidence_interval_mean(x[np.isfinite(x)], level=level, option=option,
+                                                  ci_kw=ci_kw)
+        return ci
+
+    # Move the valid values of each time series to the front (keeping their order), which matches
+    # x[np.isfinite(x)] in the fallback. The trailing NaNs are ignored by lag1_autocorr
+    valid = np.isfinite(data)
+    data = np.take_along_axis(data, np.argsort(~valid, axis=-1, kind='stable'), axis=-1)
+
+    n = valid.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nanmean(data, axis=-1)
+        std = np.nanstd(data, axis=-1, ddof=1)
+        if ci_kw.get('acct_lag_corr', False):
+            n = effective_sample_size(n, lag1_autocorr(data, axis=-1))
+        half = ss.t.ppf(0.5 * (1. + level), n - 1) * std / np.sqrt(n)
+
+    return np.stack([mean - half, mean + half], axis=-1)
+
+
+"""
+End confidence_intervals.py
+"""
@@ -0,0 +1,63 @@
+"""
+Row Filters Shared by the Observation Readers
+
+Filters are dictionaries mapping a column name to a condition:
+    scalar          : column == value (e.g., {'TYP': 136})
+    list/set/array  : column is in the collection (e.g., {'Observation_Type': [130, 131, 133]})
+    2-element tuple : lower <= column <= upper (e.g., {'Pressure': (700, 1050)})
+    function        : function(column) returns a boolean array
+
+Filters built from scalars, collections, and tuples can be pickled, so they can be sent to worker
+processes.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def filter_mask(data, filters):
+    """
+    Compute a boolean mask of the rows that pass all filters
+
+    Parameters
+    ----------
+    data : pd.DataFrame or dictionary of np.arrays
+        Data to filter. Must contain every column in filters
+    filters : dictionary
+        Filters (see module docstring)
+
+    Returns
+    -------
+    np.array
+        Boolean mask. None if filters is empty
+
+    """
+
+    mask = None
+    for col, cond in filters.items():
+        vals = np.asarray(data[col])
+        if callable(cond):
+            m = np.asarray(cond(vals), dtype=bool)
+        elif isinstance(cond, tuple):
+            m = (vals >= cond[0]) & (vals <= cond[1])
+        elif isinstance(cond, (list, set, frozenset, np.ndarray)):
+            m = np.isin(vals, list(cond))
+        else:
+            m = (vals == cond)
+        mask = m if mask is None else (mask & m)
+
+    return mask
+
+
+"""
+End filters.py
+"""
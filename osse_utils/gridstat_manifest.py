@@ -0,0 +1,434 @@
+"""
+Manifest of GridStat Output Files
+
+Scripts find GridStat files either by globbing entire directories or by formatting hundreds of
+paths and letting read_ascii discover which ones are missing. Both approaches send thousands of
+metadata requests to the file system for every figure. A GridStatManifest scans a GridStat
+directory once and records (file_prefix, line_type, lead, valid time, file name, size, mtime) for
+every file in a table sorted by (file_prefix, line_type, lead, valid time), so queries like "all
+files for lead L within valid window W" are answered using a binary search.
+
+Manifests are saved in data/gridstat_manifests (set the OSSE_MANIFEST_DIR environment variable to
+use a different directory). A saved manifest is validated using the modification time of the
+directory itself, which changes whenever files are added, removed, or renamed, so validation costs
+one stat regardless of the number of files. If the directory has changed, its file names are listed
+(without statting any files) and the directory is only rescanned if the set of GridStat file names
+has changed, so writing hidden files (e.g., the read_ascii caches written by met_cache) into the
+directory does not trigger a rescan. Files that are rewritten in place are not detected; use
+get_manifest(dirname, rebuild=True) to rescan (and stat) every file. Directories that only exist
+within the MET output archives (see met_archive) are scanned using the archive index instead, and
+directories that are only in the packed MET output (see met_pack) are scanned using the pack index.
+
+Example:
+
+    import osse_utils.gridstat_manifest as gm
+    man = gm.get_manifest('../data/MET_output_unzipped/spring/severe_wx_env/output/GridStat')
+    fnames = man.files('grid_stat_FV3_vs_NR', 'sl1l2', 3)
+    fnames = man.lookup('grid_stat_FV3_vs_NR', 'sl1l2', 3, valid_times)
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import re
+import hashlib
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+
+import osse_utils.met_archive as ma
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Directory for saved manifests
+manifest_dir = os.environ.get('OSSE_MANIFEST_DIR',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                                           'gridstat_manifests'))
+
+# Manifest format version. Increment if the layout of the manifest changes
+manifest_version = 3
+
+# GridStat file names: {prefix}_{lead}0000L_{valid}V_{line_type}.txt or {prefix}_{lead}0000L_{valid}V.stat
+fname_re = re.compile(r'^(?P<prefix>.+)_(?P<lead>\d+)0000L_(?P<valid>\d{8}_\d{6})V(?:_(?P<line_type>[a-z0-9]+))?\.(?:txt|stat)$')
+
+# Manifests that have already been loaded, keyed by directory
+_manifests = {}
+
+# Locks for each directory, so that threads (e.g., VerificationStore prefetching) never scan the same
+# directory or write the same manifest at once
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+#---------------------------------------------------------------------------------------------------
+# Classes
+#---------------------------------------------------------------------------------------------------
+
+class GridStatManifest():
+    """
+    Sorted table of the GridStat output files in a directory
+
+    Parameters
+    ----------
+    dirname : string
+        GridStat output directory
+    table : pd.DataFrame
+        One row per file with columns file_prefix, line_type, lead, valid, fname, size, and mtime.
+        The line type of .stat files is 'stat'
+
+    """
+
+    def __init__(self, dirname, table):
+
+        self.dirname = dirname
+        self.table = table.sort_values(['file_prefix', 'line_type', 'lead', 'valid'],
+                                       ignore_index=True)
+
+        # Valid times (in seconds) are searched within the contiguous block of rows for each
+        # (file_prefix, line_type, lead)
+        self._valid = self.table['valid'].values.astype('datetime64[s]').astype(np.int64)
+        self._fnames = self.table['fname'].values
+        self._blocks = {}
+        keys = list(zip(self.table['file_prefix'], self.table['line_type'], self.table['lead']))
+        for i, k in enumerate(keys):
+            if k in self._blocks:
+                self._blocks[k][1] = i + 1
+            else:
+                self._blocks[k] = [i, i + 1]
+
+
+    def __len__(self):
+        return len(self.table)
+
+
+    def _block(self, file_prefix, line_type, lead):
+        return self._blocks.get((file_prefix, line_type, int(lead)), [0, 0])
+
+
+    def files(self, file_prefix, line_type, lead, valid_start=None, valid_end=None):
+        """
+        All files for a file prefix, line type, and lead time within a valid time window
+
+        Parameters
+        ----------
+        file_prefix : string
+            GridStat file prefix
+        line_type : string
+            MET line type (e.g., 'sl1l2')
+        lead : integer
+            Forecast lead time (hr)
+        valid_start, valid_end : dt.datetime, optional
+            First and last valid times (inclusive). Set to None for no limit
+
+        Returns
+        -------
+        list of strings
+            File names, sorted by valid time
+
+        """
+
+        start, stop = self._block(file_prefix, line_type, lead)
+        valid = self._valid[start:stop]
+        lo = 0 if valid_start is None else np.searchsorted(valid, _seconds(valid_start), 'left')
+        hi = len(valid) if valid_end is None else np.searchsorted(valid, _seconds(valid_end), 'right')
+
+        return [os.path.join(self.dirname, f) for f in self._fnames[(start + lo):(start + hi)]]
+
+
+    def lookup(self, file_prefix, line_type, lead, valid_times, verbose=False):
+        """
+        Files for a list of valid times. Valid times without a file are skipped
+
+        Parameters
+        ----------
+        file_prefix : string
+            GridStat file prefix
+        line_type : string
+            MET line type (e.g., 'sl1l2')
+        lead : integer
+            Forecast lead time (hr)
+        valid_times : list of dt.datetime
+            Valid times
+        verbose : boolean, optional
+            Option to print valid times that do not have a file
+
+        Returns
+        -------
+        list of strings
+            File names, in the same order as valid_times
+
+        """
+
+        start, stop = self._block(file_prefix, line_type, lead)
+        valid = self._valid[start:stop]
+        if len(valid_times) == 0:
+            return []
+        target = np.array([_seconds(t) for t in valid_times], dtype=np.int64)
+        idx = np.minimum(np.searchsorted(valid, target), max(len(valid) - 1, 0))
+        found = (valid[idx] == target) if len(valid) > 0 else np.zeros(len(target), dtype=bool)
+
+        if verbose:
+            for t in np.array(valid_times, dtype=object)[~found]:
+                print(f"no {file_prefix} {line_type} file for lead = {lead} and valid = {t}")
+
+        return [os.path.join(self.dirname, self._fnames[start + i]) for i in idx[found]]
+
+
+    def valid_times(self, file_prefix, line_type, lead):
+        """
+        Valid times available for a file prefix, line type, and lead time
+
+        Returns
+        -------
+        pd.DatetimeIndex
+            Valid times
+
+        """
+
+        start, stop = self._block(file_prefix, line_type, lead)
+        return pd.DatetimeIndex(self.table['valid'].values[start:stop])
+
+
+    def leads(self, file_prefix, line_type):
+        """
+        Lead times (hr) available for a file prefix and line type
+        """
+
+        return sorted([k[2] for k in self._blocks if (k[0] == file_prefix) and (k[1] == line_type)])
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def _seconds(t):
+    """
+    Convert a datetime to seconds since 1970-01-01
+    """
+
+    return np.datetime64(pd.Timestamp(t).to_datetime64(), 's').astype(np.int64)
+
+
+def _table(entries):
+    """
+    Build a manifest table from (file name, size, mtime) tuples, skipping non-GridStat files
+    """
+
+    rows = {'file_prefix': [], 'line_type': [], 'lead': [], 'valid': [], 'fname': [], 'size': [],
+            'mtime': []}
+    for name, size, mtime in entries:
+        m = fname_re.match(name)
+        if m is None:
+            continue
+        rows['file_prefix'].append(m.group('prefix'))
+        rows['line_type'].append(m.group('line_type') or 'stat')
+        rows['lead'].append(int(m.group('lead')))
+        rows['valid'].append(m.group('valid'))
+        rows['fname'].append(name)
+        rows['size'].append(size)
+        rows['mtime'].append(mtime)
+
+    table = pd.DataFrame(rows)
+    table['lead'] = table['lead'].astype(np.int64)
+    table['valid'] = pd.to_datetime(table['valid'], format='%Y%m%d_%H%M%S')
+    table['size'] = table['size'].astype(np.int64)
+    table['mtime'] = table['mtime'].astype(np.int64)
+    for c in ['file_prefix', 'line_type']:
+        table[c] = table[c].astype(str)
+
+    return table
+
+
+def _dir_entries(dirname):
+    """
+    (file name, size, mtime) for each file in a directory, skipping hidden files
+    """
+
+    entries = []
+    with os.scandir(dirname) as it:
+        for e in it:
+            if e.name.startswith('.'):
+                continue
+            try:
+                s = e.stat()
+            except FileNotFoundError:
+                # Broken symbolic link
+                continue
+            entries.append((e.name, s.st_size, s.st_mtime_ns))
+
+    return entries
+
+
+def scan(dirname):
+    """
+    Scan a GridStat directory (or an archived or packed GridStat directory) and build a manifest
+
+    Parameters
+    ----------
+    dirname : string
+        GridStat output directory
+
+    Returns
+    -------
+    GridStatManifest
+        Manifest
+
+    """
+
+    # Avoid a circular import (met_pack uses manifests to find the files to pack)
+    import osse_utils.met_pack as mp
+
+    entries = []
+    if os.path.isdir(dirname):
+        entries = _dir_entries(dirname)
+    else:
+        for f in ma.glob(os.path.join(dirname, 'grid_stat*')):
+            info = ma.member_info(f)
+            entries.append((os.path.basename(f), info[2], info[3] * 10**9))
+
+        # Experiments that are only packed (see met_pack). Packs do not keep the size of each file,
+        # so sizes are 0 and mtimes are the mtime of the pack
+        parts = ma.split_path(dirname)
+        index = mp.load_index(parts[0]) if (len(entries) == 0) and (parts is not None) else None
+        if index is not None:
+            mtime = os.stat(mp.pack_fname(parts[0])).st_mtime_ns
+            prefix = f"{parts[1]}/"
+            for lpath in index['files']:
+                if lpath.startswith(prefix) and ('/' not in lpath[len(prefix):]):
+                    entries.append((lpath[len(prefix):], 0, mtime))
+
+    return GridStatManifest(dirname, _table(entries))
+
+
+def _names_hash(dirname):
+    """
+    Hash of the sorted GridStat file names in a directory. Only lists the directory (no stats)
+    """
+
+    names = sorted(n for n in os.listdir(dirname) if fname_re.match(n))
+    return hashlib.sha1('\n'.join(names).encode()).hexdigest()
+
+
+def _stamp(dirname):
+    """
+    Stamp used to decide whether a saved manifest is stale: the modification time of the directory
+    or, for archived or packed directories, the modification times of the archive index and pack
+    """
+
+    # Avoid a circular import (met_pack uses manifests to find the files to pack)
+    import osse_utils.met_pack as mp
+
+    if os.path.isdir(dirname):
+        return os.stat(dirname).st_mtime_ns
+    parts = ma.split_path(dirname)
+    if parts is None:
+        return None
+    stamp = []
+    for fname in [os.path.join(ma.zipped_dir, f"{parts[0]}{ma.index_suffix}"),
+                  mp.pack_fname(parts[0])]:
+        try:
+            stamp.append(os.stat(fname).st_mtime_ns)
+        except FileNotFoundError:
+            stamp.append(None)
+    return None if stamp == [None, None] else tuple(stamp)
+
+
+def _dir_lock(dirname):
+    """
+    Lock for one GridStat directory
+    """
+
+    with _locks_lock:
+        if dirname not in _locks:
+            _locks[dirname] = threading.Lock()
+        return _locks[dirname]
+
+
+def get_manifest(dirname, rebuild=False):
+    """
+    Get the manifest for a GridStat directory, scanning the directory only if there is no manifest
+    or the directory has changed since the manifest was made
+
+    Parameters
+    ----------
+    dirname : string
+        GridStat output directory
+    rebuild : boolean, optional
+        Option to rescan (and stat) every file even if the saved manifest is up to date (e.g., after
+        files were rewritten in place)
+
+    Returns
+    -------
+    GridStatManifest
+        Manifest
+
+    """
+
+    dirname = os.path.abspath(dirname)
+    with _dir_lock(dirname):
+        return _load_manifest(dirname, rebuild)
+
+
+def _save_manifest(path, dirname, stamp, names, man):
+    """
+    Atomically write a manifest to disk
+    """
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(manifest_dir, exist_ok=True)
+        with open(tmp_path, 'wb') as fptr:
+            pickle.dump({'version': manifest_version, 'dirname': dirname, 'stamp': stamp,
+                         'names': names, 'table': man.table}, fptr,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as err:
+        print(f"Unable to write GridStat manifest {path}: {err}")
+
+
+def _load_manifest(dirname, rebuild):
+    """
+    Load, or scan and save, the manifest for a directory (called with the directory lock held)
+    """
+
+    stamp = _stamp(dirname)
+    if (not rebuild) and (dirname in _manifests) and (_manifests[dirname][0] == stamp):
+        return _manifests[dirname][1]
+
+    path = os.path.join(manifest_dir, f"{hashlib.sha1(dirname.encode()).hexdigest()[:16]}.pkl")
+    man = None
+    if (not rebuild) and os.path.isfile(path):
+        try:
+            with open(path, 'rb') as fptr:
+                saved = pickle.load(fptr)
+            if (saved.get('version', None) == manifest_version) and (saved['dirname'] == dirname):
+                if saved['stamp'] == stamp:
+                    man = GridStatManifest(dirname, saved['table'])
+                elif ((saved['names'] is not None) and os.path.isdir(dirname) and
+                      (saved['names'] == _names_hash(dirname))):
+                    # Only non-GridStat (e.g., hidden) files changed. Save the new stamp
+                    man = GridStatManifest(dirname, saved['table'])
+                    _save_manifest(path, dirname, stamp, saved['names'], man)
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+            man = None
+
+    if man is None:
+        man = scan(dirname)
+        names = _names_hash(dirname) if os.path.isdir(dirname) else None
+        _save_manifest(path, dirname, stamp, names, man)
+
+    _manifests[dirname] = (stamp, man)
+    return man
+
+
+"""
+End gridstat_manifest.py
+"""
@@ -0,0 +1,156 @@
+"""
+Streaming Reader for GSI netCDF Diag Files
+
+gsi_fcts.read_diag reads every variable from every diag file into one DataFrame before any
+filtering happens, so peak memory grows with the number of cycles. The functions here open one diag
+file at a time, read only the requested variables, apply the filters, and keep only the rows that
+survive. Files can optionally be read in parallel.
+
+Example:
+
+    import osse_utils.gsi_diag as gd
+    diag = gd.read_diag_stream(fnames, variables=['Observation_Type', 'Obs_Minus_Forecast_adjusted'],
+                               filters={'Pressure': (700, 1050), 'Observation_Type': [130, 136]})
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+import concurrent.futures as cf
+
+from osse_utils.filters import filter_mask
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def _read_var(ds, name):
+    """
+    Read a single variable from an open diag file, converting character arrays to strings
+    """
+
+    if name == 'date_time':
+        return np.full(ds.dimensions['nobs'].size, ds.getncattr('date_time'))
+
+    var = ds.variables[name]
+    var.set_auto_mask(False)
+    if (var.dtype == 'S1') and (var.ndim == 2):
+        return np.char.strip(nc.chartostring(var[:]).astype(str))
+    return var[:]
+
+
+def read_diag_file(fname, variables, filters={}):
+    """
+    Read selected variables from a single GSI netCDF diag file, keeping only rows that pass the
+    filters
+
+    Parameters
+    ----------
+    fname : string
+        GSI netCDF diag file name
+    variables : list of strings
+        Variables to return. 'date_time' returns the cycle time for each ob (as in
+        gsi_fcts.read_diag)
+    filters : dictionary, optional
+        Row filters (see osse_utils.filters). Variables used in filters do not need to be in
+        variables
+
+    Returns
+    -------
+    pd.DataFrame
+        Filtered observations
+
+    """
+
+    with nc.Dataset(fname, 'r') as ds:
+        filter_data = {v: _read_var(ds, v) for v in filters}
+        mask = filter_mask(filter_data, filters)
+        out = {}
+        for v in variables:
+            vals = filter_data[v] if v in filter_data else _read_var(ds, v)
+            out[v] = vals if mask is None else vals[mask]
+
+    return pd.DataFrame(out)
+
+
+def iter_diag(fnames, variables, filters={}, nworkers=1):
+    """
+    Read GSI netCDF diag files one at a time, yielding the filtered observations from each file
+
+    Parameters
+    ----------
+    fnames : list of strings
+        GSI netCDF diag file names
+    variables : list of strings
+        Variables to return
+    filters : dictionary, optional
+        Row filters (see osse_utils.filters)
+    nworkers : integer, optional
+        Number of processes used to read files. Files are still yielded in the same order as
+        fnames. Filters must be picklable if nworkers > 1
+
+    Yields
+    ------
+    pd.DataFrame
+        Filtered observations from one file
+
+    """
+
+    if nworkers > 1:
+        with cf.ProcessPoolExecutor(max_workers=nworkers) as pool:
+            for df in pool.map(read_diag_file, fnames, [variables]*len(fnames),
+                               [filters]*len(fnames)):
+                yield df
+    else:
+        for f in fnames:
+            yield read_diag_file(f, variables, filters=filters)
+
+
+def read_diag_stream(fnames, variables, filters={}, nworkers=1, verbose=False):
+    """
+    Read GSI netCDF diag files, keeping only the filtered observations from each file
+
+    Peak memory scales with the size of one diag file plus the filtered output.
+
+    Parameters
+    ----------
+    fnames : list of strings
+        GSI netCDF diag file names
+    variables : list of strings
+        Variables to return
+    filters : dictionary, optional
+        Row filters (see osse_utils.filters)
+    nworkers : integer, optional
+        Number of processes used to read files
+    verbose : boolean, optional
+        Option to print progress
+
+    Returns
+    -------
+    pd.DataFrame
+        Filtered observations from all files (an empty DataFrame with the requested columns if
+        fnames is empty)
+
+    """
+
+    dfs = []
+    for f, df in zip(fnames, iter_diag(fnames, variables, filters=filters, nworkers=nworkers)):
+        if verbose:
+            print(f"{f}: {len(df)} obs kept")
+        dfs.append(df)
+
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=variables)
+    return pd.concat(dfs, ignore_index=True)
+
+
+"""
+End gsi_diag.py
+"""
@@ -0,0 +1,161 @@
+"""
+Density Rendering for Dense Observation Maps
+
+Plotting every ob as a vector marker creates one path per ob, so saving a map with hundreds of
+thousands of obs to a PDF is slow and the resulting file is large and slow to display. plot_obs
+draws ob locations on a cartopy GeoAxes using one of several modes:
+
+    'points'  : vector markers (one per ob, same as ax.plot)
+    'raster'  : markers drawn into a single raster image embedded in the (otherwise vector) figure
+    'hist'    : counts on a regular grid in map coordinates, drawn as a rasterized image
+    'hexbin'  : counts in hexagonal bins in map coordinates, drawn as a rasterized image
+
+For 'hist' and 'hexbin', the number of bins is fixed, so save time and file size do not depend on
+the number of obs. 'auto' uses 'points' for small numbers of obs and 'hist' otherwise.
+
+Bins are computed from the map extent, so ax.set_extent should be called before plot_obs.
+
+Example:
+
+    import osse_utils.map_density as mden
+    ax.set_extent([237, 291, 21.5, 50])
+    art = mden.plot_obs(ax, diag_df['Longitude'], diag_df['Latitude'], mode='hist')
+    plt.colorbar(art, ax=ax, label='number of obs')
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import matplotlib.colors as mcolors
+import cartopy.crs as ccrs
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Plotting modes
+modes = ['auto', 'points', 'raster', 'hist', 'hexbin']
+
+# Largest number of obs plotted as vector markers when mode = 'auto'
+max_points = 20000
+
+# Default number of bins in the x direction (the number in the y direction is set so that bins are
+# approximately square)
+default_nbins = 200
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def project(ax, lon, lat, src_crs=ccrs.PlateCarree()):
+    """
+    Convert ob locations to the map coordinates of a GeoAxes, dropping points that cannot be
+    projected
+
+    Parameters
+    ----------
+    ax : cartopy.mpl.geoaxes.GeoAxes
+        Map axes
+    lon, lat : array
+        Ob locations (deg)
+    src_crs : cartopy.crs.CRS, optional
+        Coordinate system of lon and lat
+
+    Returns
+    -------
+    x, y : np.array
+        Ob locations in map coordinates
+
+    """
+
+    xyz = ax.projection.transform_points(src_crs, np.asarray(lon, dtype=np.float64),
+                                         np.asarray(lat, dtype=np.float64))
+    good = np.isfinite(xyz[:, 0]) & np.isfinite(xyz[:, 1])
+    return xyz[good, 0], xyz[good, 1]
+
+
+def _bins(ax, nbins):
+    """
+    Bin edges in map coordinates that cover the map extent
+    """
+
+    x0, x1, y0, y1 = ax.get_extent()
+    nx = int(nbins)
+    ny = max(1, int(round(nx * (y1 - y0) / (x1 - x0))))
+    return np.linspace(x0, x1, nx + 1), np.linspace(y0, y1, ny + 1)
+
+
+def plot_obs(ax, lon, lat, mode='auto', nbins=default_nbins, src_crs=ccrs.PlateCarree(),
+             plt_kw={}, density_kw={}):
+    """
+    Plot ob locations on a map
+
+    Parameters
+    ----------
+    ax : cartopy.mpl.geoaxes.GeoAxes
+        Map axes. The map extent should already be set
+    lon, lat : array
+        Ob locations (deg)
+    mode : string, optional
+        Plotting mode (see module docstring)
+    nbins : integer, optional
+        Number of bins in the x direction for 'hist' and 'hexbin'
+    src_crs : cartopy.crs.CRS, optional
+        Coordinate system of lon and lat
+    plt_kw : dictionary, optional
+        Keyword arguments passed to ax.plot for 'points' and 'raster'
+    density_kw : dictionary, optional
+        Keyword arguments passed to ax.pcolormesh ('hist') or ax.hexbin ('hexbin')
+
+    Returns
+    -------
+    matplotlib artist
+        Plotted markers ('points' and 'raster') or density image ('hist' and 'hexbin'), which can
+        be used to create a colorbar
+
+    """
+
+    if mode not in modes:
+        raise ValueError(f"mode must be one of {modes}, not {mode}")
+    if mode == 'auto':
+        mode = 'points' if len(lon) <= max_points else 'hist'
+
+    if mode in ['points', 'raster']:
+        kw = {'marker': '.', 'color': 'b', 'markersize': 2, 'linestyle': 'none'}
+        kw.update(plt_kw)
+        return ax.plot(lon, lat, transform=src_crs, rasterized=(mode == 'raster'), **kw)[0]
+
+    x, y = project(ax, lon, lat, src_crs=src_crs)
+    xbins, ybins = _bins(ax, nbins)
+    kw = {'cmap': 'Blues', 'norm': mcolors.LogNorm()}
+    kw.update(density_kw)
+
+    # A LogNorm cannot be autoscaled if there are no counts, so fix the color limits instead
+    inside = (x >= xbins[0]) & (x <= xbins[-1]) & (y >= ybins[0]) & (y <= ybins[-1])
+    if (not inside.any()) and isinstance(kw.get('norm', None), mcolors.LogNorm):
+        if kw['norm'].vmin is None:
+            kw['norm'].vmin = 1
+        if kw['norm'].vmax is None:
+            kw['norm'].vmax = 10
+
+    if mode == 'hist':
+        counts = np.histogram2d(x, y, bins=[xbins, ybins])[0].T
+        counts = np.ma.masked_equal(counts, 0)
+        return ax.pcolormesh(xbins, ybins, counts, transform=ax.projection, rasterized=True, **kw)
+
+    # Rows of hexagons are offset, so fewer rows are needed for hexagons to be regular
+    extent = (xbins[0], xbins[-1], ybins[0], ybins[-1])
+    gridsize = (len(xbins) - 1, max(1, int(round((len(ybins) - 1) / np.sqrt(3)))))
+    return ax.hexbin(x, y, gridsize=gridsize, extent=extent, mincnt=1, transform=ax.projection,
+                     rasterized=True, **kw)
+
+
+"""
+End map_density.py
+"""
@@ -0,0 +1,223 @@
+"""
+Cached, Pre-Projected Natural Earth Geometries for Map Panels
+
+ax.coastlines and cfeature.NaturalEarthFeature re-read the full Natural Earth shapefiles (10m
+state borders are ~30 MB) and clip and reproject every shape for each new axes, so multi-panel
+maps pay this cost once per panel. Here, the shapes for a (feature, scale, projection, extent)
+combination are read, clipped to the extent, and projected once. They are then kept in memory and
+saved to disk (as WKB), so later panels and later runs of a script reuse them.
+
+Shapefiles are read from a local directory if one exists (data/natural_earth by default, or the
+directory in the OSSE_NATURAL_EARTH environment variable) using the same layout as the cartopy data
+directory (shapefiles/natural_earth/{category}/ne_{scale}_{name}.shp), so maps can be made offline.
+Cached geometries are saved to data/geom_cache (set OSSE_GEOM_CACHE to use a different directory).
+
+Example:
+
+    import osse_utils.map_features as mf
+    ax.set_extent([-87, -80, 32, 37])
+    mf.coastlines(ax, '10m', edgecolor='k', linewidth=0.75)
+    mf.add_feature(ax, 'admin_1_states_provinces', scale='10m', linewidth=0.75, edgecolor='k')
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import pickle
+import hashlib
+import numpy as np
+import shapely.wkb
+import shapely.geometry as sgeom
+import cartopy
+import cartopy.crs as ccrs
+import cartopy.io.shapereader as shpreader
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+_repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Local Natural Earth data directory
+ne_dir = os.environ.get('OSSE_NATURAL_EARTH', os.path.join(_repo_dir, 'data', 'natural_earth'))
+
+# Directory for cached geometries
+cache_dir = os.environ.get('OSSE_GEOM_CACHE', os.path.join(_repo_dir, 'data', 'geom_cache'))
+
+# Category of each Natural Earth feature used in the figures. Other features need the category to
+# be specified
+categories = {'coastline': 'physical',
+              'lakes': 'physical',
+              'land': 'physical',
+              'ocean': 'physical',
+              'admin_0_boundary_lines_land': 'cultural',
+              'admin_1_states_provinces': 'cultural',
+              'admin_1_states_provinces_lakes': 'cultural'}
+
+# Extents are rounded to this many degrees (and padded by one rounding interval) so that panels with
+# nearly identical extents share cached geometries
+extent_round = 1.
+
+# Geometries that have already been read, keyed by (category, name, scale, projection, extent)
+_geoms = {}
+
+if os.path.isdir(ne_dir):
+    cartopy.config['pre_existing_data_dir'] = ne_dir
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def _round_extent(extent):
+    """
+    Round a lat/lon extent outward, adding a pad so that shapes along the edges are not clipped
+    """
+
+    lon0 = extent_round * (np.floor(extent[0] / extent_round) - 1)
+    lon1 = extent_round * (np.ceil(extent[1] / extent_round) + 1)
+    lat0 = max(-90., extent_round * (np.floor(extent[2] / extent_round) - 1))
+    lat1 = min(90., extent_round * (np.ceil(extent[3] / extent_round) + 1))
+    return (float(lon0), float(lon1), float(lat0), float(lat1))
+
+
+def _cache_fname(key):
+    return os.path.join(cache_dir, f"{hashlib.sha1(repr(key).encode()).hexdigest()[:16]}.pkl")
+
+
+def feature_geometries(name, scale, projection, extent, category=None):
+    """
+    Get Natural Earth shapes clipped to an extent and projected, using the cache if possible
+
+    Parameters
+    ----------
+    name : string
+        Natural Earth feature name (e.g., 'admin_1_states_provinces')
+    scale : string
+        Natural Earth scale ('10m', '50m', or '110m')
+    projection : cartopy.crs.Projection
+        Map projection
+    extent : list of floats
+        Map extent [lon_min, lon_max, lat_min, lat_max] (deg)
+    category : string, optional
+        Natural Earth category ('physical' or 'cultural'). Only needed for features that are not in
+        categories
+
+    Returns
+    -------
+    list of shapely geometries
+        Shapes in the map projection
+
+    """
+
+    if category is None:
+        category = categories[name]
+    extent = _round_extent(extent)
+    shp_fname = shpreader.natural_earth(resolution=scale, category=category, name=name)
+    key = (category, name, scale, projection.proj4_init, extent, os.path.getmtime(shp_fname),
+           cartopy.__version__)
+    if key in _geoms:
+        return _geoms[key]
+
+    cache_fname = _cache_fname(key)
+    if os.path.isfile(cache_fname):
+        try:
+            with open(cache_fname, 'rb') as fptr:
+                _geoms[key] = [shapely.wkb.loads(g) for g in pickle.load(fptr)]
+            return _geoms[key]
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+
+    # Clip in lat/lon, then project
+    src_crs = ccrs.PlateCarree()
+    box = sgeom.box(extent[0], extent[2], extent[1], extent[3])
+    geoms = []
+    for geom in shpreader.Reader(shp_fname).geometries():
+        if not geom.intersects(box):
+            continue
+        geom = projection.project_geometry(geom.intersection(box), src_crs)
+        if not geom.is_empty:
+            geoms.append(geom)
+    _geoms[key] = geoms
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_fname = f"{cache_fname}.{os.getpid()}.tmp"
+        with open(tmp_fname, 'wb') as fptr:
+            pickle.dump([g.wkb for g in geoms], fptr)
+        os.replace(tmp_fname, cache_fname)
+    except OSError as err:
+        print(f"Unable to write geometry cache for {name} ({scale}): {err}")
+
+    return geoms
+
+
+def add_feature(ax, name, scale='50m', category=None, extent=None, **kwargs):
+    """
+    Add a Natural Earth feature to a map using cached geometries
+
+    Parameters
+    ----------
+    ax : cartopy.mpl.geoaxes.GeoAxes
+        Map axes. The map extent should already be set
+    name : string
+        Natural Earth feature name (e.g., 'admin_1_states_provinces')
+    scale : string, optional
+        Natural Earth scale ('10m', '50m', or '110m')
+    category : string, optional
+        Natural Earth category. Only needed for features that are not in categories
+    extent : list of floats, optional
+        Extent [lon_min, lon_max, lat_min, lat_max] (deg) used to clip shapes. Defaults to the map
+        extent
+    kwargs : optional
+        Other keyword arguments passed to ax.add_geometries (e.g., edgecolor, linewidth)
+
+    Returns
+    -------
+    cartopy.mpl.feature_artist.FeatureArtist
+        Plotted shapes
+
+    """
+
+    if extent is None:
+        extent = ax.get_extent(crs=ccrs.PlateCarree())
+    geoms = feature_geometries(name, scale, ax.projection, extent, category=category)
+
+    kw = {'facecolor': 'none'}
+    kw.update(kwargs)
+    return ax.add_geometries(geoms, crs=ax.projection, **kw)
+
+
+def coastlines(ax, scale='110m', **kwargs):
+    """
+    Add coastlines to a map using cached geometries (replacement for ax.coastlines)
+
+    Parameters
+    ----------
+    ax : cartopy.mpl.geoaxes.GeoAxes
+        Map axes. The map extent should already be set
+    scale : string, optional
+        Natural Earth scale ('10m', '50m', or '110m')
+    kwargs : optional
+        Other keyword arguments passed to ax.add_geometries
+
+    Returns
+    -------
+    cartopy.mpl.feature_artist.FeatureArtist
+        Plotted coastlines
+
+    """
+
+    kw = {'edgecolor': 'k'}
+    kw.update(kwargs)
+    return add_feature(ax, 'coastline', scale=scale, **kw)
+
+
+"""
+End map_features.py
+"""
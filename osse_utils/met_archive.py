@@ -0,0 +1,370 @@
+"""
+Read MET Output Directly from the Zipped Archives
+
+data/untar_link_MET_output.sh extracts every archive in data/MET_output_zipped and then creates one
+symbolic link per GridStat file so that all output for an experiment and verification subtype
+appears in {experiment}/{subtyp}/output/GridStat. This module provides the same view of the
+GridStat output without extracting anything.
+
+The .tar.gz archives are not seekable, so each archive is read once (in a single streaming pass)
+and the GridStat files are re-compressed individually into a "pack" file next to the archive. An
+index maps the logical path of each file (i.e., the path of the symbolic link that
+untar_link_MET_output.sh would have created, relative to data/MET_output_unzipped) to its location
+in the pack, so any file can be decompressed on its own.
+
+met_cache.read_ascii falls back to the packs for files that do not exist on disk, so plotting
+scripts can keep using paths like '../data/MET_output_unzipped/spring/severe_wx_env/output/GridStat'
+after running data/index_MET_output.py instead of untar_link_MET_output.sh.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import re
+import glob as _glob
+import zlib
+import pickle
+import fnmatch
+import tarfile
+import tempfile
+import contextlib
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+_data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# Directory that logical paths are relative to (i.e., where untar_link_MET_output.sh puts output)
+unzipped_dir = os.path.join(_data_dir, 'MET_output_unzipped')
+
+# Directory with the .tar.gz archives and pack files
+zipped_dir = os.path.join(_data_dir, 'MET_output_zipped')
+
+# Pack and index file suffixes
+pack_suffix = '.metpack'
+index_suffix = '.metpack.idx'
+
+# Index format version. Increment if the layout of the index changes
+index_version = 1
+
+# Archive members that are added to the pack: {exp}/{subtyp}/{init}/output/GridStat/{dir}/{file}
+member_re = re.compile(r'^(?:\./)?(?P<exp>[^/]+)/(?P<subtyp>[^/]+)/[^/]+/output/(?P<typ>GridStat)/[^/]+/(?P<fname>grid_stat[^/]*)$')
+
+# Indices that have already been opened, keyed by experiment
+_indices = {}
+
+# Experiments that have already been reported as missing an (up to date) index
+_warned = set()
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def logical_path(member_name):
+    """
+    Logical path of an archive member (relative to unzipped_dir), or None if the member is not
+    GridStat output
+
+    Parameters
+    ----------
+    member_name : string
+        Name of the member in the .tar.gz archive
+
+    Returns
+    -------
+    string or None
+        Logical path
+
+    """
+
+    m = member_re.match(member_name)
+    if m is None:
+        return None
+    return '/'.join([m.group('exp'), m.group('subtyp'), 'output', m.group('typ'), m.group('fname')])
+
+
+def build_index(exp, overwrite=False, verbose=True):
+    """
+    Create the pack and index files for one experiment archive
+
+    Parameters
+    ----------
+    exp : string
+        Experiment name (archive is {zipped_dir}/{exp}.tar.gz)
+    overwrite : boolean, optional
+        Option to rebuild the pack even if it is newer than the archive
+    verbose : boolean, optional
+        Option to print progress
+
+    Returns
+    -------
+    dictionary
+        Index
+
+    """
+
+    tar_fname = os.path.join(zipped_dir, f"{exp}.tar.gz")
+    pack_fname = os.path.join(zipped_dir, f"{exp}{pack_suffix}")
+    idx_fname = os.path.join(zipped_dir, f"{exp}{index_suffix}")
+
+    if ((not overwrite) and os.path.isfile(idx_fname) and os.path.isfile(pack_fname) and
+        (os.path.getmtime(idx_fname) >= os.path.getmtime(tar_fname))):
+        index = load_index(exp)
+        if index is not None:
+            return index
+
+    if verbose:
+        print(f"indexing {tar_fname}")
+
+    # Members are stored as {logical path: (offset, compressed size, size, mtime, member name)}.
+    # If several members have the same logical path, keep the one that sorts last (this matches
+    # the order in which untar_link_MET_output.sh overwrites links)
+    members = {}
+    tmp_pack = f"{pack_fname}.{os.getpid()}.tmp"
+    with tarfile.open(tar_fname, mode='r|gz') as tar, open(tmp_pack, 'wb') as pack:
+        offset = 0
+        for info in tar:
+            if not info.isfile():
+                continue
+            lpath = logical_path(info.name)
+            if lpath is None:
+                continue
+            if (lpath in members) and (members[lpath][4] > info.name):
+                continue
+            raw = tar.extractfile(info).read()
+            comp = zlib.compress(raw, 6)
+            pack.write(comp)
+            members[lpath] = (offset, len(comp), len(raw), int(info.mtime), info.name)
+            offset = offset + len(comp)
+
+    index = {'version': index_version, 'exp': exp, 'members': members}
+    tmp_idx = f"{idx_fname}.{os.getpid()}.tmp"
+    with open(tmp_idx, 'wb') as fptr:
+        pickle.dump(index, fptr, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_pack, pack_fname)
+    os.replace(tmp_idx, idx_fname)
+
+    if verbose:
+        print(f"{len(members)} GridStat files added to {pack_fname}")
+    _indices[exp] = (os.stat(idx_fname).st_mtime_ns, index)
+
+    return index
+
+
+def load_index(exp):
+    """
+    Load the index for an experiment
+
+    Indices are never built here, because building one requires a full pass over the archive. If
+    an archive has no index (or the index is from an older version of this module), a message is
+    printed (once per experiment) and the archive is ignored. Run data/index_MET_output.py (or
+    build_index) to build the indices.
+
+    Parameters
+    ----------
+    exp : string
+        Experiment name
+
+    Returns
+    -------
+    dictionary or None
+        Index. None if there is no (up to date) index for this experiment
+
+    """
+
+    idx_fname = os.path.join(zipped_dir, f"{exp}{index_suffix}")
+    try:
+        stamp = os.stat(idx_fname).st_mtime_ns
+    except FileNotFoundError:
+        if (os.path.isfile(os.path.join(zipped_dir, f"{exp}.tar.gz")) and
+            (not os.path.isdir(os.path.join(unzipped_dir, exp)))):
+            _warn_no_index(exp, 'has no index')
+        return None
+
+    if (exp in _indices) and (_indices[exp][0] == stamp):
+        return _indices[exp][1]
+
+    with open(idx_fname, 'rb') as fptr:
+        index = pickle.load(fptr)
+    if index.get('version', None) != index_version:
+        _warn_no_index(exp, 'has an out of date index')
+        return None
+
+    _indices[exp] = (stamp, index)
+    return index
+
+
+def _warn_no_index(exp, problem):
+    """
+    Print (once per experiment) that an archive cannot be read because of its index
+    """
+
+    if exp not in _warned:
+        print(f"{os.path.join(zipped_dir, exp + '.tar.gz')} {problem} and is skipped. Run "
+              f"data/index_MET_output.py to index the MET output archives")
+        _warned.add(exp)
+
+
+def split_path(fname):
+    """
+    Split a file name into the experiment and logical path, or return None if the file is not
+    within unzipped_dir
+    """
+
+    rel = os.path.relpath(os.path.abspath(fname), unzipped_dir)
+    if rel.startswith('..') or os.path.isabs(rel):
+        return None
+    rel = rel.replace(os.sep, '/')
+    return rel.split('/')[0], rel
+
+
+def member_info(fname):
+    """
+    Look up a file in the archives
+
+    Parameters
+    ----------
+    fname : string
+        File name (within unzipped_dir)
+
+    Returns
+    -------
+    tuple or None
+        (offset, compressed size, size, mtime, member name). None if the file is not archived
+
+    """
+
+    parts = split_path(fname)
+    if parts is None:
+        return None
+    index = load_index(parts[0])
+    if index is None:
+        return None
+
+    return index['members'].get(parts[1], None)
+
+
+def cache_dir(fname):
+    """
+    Directory used for met_cache files for an archived file (mirrors the logical directory within
+    a hidden directory in zipped_dir, because the logical directory does not exist on disk)
+    """
+
+    _, lpath = split_path(fname)
+    dirname = os.path.join(zipped_dir, '.read_ascii_cache', os.path.dirname(lpath))
+    os.makedirs(dirname, exist_ok=True)
+    return dirname
+
+
+def getmtime(fname):
+    """
+    os.path.getmtime that also works for archived files
+    """
+
+    if os.path.exists(fname):
+        return os.path.getmtime(fname)
+    info = member_info(fname)
+    if info is None:
+        raise FileNotFoundError(fname)
+    return float(info[3])
+
+
+def read_member(fname):
+    """
+    Read an archived file
+
+    Parameters
+    ----------
+    fname : string
+        File name (within unzipped_dir)
+
+    Returns
+    -------
+    bytes
+        File contents
+
+    """
+
+    info = member_info(fname)
+    if info is None:
+        raise FileNotFoundError(fname)
+    exp = split_path(fname)[0]
+    with open(os.path.join(zipped_dir, f"{exp}{pack_suffix}"), 'rb') as fptr:
+        fptr.seek(info[0])
+        return zlib.decompress(fptr.read(info[1]))
+
+
+@contextlib.contextmanager
+def extracted(fname):
+    """
+    Context manager that writes an archived file to a temporary directory (keeping the same base
+    name) for functions that can only read from disk. The file is removed afterwards
+
+    Parameters
+    ----------
+    fname : string
+        File name (within unzipped_dir)
+
+    Yields
+    ------
+    string
+        Temporary file name
+
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_fname = os.path.join(tmp_dir, os.path.basename(fname))
+        with open(tmp_fname, 'wb') as fptr:
+            fptr.write(read_member(fname))
+        yield tmp_fname
+
+
+def glob(pattern):
+    """
+    glob.glob that also includes archived files
+
+    Parameters
+    ----------
+    pattern : string
+        Wildcard pattern
+
+    Returns
+    -------
+    list of strings
+        Files on disk matching the pattern, plus archived files matching the pattern that are not
+        on disk
+
+    """
+
+    found = _glob.glob(pattern)
+    parts = split_path(pattern)
+    if (parts is None) or any(c in parts[0] for c in '*?['):
+        return found
+    index = load_index(parts[0])
+    if index is None:
+        return found
+
+    # Return archived files using the same prefix as the pattern
+    if pattern.replace(os.sep, '/').endswith(parts[1]):
+        prefix = pattern[:len(pattern) - len(parts[1])]
+    else:
+        prefix = unzipped_dir + os.sep
+    on_disk = set(os.path.abspath(f) for f in found)
+    for lpath in fnmatch.filter(index['members'].keys(), parts[1]):
+        f = prefix + lpath
+        if os.path.abspath(f) not in on_disk:
+            found.append(f)
+
+    return found
+
+
+"""
+End met_archive.py
+"""
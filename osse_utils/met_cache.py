@@ -0,0 +1,576 @@
+"""
+Persistent Cache for Parsed MET ASCII Output
+
+Parsing thousands of GridStat ASCII files is the slowest part of making most figures. This module
+keeps a cache of already-parsed rows alongside the MET output (one pickle file per directory and
+line type) so that subsequent reads of the same files return pre-typed DataFrames rather than
+re-tokenizing text. Cache entries are keyed on file path, modification time, and file size, so a
+file that is rewritten is automatically re-parsed.
+
+Typical usage in a plotting script:
+
+    import osse_utils.met_cache as mc
+    mc.install()   # metplus_tools.read_ascii now uses the cache
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+import osse_utils.met_archive as ma
+import osse_utils.met_pack as mp
+import osse_utils.met_schema as ms
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Cache file name within each MET output directory (include {line_type} placeholder)
+cache_fname = '.read_ascii_cache_{line_type}.pkl'
+
+# Cache format version. Increment if the layout of the cache files changes
+cache_version = 1
+
+# Original (uncached) read_ascii function
+_read_ascii_uncached = mt.read_ascii
+
+# In-memory copies of cache files that have already been opened, keyed by cache file name
+_mem_cache = {}
+
+# Cached data converted to the fixed MET dtypes (see met_schema), keyed by cache file name. Each
+# value is (cached data, dictionary of converted columns). Columns are only converted when first
+# requested
+_typed = {}
+
+# Locks that prevent two threads from updating the same cache file at once, keyed by cache file name
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def _line_type(fname):
+    """
+    Extract the line type (e.g., 'sl1l2') from a MET output file name
+
+    Parameters
+    ----------
+    fname : string
+        MET output file name
+
+    Returns
+    -------
+    string
+        Line type, or the file extension for files without a line type suffix (e.g., .stat files)
+
+    """
+
+    base, ext = os.path.splitext(os.path.basename(fname))
+    if ext == '.txt':
+        return base.split('_')[-1]
+    else:
+        return ext[1:]
+
+
+def _cache_path(dirname, line_type):
+    """
+    Path to the cache file for a given directory and line type
+    """
+
+    return os.path.join(dirname, cache_fname.format(line_type=line_type))
+
+
+def _stat(fname):
+    """
+    Locate a MET output file. Files that are not on disk are looked up in the packed MET output
+    (see met_pack), then in the MET output archives (see met_archive)
+
+    Parameters
+    ----------
+    fname : string
+        Absolute file name
+
+    Returns
+    -------
+    tuple or None
+        (source, info). source is 'disk', 'archive', or 'pack'. For files on disk or in the
+        archives, info is ((mtime in ns, size), cache directory). For packed files, info is the
+        output from met_pack.member_info. None if the file cannot be found
+
+    """
+
+    try:
+        s = os.stat(fname)
+        return 'disk', ((s.st_mtime_ns, s.st_size), os.path.dirname(fname))
+    except FileNotFoundError:
+        info = mp.member_info(fname)
+        if info is not None:
+            return 'pack', info
+        info = ma.member_info(fname)
+        if info is None:
+            return None
+        return 'archive', ((info[3] * 10**9, info[2]), ma.cache_dir(fname))
+
+
+def _parse(fname, archived, verbose=False):
+    """
+    Parse a single MET output file using the original read_ascii function
+    """
+
+    if archived:
+        with ma.extracted(fname) as tmp_fname:
+            return _read_ascii_uncached([tmp_fname], verbose=verbose)
+    return _read_ascii_uncached([fname], verbose=verbose)
+
+
+def _parse_columns(fname, source, columns, verbose=False):
+    """
+    Parse selected columns from a single MET output file. Only .txt files are parsed directly,
+    other files (e.g., .stat files with several line types) are parsed in full and then subset
+    """
+
+    if not fname.endswith('.txt'):
+        return _parse(fname, source == 'archive', verbose=verbose).reindex(columns=columns)
+    if source == 'archive':
+        return ms.parse_columns(ma.read_member(fname), columns)
+    return ms.parse_columns(fname, columns)
+
+
+def _typed_columns(path, data, columns):
+    """
+    Columns of cached data with the fixed MET dtypes. Each column is only converted once for each
+    version of the cache
+
+    Parameters
+    ----------
+    path : string
+        Cache file name
+    data : pd.DataFrame
+        Cached data
+    columns : list of strings
+        Columns to return. Columns that are not in data are filled with NaN
+
+    Returns
+    -------
+    dictionary
+        Converted columns (pd.Series), keyed by column name
+
+    """
+
+    if (path not in _typed) or (_typed[path][0] is not data):
+        _typed[path] = (data, {})
+    typed = _typed[path][1]
+    missing = [c for c in columns if c not in typed]
+    if len(missing) > 0:
+        typed.update(ms.apply_schema(data.reindex(columns=missing)).items())
+    return typed
+
+
+def _cache_lock(path):
+    """
+    Lock for one cache file
+    """
+
+    with _locks_lock:
+        if path not in _locks:
+            _locks[path] = threading.Lock()
+        return _locks[path]
+
+
+def _empty_cache():
+    """
+    Create an empty cache
+    """
+
+    return {'version': cache_version,
+            'files': pd.DataFrame({'fname': pd.Series(dtype=str),
+                                   'mtime': pd.Series(dtype=np.int64),
+                                   'size': pd.Series(dtype=np.int64),
+                                   'start': pd.Series(dtype=np.int64),
+                                   'stop': pd.Series(dtype=np.int64)}).set_index('fname'),
+            'data': pd.DataFrame()}
+
+
+def _load_cache(path):
+    """
+    Load a cache file, reusing the in-memory copy if the file has not changed on disk
+
+    Parameters
+    ----------
+    path : string
+        Cache file name
+
+    Returns
+    -------
+    dictionary
+        Cache with 'files' (index of cached files) and 'data' (parsed rows) entries
+
+    """
+
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return _empty_cache()
+
+    if (path in _mem_cache) and (_mem_cache[path][0] == stamp):
+        return _mem_cache[path][1]
+
+    try:
+        with open(path, 'rb') as fptr:
+            cache = pickle.load(fptr)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return _empty_cache()
+    if cache.get('version', None) != cache_version:
+        return _empty_cache()
+
+    _mem_cache[path] = (stamp, cache)
+    return cache
+
+
+def _save_cache(path, cache):
+    """
+    Write a cache file atomically so that concurrent readers never see a partial file
+
+    Parameters
+    ----------
+    path : string
+        Cache file name
+    cache : dictionary
+        Cache to save
+
+    Returns
+    -------
+    None
+
+    """
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as fptr:
+            pickle.dump(cache, fptr, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        _mem_cache[path] = (os.stat(path).st_mtime_ns, cache)
+    except OSError as err:
+        # Read-only directories are fine, we just cannot cache
+        print(f"Unable to write read_ascii cache {path}: {err}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _update_cache(cache, new_rows, stats):
+    """
+    Add newly parsed files to a cache, dropping any stale entries for the same files
+
+    Parameters
+    ----------
+    cache : dictionary
+        Existing cache
+    new_rows : dictionary
+        Parsed DataFrame for each new file, keyed by file name
+    stats : dictionary
+        (mtime, size) for each new file, keyed by file name
+
+    Returns
+    -------
+    dictionary
+        Updated cache
+
+    """
+
+    files = cache['files']
+    keep = files.loc[~files.index.isin(list(new_rows.keys()))]
+
+    # Retain rows from files that are still valid
+    pieces = []
+    starts = []
+    stops = []
+    n = 0
+    for start, stop in zip(keep['start'].values, keep['stop'].values):
+        pieces.append(cache['data'].iloc[start:stop])
+        starts.append(n)
+        n = n + (stop - start)
+        stops.append(n)
+    fnames = list(keep.index)
+    mtimes = list(keep['mtime'].values)
+    sizes = list(keep['size'].values)
+
+    # Add rows from new files
+    for f in new_rows:
+        pieces.append(new_rows[f])
+        starts.append(n)
+        n = n + len(new_rows[f])
+        stops.append(n)
+        fnames.append(f)
+        mtimes.append(stats[f][0])
+        sizes.append(stats[f][1])
+
+    nonempty = [p for p in pieces if len(p) > 0]
+    if len(nonempty) > 0:
+        data = pd.concat(nonempty, ignore_index=True)
+    else:
+        data = cache['data'].iloc[:0]
+    files = pd.DataFrame({'fname': fnames,
+                          'mtime': np.array(mtimes, dtype=np.int64),
+                          'size': np.array(sizes, dtype=np.int64),
+                          'start': np.array(starts, dtype=np.int64),
+                          'stop': np.array(stops, dtype=np.int64)}).set_index('fname')
+
+    return {'version': cache_version, 'files': files, 'data': data}
+
+
+def read_ascii(fnames, verbose=True, use_cache=True, return_fnames=False, columns=None):
+    """
+    Read a series of MET output ASCII files, using the on-disk cache when it is fresh
+
+    Drop-in replacement for metplus_tools.read_ascii. Files that are missing from the cache or whose
+    modification time or size has changed since they were cached are parsed with the original
+    read_ascii function and then added to the cache. Files that do not exist on disk are read from
+    the packed MET output or the MET output archives if possible (see met_pack and met_archive).
+    Packed files are already parsed, so they are not added to the cache.
+
+    If columns is set, only those columns are returned, using the fixed dtypes in met_schema (e.g.,
+    categoricals for text and datetime64 for timestamps). Cached files are sliced from the cache
+    (each cached column is only converted to the fixed dtypes once), and files that are not cached
+    (or are stale) only have the requested columns parsed. The cache holds complete rows, so these
+    files are not added to the cache; reads with columns = None add them.
+
+    Parameters
+    ----------
+    fnames : list of strings
+        MET output file names
+    verbose : boolean, optional
+        Option to print extra output
+    use_cache : boolean, optional
+        Option to use the cache. If False, every file is parsed with metplus_tools.read_ascii
+    return_fnames : boolean, optional
+        Option to also return the (absolute) name of the file each row came from
+    columns : list of strings, optional
+        Columns to return. Set to None to return all columns (without changing dtypes)
+
+    Returns
+    -------
+    pd.DataFrame
+        Output from all MET files, in the same order as fnames
+    np.array, optional
+        File name for each row. Only returned if return_fnames = True
+
+    """
+
+    if not use_cache:
+        pieces = []
+        row_fnames = [np.array([], dtype=str)]
+        for f in fnames:
+            f = os.path.abspath(f)
+            found = _stat(f)
+            if found is None:
+                continue
+            if found[0] == 'pack':
+                exp, lt, start, stop = found[1]
+                pieces.append(mp.read_rows(exp, lt, np.arange(start, stop), columns=columns))
+            elif columns is not None:
+                pieces.append(_parse_columns(f, found[0], columns, verbose=verbose))
+            else:
+                pieces.append(_parse(f, found[0] == 'archive', verbose=verbose))
+            row_fnames.append(np.full(len(pieces[-1]), f))
+        row_fnames = np.concatenate(row_fnames)
+        pieces = [p for p in pieces if len(p) > 0]
+        df = pd.concat(pieces, ignore_index=True) if len(pieces) > 0 else pd.DataFrame()
+        if columns is not None:
+            df = ms.apply_schema(df.reindex(columns=columns))
+        if return_fnames:
+            return df, row_fnames
+        return df
+
+    # Group files by cache file (i.e., directory and line type)
+    stats = {}
+    paths = {}
+    archived = set()
+    packed = {}
+    groups = {}
+    for f in fnames:
+        f = os.path.abspath(f)
+        if (f in stats) or (f in packed):
+            continue
+        found = _stat(f)
+        if found is None:
+            if verbose:
+                print(f"file not found: {f}")
+            continue
+        if found[0] == 'pack':
+            packed[f] = found[1]
+            continue
+        stats[f] = found[1][0]
+        if found[0] == 'archive':
+            archived.add(f)
+        path = _cache_path(found[1][1], _line_type(f))
+        paths[f] = path
+        if path not in groups:
+            groups[path] = []
+        groups[path].append(f)
+
+    # Load caches and parse any files that are not cached or are stale
+    caches = {}
+    parsed = {}
+    for path in groups:
+
+        # Threads (e.g., verif_store prefetching) that read the same directory take turns updating
+        # its cache
+        with _cache_lock(path):
+            cache = _load_cache(path)
+            files = cache['files']
+            new_rows = {}
+            for f in groups[path]:
+                if f in files.index:
+                    entry = files.loc[f]
+                    if (entry['mtime'] == stats[f][0]) and (entry['size'] == stats[f][1]):
+                        continue
+                if verbose:
+                    print(f"reading {f}")
+                if columns is not None:
+                    parsed[f] = _parse_columns(f, 'archive' if f in archived else 'disk', columns)
+                else:
+                    new_rows[f] = _parse(f, f in archived)
+            if len(new_rows) > 0:
+                cache = _update_cache(cache, new_rows, stats)
+                _save_cache(path, cache)
+            elif verbose and (len(parsed) == 0):
+                print(f"using cached output for {len(groups[path])} files in "
+                      f"{os.path.dirname(path)}")
+            caches[path] = cache
+
+    # Assemble output in the same order as fnames. Consecutive files from the same cache (or pack)
+    # are extracted using a single integer indexer, which is much faster than slicing file by file
+    runs = []
+    row_fnames = []
+    for f in fnames:
+        f = os.path.abspath(f)
+        if f in packed:
+            exp, lt, start, stop = packed[f]
+            path = ('pack', exp, lt)
+        elif f in parsed:
+            start, stop = 0, len(parsed[f])
+            path = ('parsed',)
+        elif f in stats:
+            path = paths[f]
+            entry = caches[path]['files'].loc[f]
+            start, stop = entry['start'], entry['stop']
+        else:
+            continue
+        if (len(runs) == 0) or (runs[-1][0] != path):
+            runs.append((path, []))
+        runs[-1][1].append(f if path == ('parsed',) else np.arange(start, stop))
+        if return_fnames:
+            row_fnames.append(np.full(stop - start, f))
+    row_fnames = np.concatenate([np.array([], dtype=str)] + row_fnames)
+    pieces = []
+    for path, idx in runs:
+        if path == ('parsed',):
+            piece = pd.concat([parsed[f] for f in idx], ignore_index=True)
+            if len(piece) > 0:
+                pieces.append(ms.apply_schema(piece.reindex(columns=columns)))
+            continue
+        idx = np.concatenate(idx)
+        if len(idx) == 0:
+            continue
+        if isinstance(path, tuple):
+            piece = mp.read_rows(path[1], path[2], idx, columns=columns)
+            if columns is not None:
+                piece = ms.apply_schema(piece.reindex(columns=columns))
+            pieces.append(piece)
+        elif columns is not None:
+            typed = _typed_columns(path, caches[path]['data'], columns)
+            pieces.append(pd.DataFrame({c: typed[c].values[idx] for c in columns},
+                                       columns=columns))
+        else:
+            pieces.append(caches[path]['data'].iloc[idx])
+    if len(pieces) == 0:
+        df = pd.DataFrame()
+        if columns is not None:
+            df = ms.apply_schema(df.reindex(columns=columns))
+    elif (len(pieces) == 1) and (columns is not None):
+        df = pieces[0]
+    else:
+        df = pd.concat(pieces, ignore_index=True)
+
+        # Categoricals with different categories are not combined as categoricals, and integer
+        # columns with missing values in one piece become floats
+        if columns is not None:
+            redo = [c for c in columns
+                    if ((ms.column_kind(c) == 'category') and
+                        not isinstance(df[c].dtype, pd.CategoricalDtype)) or
+                    (ms.column_kind(c) == 'int')]
+            df = df.assign(**dict(ms.apply_schema(df[redo]).items()))
+
+    if return_fnames:
+        return df, row_fnames
+    else:
+        return df
+
+
+def clear_cache(dirname):
+    """
+    Remove all read_ascii cache files from a directory
+
+    Parameters
+    ----------
+    dirname : string
+        MET output directory
+
+    Returns
+    -------
+    None
+
+    """
+
+    prefix, suffix = cache_fname.split('{line_type}')
+    for f in os.listdir(dirname):
+        if f.startswith(prefix) and f.endswith(suffix):
+            path = os.path.join(dirname, f)
+            os.remove(path)
+            _mem_cache.pop(path, None)
+            _typed.pop(path, None)
+
+
+def install():
+    """
+    Replace metplus_tools.read_ascii with the cached version
+
+    All metplus_plots functions that read MET output will use the cache after this is called.
+
+    Returns
+    -------
+    None
+
+    """
+
+    mt.read_ascii = read_ascii
+
+
+def uninstall():
+    """
+    Restore the original (uncached) metplus_tools.read_ascii
+
+    Returns
+    -------
+    None
+
+    """
+
+    mt.read_ascii = _read_ascii_uncached
+
+
+"""
+End met_cache.py
+"""
@@ -0,0 +1,416 @@
+"""
+Consolidated Per-Experiment Store for GridStat Output
+
+Each experiment has thousands of small GridStat text files, which is slow to archive, transfer, and
+read on parallel file systems. pack_experiment parses all GridStat text output for an experiment
+(every verification subtype, line type, and cycle) once and writes it to a single netCDF file:
+
+    /{line_type}            One group per line type
+        {column}            One variable per MET column. Numeric columns keep the dtype returned by
+                            metplus_tools.read_ascii. Text columns are stored as integer codes into
+                            {column}_categories (so repeated strings are only stored once)
+        file_name           Logical path of each text file, relative to the experiment directory
+        file_start/stop     Rows belonging to each file
+        valid_time          Valid times (s since 1970-01-01)
+        valid_start/stop    Rows belonging to each valid time
+
+Rows are sorted by valid time, so all output for a valid time (or a range of valid times) is read
+with one contiguous read. met_cache.read_ascii reads files from the pack when they are not on disk,
+so metplus_tools functions can use the packs directly after met_cache.install().
+
+Example:
+
+    import osse_utils.met_pack as mp
+    mp.pack_experiment('spring')
+    df = mp.read_pack('spring', 'sl1l2', subtyp='severe_wx_env',
+                      valid_start=dt.datetime(2022, 5, 1), valid_end=dt.datetime(2022, 5, 2))
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+import osse_utils.met_archive as ma
+import osse_utils.gridstat_manifest as gm
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Directory with packed MET output ({exp}.nc)
+packed_dir = os.path.join(os.path.dirname(ma.zipped_dir), 'MET_output_packed')
+
+# Pack format version. Increment if the layout of the packs changes
+pack_version = 1
+
+# Target number of rows per netCDF chunk
+chunk_rows = 65536
+
+# Requested rows separated by more than this many unneeded rows are read separately (rather than as
+# one contiguous range) in read_rows
+max_row_gap = chunk_rows
+
+# Pack indices that have already been opened, keyed by experiment
+_indices = {}
+
+# The netCDF4 library is not thread safe, so reads from different threads (e.g., when prefetching in
+# verif_store) are done one at a time
+_nc_lock = threading.Lock()
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def pack_fname(exp):
+    """
+    Pack file name for an experiment
+    """
+
+    return os.path.join(packed_dir, f"{exp}.nc")
+
+
+def list_subtyps(exp):
+    """
+    Verification subtypes with GridStat output for an experiment (on disk or in the archives)
+    """
+
+    exp_dir = os.path.join(ma.unzipped_dir, exp)
+    if os.path.isdir(exp_dir):
+        return sorted([d for d in os.listdir(exp_dir)
+                       if os.path.isdir(os.path.join(exp_dir, d, 'output', 'GridStat'))])
+
+    index = ma.load_index(exp)
+    if index is None:
+        return []
+    return sorted(set(lpath.split('/')[1] for lpath in index['members']))
+
+
+def _write_column(grp, name, vals, chunks):
+    """
+    Write one DataFrame column to a netCDF group
+    """
+
+    dtype = vals.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        var = grp.createVariable(name, np.int64, ('row',), zlib=True, chunksizes=chunks)
+        var[:] = vals.values.astype('datetime64[ns]').astype(np.int64)
+    elif pd.api.types.is_bool_dtype(dtype):
+        var = grp.createVariable(name, np.int8, ('row',), zlib=True, chunksizes=chunks)
+        var[:] = vals.values.astype(np.int8)
+    elif pd.api.types.is_numeric_dtype(dtype):
+        var = grp.createVariable(name, vals.values.dtype, ('row',), zlib=True, chunksizes=chunks)
+        var[:] = vals.values
+    else:
+        cat = pd.Categorical(vals.astype(object).where(vals.notna(), None))
+        grp.createDimension(f"{name}_ncat", len(cat.categories))
+        cvar = grp.createVariable(f"{name}_categories", str, (f"{name}_ncat",))
+        cvar[:] = np.array([str(c) for c in cat.categories], dtype=object)
+        var = grp.createVariable(name, np.int32, ('row',), zlib=True, chunksizes=chunks)
+        var[:] = cat.codes.astype(np.int32)
+        dtype = 'object'
+    var.setncattr('pandas_dtype', str(dtype))
+
+
+def _read_column(grp, name, rows):
+    """
+    Read one column (for the rows in slice rows) from a netCDF group
+    """
+
+    var = grp.variables[name]
+    var.set_auto_mask(False)
+    vals = var[rows]
+    dtype = var.getncattr('pandas_dtype')
+    if dtype == 'object':
+        cats = grp.variables[f"{name}_categories"][:]
+        out = np.empty(len(vals), dtype=object)
+        out[vals >= 0] = np.asarray(cats, dtype=object)[vals[vals >= 0]]
+        out[vals < 0] = np.nan
+        return out
+    if dtype.startswith('datetime64'):
+        return vals.astype('datetime64[ns]')
+    if dtype == 'bool':
+        return vals.astype(bool)
+
+    return vals
+
+
+def pack_experiment(exp, out_fname=None, overwrite=False, verbose=True):
+    """
+    Pack all GridStat text output for an experiment into one netCDF file
+
+    Parameters
+    ----------
+    exp : string
+        Experiment name (i.e., the directory in MET_output_unzipped or the archive name in
+        MET_output_zipped)
+    out_fname : string, optional
+        Output file name. Default is pack_fname(exp)
+    overwrite : boolean, optional
+        Option to overwrite an existing pack
+    verbose : boolean, optional
+        Option to print progress
+
+    Returns
+    -------
+    string
+        Pack file name
+
+    """
+
+    # Avoid a circular import (met_cache reads from the packs)
+    import osse_utils.met_cache as mc
+
+    if out_fname is None:
+        out_fname = pack_fname(exp)
+    if os.path.isfile(out_fname) and not overwrite:
+        if verbose:
+            print(f"{out_fname} already exists")
+        return out_fname
+
+    # Gather text files by line type, along with the valid time of each file
+    files = {}
+    for subtyp in list_subtyps(exp):
+        dirname = os.path.join(ma.unzipped_dir, exp, subtyp, 'output', 'GridStat')
+        table = gm.get_manifest(dirname).table
+        table = table.loc[table['line_type'] != 'stat']
+        for lt, fname, valid in zip(table['line_type'], table['fname'], table['valid']):
+            files.setdefault(lt, []).append((valid, f"{subtyp}/output/GridStat/{fname}"))
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_fname)), exist_ok=True)
+    tmp_fname = f"{out_fname}.{os.getpid()}.tmp"
+    with nc.Dataset(tmp_fname, 'w') as ds:
+        ds.setncattr('pack_version', pack_version)
+        ds.setncattr('experiment', exp)
+        for lt in sorted(files):
+
+            # Sort files by valid time (then name) so each valid time is contiguous
+            entries = sorted(files[lt])
+            lpaths = [e[1] for e in entries]
+            if verbose:
+                print(f"{exp} {lt}: reading {len(lpaths)} files")
+            fnames = [os.path.join(ma.unzipped_dir, exp, p) for p in lpaths]
+            df, row_fnames = mc.read_ascii(fnames, verbose=False, return_fnames=True)
+
+            # Row ranges for each file and valid time
+            codes = pd.Categorical(row_fnames, categories=[os.path.abspath(f) for f in fnames]).codes
+            counts = np.bincount(codes[codes >= 0], minlength=len(fnames))
+            file_stop = np.cumsum(counts)
+            file_start = file_stop - counts
+            valid_sec = np.array([np.datetime64(e[0], 's').astype(np.int64) for e in entries])
+            valid_time, first = np.unique(valid_sec, return_index=True)
+            last = np.append(first[1:], len(entries)) - 1
+            valid_start = file_start[first]
+            valid_stop = file_stop[last]
+
+            grp = ds.createGroup(lt)
+            grp.createDimension('row', len(df))
+            grp.createDimension('file', len(lpaths))
+            grp.createDimension('valid', len(valid_time))
+            grp.createDimension('column', len(df.columns))
+            chunks = (max(1, min(chunk_rows, len(df))),)
+
+            var = grp.createVariable('columns', str, ('column',))
+            var[:] = np.array(list(df.columns), dtype=object)
+            for c in df.columns:
+                _write_column(grp, c, df[c], chunks)
+
+            var = grp.createVariable('file_name', str, ('file',))
+            var[:] = np.array(lpaths, dtype=object)
+            for name, vals, dim in [('file_start', file_start, 'file'),
+                                    ('file_stop', file_stop, 'file'),
+                                    ('valid_time', valid_time, 'valid'),
+                                    ('valid_start', valid_start, 'valid'),
+                                    ('valid_stop', valid_stop, 'valid')]:
+                var = grp.createVariable(name, np.int64, (dim,))
+                var[:] = vals
+
+    os.replace(tmp_fname, out_fname)
+    _indices.pop(exp, None)
+    if verbose:
+        print(f"wrote {out_fname}")
+
+    return out_fname
+
+
+def load_index(exp):
+    """
+    Load the file and valid time index for a pack
+
+    Parameters
+    ----------
+    exp : string
+        Experiment name
+
+    Returns
+    -------
+    dictionary or None
+        Index with a 'files' entry ({logical path: (line_type, start, stop)}) and a 'line_types'
+        entry ({line_type: {'columns', 'valid_time', 'valid_start', 'valid_stop'}}). None if
+        there is no pack for this experiment
+
+    """
+
+    fname = pack_fname(exp)
+    try:
+        stamp = os.stat(fname).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if (exp in _indices) and (_indices[exp][0] == stamp):
+        return _indices[exp][1]
+
+    index = {'files': {}, 'line_types': {}}
+    with _nc_lock, nc.Dataset(fname, 'r') as ds:
+        if ds.getncattr('pack_version') != pack_version:
+            return None
+        for lt, grp in ds.groups.items():
+            for p, start, stop in zip(grp.variables['file_name'][:], grp.variables['file_start'][:],
+                                      grp.variables['file_stop'][:]):
+                index['files'][f"{exp}/{p}"] = (lt, int(start), int(stop))
+            index['line_types'][lt] = {'columns': list(grp.variables['columns'][:]),
+                                       'valid_time': grp.variables['valid_time'][:],
+                                       'valid_start': grp.variables['valid_start'][:],
+                                       'valid_stop': grp.variables['valid_stop'][:]}
+
+    _indices[exp] = (stamp, index)
+    return index
+
+
+def member_info(fname):
+    """
+    Look up a GridStat text file in the packs
+
+    Parameters
+    ----------
+    fname : string
+        File name (within MET_output_unzipped)
+
+    Returns
+    -------
+    tuple or None
+        (experiment, line_type, start row, stop row). None if the file is not packed
+
+    """
+
+    parts = ma.split_path(fname)
+    if parts is None:
+        return None
+    index = load_index(parts[0])
+    if index is None:
+        return None
+    info = index['files'].get(parts[1], None)
+    if info is None:
+        return None
+
+    return (parts[0],) + info
+
+
+def read_rows(exp, line_type, rows, columns=None):
+    """
+    Read rows from a pack
+
+    Parameters
+    ----------
+    exp : string
+        Experiment name
+    line_type : string
+        MET line type
+    rows : np.array
+        Row indices. Rows that are close together are read as one contiguous range, so only runs of
+        rows separated by less than max_row_gap are read from disk
+    columns : list of strings, optional
+        Columns to return (columns that are not in the pack are filled with NaN). Set to None to
+        return all columns
+
+    Returns
+    -------
+    pd.DataFrame
+        MET output
+
+    """
+
+    rows = np.asarray(rows, dtype=np.int64)
+    available = load_index(exp)['line_types'][line_type]['columns']
+    if columns is None:
+        columns = available
+    if len(rows) == 0:
+        return pd.DataFrame(columns=columns)
+
+    # Split the requested rows into runs separated by large gaps
+    uniq, inverse = np.unique(rows, return_inverse=True)
+    breaks = np.nonzero(np.diff(uniq) > max_row_gap)[0] + 1
+    runs = np.split(uniq, breaks)
+
+    out = {}
+    with _nc_lock, nc.Dataset(pack_fname(exp), 'r') as ds:
+        grp = ds.groups[line_type]
+        for c in columns:
+            if c in available:
+                vals = [_read_column(grp, c, slice(r[0], r[-1] + 1))[r - r[0]] for r in runs]
+                out[c] = np.concatenate(vals)[inverse]
+            else:
+                out[c] = np.full(len(rows), np.nan)
+
+    return pd.DataFrame(out, columns=columns)
+
+
+def read_pack(exp, line_type, subtyp=None, valid_start=None, valid_end=None, columns=None):
+    """
+    Read MET output for a range of valid times from a pack
+
+    Parameters
+    ----------
+    exp : string
+        Experiment name
+    line_type : string
+        MET line type (e.g., 'sl1l2')
+    subtyp : string, optional
+        Verification subtype (e.g., 'lower_atm_below_sfc_mask'). Set to None for all subtypes
+    valid_start, valid_end : dt.datetime, optional
+        First and last valid times (inclusive). Set to None for no limit
+    columns : list of strings, optional
+        Columns to return. Set to None to return all columns
+
+    Returns
+    -------
+    pd.DataFrame
+        MET output, sorted by valid time
+
+    """
+
+    index = load_index(exp)
+    if index is None:
+        raise FileNotFoundError(pack_fname(exp))
+    lt_index = index['line_types'][line_type]
+
+    # Contiguous range of rows for the valid time window
+    valid = lt_index['valid_time']
+    i0 = 0 if valid_start is None else np.searchsorted(valid, gm._seconds(valid_start), 'left')
+    i1 = len(valid) if valid_end is None else np.searchsorted(valid, gm._seconds(valid_end), 'right')
+    if i1 <= i0:
+        return read_rows(exp, line_type, [], columns=columns)
+    lo = lt_index['valid_start'][i0]
+    hi = lt_index['valid_stop'][i1 - 1]
+
+    if subtyp is None:
+        rows = np.arange(lo, hi)
+    else:
+        rows = [np.arange(start, stop) for p, (lt, start, stop) in index['files'].items()
+                if (lt == line_type) and (p.split('/')[1] == subtyp) and (start >= lo) and (stop <= hi)]
+        rows = np.sort(np.concatenate([np.array([], dtype=np.int64)] + rows))
+
+    return read_rows(exp, line_type, rows, columns=columns)
+
+
+"""
+End met_pack.py
+"""
@@ -0,0 +1,180 @@
+"""
+Column Schema and Typed Parsing for MET ASCII Output
+
+Figures only use a handful of MET columns (e.g., FCST_LEAD, FCST_VALID_BEG, FCST_LEV, FCST_VAR,
+VX_MASK, OBTYPE, TOTAL, and the SL1L2/VL1L2 partial sums), but metplus_tools.read_ascii parses every
+column of every file as generic text. The functions here parse only the requested columns using
+fixed dtypes:
+
+    text columns (e.g., FCST_VAR, VX_MASK)      : pd.Categorical (each distinct string stored once)
+    timestamps (e.g., FCST_VALID_BEG)           : datetime64, converted once per distinct value
+    counts (e.g., TOTAL)                        : int64
+    statistics (e.g., FBAR)                     : float64
+
+These are used by met_cache.read_ascii when the columns argument is set.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# MET header columns (shared by all line types)
+header_cols = ['VERSION', 'MODEL', 'DESC', 'FCST_LEAD', 'FCST_VALID_BEG', 'FCST_VALID_END',
+               'OBS_LEAD', 'OBS_VALID_BEG', 'OBS_VALID_END', 'FCST_VAR', 'FCST_UNITS', 'FCST_LEV',
+               'OBS_VAR', 'OBS_UNITS', 'OBS_LEV', 'OBTYPE', 'VX_MASK', 'INTERP_MTHD', 'INTERP_PNTS',
+               'FCST_THRESH', 'OBS_THRESH', 'COV_THRESH', 'ALPHA', 'LINE_TYPE']
+
+# Text columns, stored as categoricals. Lead times are kept as HHMMSS strings
+category_cols = ['VERSION', 'MODEL', 'DESC', 'FCST_LEAD', 'OBS_LEAD', 'FCST_VAR', 'FCST_UNITS',
+                 'FCST_LEV', 'OBS_VAR', 'OBS_UNITS', 'OBS_LEV', 'OBTYPE', 'VX_MASK', 'INTERP_MTHD',
+                 'FCST_THRESH', 'OBS_THRESH', 'COV_THRESH', 'LINE_TYPE']
+
+# Lead time columns (some readers return these as integers, e.g., 10000 rather than '010000')
+lead_cols = ['FCST_LEAD', 'OBS_LEAD']
+
+# Timestamp columns (YYYYmmdd_HHMMSS)
+time_cols = ['FCST_VALID_BEG', 'FCST_VALID_END', 'OBS_VALID_BEG', 'OBS_VALID_END']
+time_fmt = '%Y%m%d_%H%M%S'
+
+# Integer columns
+int_cols = ['INTERP_PNTS', 'TOTAL']
+
+# Statistics columns for each line type (all float64). Columns for line types that are not listed
+# here are parsed as float64 if they are not header columns
+line_type_cols = {'sl1l2': ['FBAR', 'OBAR', 'FOBAR', 'FFBAR', 'OOBAR', 'MAE'],
+                  'sal1l2': ['FABAR', 'OABAR', 'FOABAR', 'FFABAR', 'OOABAR', 'MAE'],
+                  'vl1l2': ['UFBAR', 'VFBAR', 'UOBAR', 'VOBAR', 'UVFOBAR', 'UVFFBAR', 'UVOOBAR',
+                            'F_SPEED_BAR', 'O_SPEED_BAR', 'DIR_ME', 'DIR_MAE', 'DIR_MSE'],
+                  'val1l2': ['UFABAR', 'VFABAR', 'UOABAR', 'VOABAR', 'UVFOABAR', 'UVFFABAR',
+                             'UVOOABAR', 'FA_SPEED_BAR', 'OA_SPEED_BAR', 'DIRA_ME', 'DIRA_MAE',
+                             'DIRA_MSE']}
+
+# Commonly used column subsets
+partial_sum_cols = {'sl1l2': ['FCST_LEAD', 'FCST_VALID_BEG', 'FCST_LEV', 'FCST_VAR', 'FCST_UNITS',
+                              'VX_MASK', 'OBTYPE', 'TOTAL'] + line_type_cols['sl1l2'],
+                    'vl1l2': ['FCST_LEAD', 'FCST_VALID_BEG', 'FCST_LEV', 'FCST_VAR', 'FCST_UNITS',
+                              'VX_MASK', 'OBTYPE', 'TOTAL'] + line_type_cols['vl1l2']}
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def column_kind(col):
+    """
+    Kind of a MET column: 'category', 'time', 'int', or 'float'
+    """
+
+    if col in category_cols:
+        return 'category'
+    elif col in time_cols:
+        return 'time'
+    elif col in int_cols:
+        return 'int'
+    else:
+        return 'float'
+
+
+def parse_columns(src, columns):
+    """
+    Parse selected columns from one MET ASCII (.txt) file
+
+    Values are returned as text (for category and time columns) or floats. apply_schema should be
+    called after all files are combined so that categories and timestamps are only built once.
+
+    Parameters
+    ----------
+    src : string or bytes
+        File name or file contents
+    columns : list of strings
+        Columns to parse. Columns that are not in the file are filled with NaN
+
+    Returns
+    -------
+    pd.DataFrame
+        Parsed columns
+
+    """
+
+    if isinstance(src, bytes):
+        lines = src.decode().splitlines()
+    else:
+        with open(src, 'r') as fptr:
+            lines = fptr.read().splitlines()
+    if len(lines) == 0:
+        return pd.DataFrame(columns=columns)
+
+    # MET ASCII files are whitespace-delimited with one header line. Splitting lines in Python is
+    # much faster than pd.read_csv for the small files written by GridStat
+    header = lines[0].split()
+    rows = [l.split() for l in lines[1:] if l.strip()]
+    out = {}
+    for c in columns:
+        if c not in header:
+            out[c] = np.full(len(rows), np.nan)
+            continue
+        i = header.index(c)
+        vals = [r[i] if i < len(r) else 'NA' for r in rows]
+        if column_kind(c) in ['category', 'time']:
+            out[c] = np.array([np.nan if v == 'NA' else v for v in vals], dtype=object)
+        else:
+            out[c] = np.array([np.nan if v == 'NA' else v for v in vals], dtype=float)
+
+    return pd.DataFrame(out, columns=columns)
+
+
+def apply_schema(df):
+    """
+    Convert columns to the fixed MET dtypes
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        MET output (e.g., from parse_columns or metplus_tools.read_ascii)
+
+    Returns
+    -------
+    pd.DataFrame
+        MET output with categorical, datetime64, int64, and float64 columns
+
+    """
+
+    out = {}
+    for c in df.columns:
+        kind = column_kind(c)
+        vals = df[c]
+        if kind == 'category':
+            if (c in lead_cols) and pd.api.types.is_numeric_dtype(vals):
+                vals = vals.map(lambda x: f"{int(x):06d}" if np.isfinite(x) else np.nan)
+            vals = vals.astype('category')
+        elif kind == 'time':
+            if not pd.api.types.is_datetime64_any_dtype(vals):
+
+                # Only convert each distinct timestamp once
+                cat = vals.astype(str).astype('category')
+                times = pd.to_datetime(cat.cat.categories, format=time_fmt, errors='coerce')
+                vals = pd.Series(np.asarray(times)[cat.cat.codes.values], index=vals.index)
+        elif kind == 'int':
+            vals = pd.to_numeric(vals, errors='coerce')
+            if vals.notna().all():
+                vals = vals.astype(np.int64)
+        else:
+            vals = pd.to_numeric(vals, errors='coerce').astype(np.float64)
+        out[c] = vals
+
+    return pd.DataFrame(out, index=df.index, columns=df.columns)
+
+
+"""
+End met_schema.py
+"""
@@ -0,0 +1,372 @@
+"""
+Gridded Observation Density Cubes
+
+Counts the number of observations in each model column (or in coarser tiles of columns) for each
+pressure layer, ob type, and cycle. Each ob is assigned to the nearest gridpoint using a KD-tree
+that is built once per grid, and counts are accumulated with a single np.bincount per cycle.
+Cycles are processed one at a time and appended to a netCDF file, so memory use does not grow with
+the number of cycles. The result is a cube with dimensions
+
+    time x ob_type x layer x y x x
+
+that can be mapped or reduced (e.g., summed over the horizontal to get the number of obs per
+pressure layer) without reading the obs again. Obs can come from prepbufr CSVs (see
+osse_utils/bufr_io.py) or GSI diag files (see osse_utils/gsi_diag.py).
+
+Example:
+
+    import osse_utils.ob_density as od
+    grid = od.DensityGrid.from_upp(rrfs_fname, pbins=np.arange(500, 1051, 50), ob_types=[136],
+                                   coarsen=10)
+    od.build_density(grid, bufr_fnames, times, '../data/ob_density/uas_35km.nc')
+    cube = od.open_density('../data/ob_density/uas_35km.nc')
+    n_per_layer = cube['count'].sum(dim=['y', 'x'])
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import numpy as np
+import xarray as xr
+import netCDF4 as nc
+import scipy.spatial as sp
+
+import osse_utils.bufr_io as bio
+import osse_utils.gsi_diag as gd
+from osse_utils.upp_region import _grid_key, lat_name, lon_name
+from osse_utils.uas_sites import to_xyz, R_earth
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Units for the time coordinate
+time_units = 'hours since 1970-01-01 00:00:00'
+
+# Columns with the ob location, pressure (hPa), and type in each type of input file
+ob_columns = {'bufr': {'lat': 'YOB', 'lon': 'XOB', 'pres': 'POB', 'typ': 'TYP'},
+              'diag': {'lat': 'Latitude', 'lon': 'Longitude', 'pres': 'Pressure',
+                       'typ': 'Observation_Type'}}
+
+# KD-trees for grids that have already been used, keyed by grid definition
+_kdtrees = {}
+
+
+#---------------------------------------------------------------------------------------------------
+# Classes
+#---------------------------------------------------------------------------------------------------
+
+class DensityGrid():
+    """
+    Horizontal tiles, pressure layers, and ob types used to count obs
+
+    Parameters
+    ----------
+    lat2d, lon2d : np.array
+        2D gridpoint latitudes and longitudes (deg)
+    pbins : array of floats
+        Pressure layer edges (hPa). Obs outside of these layers are not counted
+    ob_types : list of integers, optional
+        Ob types to count separately. Set to None to count all obs together
+    coarsen : integer, optional
+        Number of gridpoints in each direction that are combined into one tile
+    max_dist : float, optional
+        Obs farther than this distance (km) from every gridpoint are not counted. Defaults to twice
+        the grid spacing in the middle of the domain
+
+    """
+
+    def __init__(self, lat2d, lon2d, pbins, ob_types=None, coarsen=1, max_dist=None):
+
+        lat2d = np.asarray(lat2d, dtype=np.float64)
+        lon2d = np.asarray(lon2d, dtype=np.float64)
+        self.grid_shape = lat2d.shape
+        self.coarsen = int(coarsen)
+        self.shape = tuple(-(-n // self.coarsen) for n in self.grid_shape)
+        self.pbins = np.sort(np.asarray(pbins, dtype=np.float64))
+        self.ob_types = None if ob_types is None else np.array(sorted(ob_types), dtype=np.int64)
+
+        key = _grid_key(lat2d, lon2d)
+        if key not in _kdtrees:
+            _kdtrees[key] = sp.cKDTree(to_xyz(lat2d.ravel(), lon2d.ravel()))
+        self.tree = _kdtrees[key]
+
+        if max_dist is None:
+            j, i = self.grid_shape[0] // 2, self.grid_shape[1] // 2
+            xyz = to_xyz(lat2d[j:j+2, i:i+2].ravel(), lon2d[j:j+2, i:i+2].ravel())
+            max_dist = 2 * R_earth * np.linalg.norm(xyz[3] - xyz[0]) / np.sqrt(2)
+        self.max_chord = max_dist / R_earth
+
+        # Tile index for each gridpoint
+        jj, ii = np.indices(self.grid_shape)
+        self.grid_tile = ((jj // self.coarsen) * self.shape[1] + (ii // self.coarsen)).ravel()
+
+        # Tile center latitudes and longitudes (mean of the gridpoints in each tile, computed using
+        # unit vectors so that tiles crossing the dateline are handled correctly)
+        ntile = self.shape[0] * self.shape[1]
+        xyz = to_xyz(lat2d.ravel(), lon2d.ravel())
+        mean = np.column_stack([np.bincount(self.grid_tile, weights=xyz[:, k], minlength=ntile)
+                                for k in range(3)])
+        mean = mean / np.linalg.norm(mean, axis=1)[:, np.newaxis]
+        self.lat = np.rad2deg(np.arcsin(mean[:, 2])).reshape(self.shape)
+        self.lon = np.rad2deg(np.arctan2(mean[:, 1], mean[:, 0])).reshape(self.shape)
+
+
+    @classmethod
+    def from_upp(cls, fname, engine='pynio', **kwargs):
+        """
+        Create a DensityGrid using the grid from a UPP file
+
+        Parameters
+        ----------
+        fname : string
+            UPP GRIB2 file
+        engine : string, optional
+            Engine used to open fname
+        kwargs : optional
+            Other keyword arguments passed to DensityGrid
+
+        Returns
+        -------
+        DensityGrid
+            Grid
+
+        """
+
+        ds = xr.open_dataset(fname, engine=engine)
+        grid = cls(ds[lat_name].values, ds[lon_name].values, **kwargs)
+        ds.close()
+
+        return grid
+
+
+    @property
+    def ntypes(self):
+        return 1 if self.ob_types is None else len(self.ob_types)
+
+
+    @property
+    def nlayers(self):
+        return len(self.pbins) - 1
+
+
+    def tiles(self, lat, lon):
+        """
+        Tile index for each ob (-1 for obs outside the grid)
+
+        Obs at the same location (e.g., obs from the same UAS profile) share one KD-tree query.
+        """
+
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if len(lat) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        loc, inv = np.unique(np.column_stack([lat, lon]), axis=0, return_inverse=True)
+        chord, idx = self.tree.query(to_xyz(loc[:, 0], loc[:, 1]))
+        tile = np.where(chord <= self.max_chord, self.grid_tile[idx], -1)
+
+        return tile[np.ravel(inv)]
+
+
+    def count(self, lat, lon, pres, typ=None):
+        """
+        Count obs in each tile, pressure layer, and ob type
+
+        Parameters
+        ----------
+        lat, lon : np.array
+            Ob locations (deg)
+        pres : np.array
+            Ob pressures (hPa)
+        typ : np.array, optional
+            Ob types. Only needed if ob_types is not None
+
+        Returns
+        -------
+        np.array
+            Counts with dimensions (ob_type, layer, y, x)
+
+        """
+
+        ntile = self.shape[0] * self.shape[1]
+        tile = self.tiles(lat, lon)
+        layer = np.searchsorted(self.pbins, np.asarray(pres, dtype=np.float64), side='right') - 1
+        keep = (tile >= 0) & (layer >= 0) & (layer < self.nlayers)
+
+        if self.ob_types is None:
+            itype = np.zeros(len(tile), dtype=np.int64)
+        else:
+            typ = np.asarray(typ, dtype=np.int64)
+            itype = np.minimum(np.searchsorted(self.ob_types, typ), self.ntypes - 1)
+            keep = keep & (self.ob_types[itype] == typ)
+
+        flat = (itype[keep] * self.nlayers + layer[keep]) * ntile + tile[keep]
+        counts = np.bincount(flat, minlength=self.ntypes * self.nlayers * ntile)
+
+        return counts.reshape((self.ntypes, self.nlayers) + self.shape).astype(np.int32)
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def read_obs(fname, source='bufr', filters={}):
+    """
+    Read the location, pressure, and type of each ob from a prepbufr CSV or GSI diag file
+
+    Parameters
+    ----------
+    fname : string
+        Prepbufr CSV or GSI netCDF diag file
+    source : string, optional
+        Type of file ('bufr' or 'diag')
+    filters : dictionary, optional
+        Row filters (see osse_utils.filters), e.g., {'TYP': 136} or {'Analysis_Use_Flag': 1}
+
+    Returns
+    -------
+    dictionary
+        Arrays of lat, lon, pres (hPa), and typ
+
+    """
+
+    cols = ob_columns[source]
+    if source == 'bufr':
+        df = bio.read_bufr(fname, columns=list(cols.values()), filters=filters)
+    elif source == 'diag':
+        df = gd.read_diag_file(fname, list(cols.values()), filters=filters)
+    else:
+        raise ValueError(f"source must be 'bufr' or 'diag', not {source}")
+
+    return {k: df[c].values for k, c in cols.items()}
+
+
+def _create_file(fname, grid, ob_type_names):
+    """
+    Create an empty density cube with an unlimited time dimension
+    """
+
+    ds = nc.Dataset(fname, 'w')
+    ds.createDimension('time', None)
+    ds.createDimension('ob_type', grid.ntypes)
+    ds.createDimension('layer', grid.nlayers)
+    ds.createDimension('y', grid.shape[0])
+    ds.createDimension('x', grid.shape[1])
+
+    var = ds.createVariable('time', np.float64, ('time',))
+    var.units = time_units
+    var = ds.createVariable('ob_type', str, ('ob_type',))
+    for i, name in enumerate(ob_type_names):
+        var[i] = name
+    for name, vals in zip(['pres_bot', 'pres_top'], [grid.pbins[1:], grid.pbins[:-1]]):
+        var = ds.createVariable(name, np.float64, ('layer',))
+        var.units = 'hPa'
+        var[:] = vals
+    for name, vals in zip(['lat', 'lon'], [grid.lat, grid.lon]):
+        var = ds.createVariable(name, np.float64, ('y', 'x'))
+        var[:] = vals
+
+    var = ds.createVariable('count', np.int32, ('time', 'ob_type', 'layer', 'y', 'x'), zlib=True,
+                            chunksizes=(1, 1, 1) + grid.shape)
+    var.long_name = 'number of obs'
+    ds.coarsen = grid.coarsen
+
+    return ds
+
+
+def build_density(grid, fnames, times, out_fname, source='bufr', filters={}, verbose=True):
+    """
+    Count obs for each cycle and save the counts to a netCDF density cube
+
+    Files are read one at a time, and the counts from each file are written before the next file is
+    read.
+
+    Parameters
+    ----------
+    grid : DensityGrid
+        Grid, pressure layers, and ob types
+    fnames : list of strings
+        Prepbufr CSV or GSI diag file for each cycle
+    times : list of dt.datetime
+        Time of each cycle. Files with the same time are added together
+    out_fname : string
+        Output netCDF file
+    source : string, optional
+        Type of the input files ('bufr' or 'diag')
+    filters : dictionary, optional
+        Row filters applied to each file (see osse_utils.filters)
+    verbose : boolean, optional
+        Option to print progress
+
+    Returns
+    -------
+    None
+
+    """
+
+    if grid.ob_types is None:
+        type_names = ['all']
+    else:
+        type_names = [str(t) for t in grid.ob_types]
+
+    # Write to a temporary file first so readers never see a partial file
+    tmp_fname = f"{out_fname}.{os.getpid()}.tmp"
+    ds = _create_file(tmp_fname, grid, type_names)
+    try:
+        order = sorted(range(len(times)), key=lambda i: times[i])
+        itime = -1
+        last = None
+        for i in order:
+            obs = read_obs(fnames[i], source=source, filters=filters)
+            counts = grid.count(obs['lat'], obs['lon'], obs['pres'], obs['typ'])
+            if times[i] != last:
+                itime = itime + 1
+                last = times[i]
+                ds['time'][itime] = nc.date2num(times[i], time_units)
+            else:
+                counts = counts + ds['count'][itime, ...]
+            ds['count'][itime, ...] = counts
+            if verbose:
+                print(f"{fnames[i]}: {counts.sum()} obs counted")
+    finally:
+        ds.close()
+    os.replace(tmp_fname, out_fname)
+
+
+def open_density(fname, load=True):
+    """
+    Open a density cube
+
+    Parameters
+    ----------
+    fname : string
+        Density cube file name
+    load : boolean, optional
+        Option to read the entire cube into memory. Otherwise, data are read lazily as they are
+        sliced
+
+    Returns
+    -------
+    xr.Dataset
+        Ob counts
+
+    """
+
+    cube = xr.open_dataset(fname)
+    cube = cube.set_coords(['lat', 'lon', 'pres_bot', 'pres_top'])
+    if load:
+        cube = cube.load()
+        cube.close()
+
+    return cube
+
+
+"""
+End ob_density.py
+"""
@@ -0,0 +1,195 @@
+"""
+Autocorrelated (AR(1)) Observation Error Generator
+
+UAS errors in the autocorrelation experiments follow an AR(1) process:
+
+    err[0] = g[0]
+    err[j] = g[j] + A * err[j-1]
+
+where g is Gaussian white noise with standard deviation stdev and A is the autocorrelation. Rather
+than updating one ob at a time, the recursion is applied to entire arrays at once using a linear
+filter (scipy.signal.lfilter), so many profiles and autocorrelation values can be generated quickly.
+
+Example:
+
+    import osse_utils.obs_errors as oe
+    errs = oe.ar1_profiles([0, 0.95, 0.985], niter=10000, nobs=600, stdev=0.5, seed=1)
+    errs[0.95].shape   # (10000, 600)
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import scipy.signal as ss
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def ar1_filter(white, autocorr, axis=-1):
+    """
+    Apply the AR(1) recursion to white noise
+
+    Parameters
+    ----------
+    white : np.array
+        White noise
+    autocorr : float
+        Autocorrelation (A)
+    axis : integer, optional
+        Axis along which the recursion is applied (i.e., the time or ob axis)
+
+    Returns
+    -------
+    np.array
+        AR(1) errors with the same shape as white
+
+    """
+
+    return ss.lfilter([1.], [1., -autocorr], white, axis=axis)
+
+
+def ar1_profiles(autocorr, niter, nobs, stdev=1, seed=None):
+    """
+    Generate batches of AR(1) error profiles for several autocorrelation values
+
+    The same white noise is used for each autocorrelation value, so differences between the
+    profiles are only due to the autocorrelation.
+
+    Parameters
+    ----------
+    autocorr : list of floats
+        Autocorrelation values
+    niter : integer
+        Number of profiles
+    nobs : integer
+        Number of obs in each profile
+    stdev : float, optional
+        Standard deviation of the white noise. Note that the standard deviation of the AR(1)
+        errors is stdev / sqrt(1 - A^2) once the profile is long enough
+    seed : integer or np.random.Generator, optional
+        Seed for the random number generator
+
+    Returns
+    -------
+    dictionary
+        AR(1) errors for each autocorrelation value, each with shape (niter, nobs)
+
+    """
+
+    rng = np.random.default_rng(seed)
+    white = rng.normal(scale=stdev, size=(niter, nobs))
+
+    return {a: ar1_filter(white, a, axis=-1) for a in autocorr}
+
+
+def ar1_grouped(groups, autocorr, stdev=1, seed=None):
+    """
+    Generate AR(1) errors for a 1D array of obs that is split into separate profiles (e.g., all
+    raw UAS obs in a network, where each flight is a separate profile)
+
+    The recursion restarts at the beginning of each group. Obs must already be sorted so that obs
+    from the same group are contiguous and in time order.
+
+    Parameters
+    ----------
+    groups : np.array
+        Group identifier for each ob (e.g., station ID). A new group starts whenever this value
+        changes
+    autocorr : float or list of floats
+        Autocorrelation value(s)
+    stdev : float, optional
+        Standard deviation of the white noise
+    seed : integer or np.random.Generator, optional
+        Seed for the random number generator
+
+    Returns
+    -------
+    np.array or dictionary
+        AR(1) errors for each ob. A dictionary keyed by autocorrelation is returned if autocorr is
+        a list
+
+    """
+
+    groups = np.asarray(groups)
+    n = len(groups)
+    rng = np.random.default_rng(seed)
+    white = rng.normal(scale=stdev, size=n)
+
+    # Index of the first ob in each group and the position of each ob within its group
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = groups[1:] != groups[:-1]
+    start = np.maximum.accumulate(np.where(new_group, np.arange(n), 0))
+    k = np.arange(n) - start
+
+    out = {}
+    for a in np.atleast_1d(autocorr):
+        full = ar1_filter(white, a)
+
+        # Filtering the concatenated series carries err[start-1] into each new group. Remove the
+        # contribution of the previous group, which decays as A^k
+        carry = np.where(start > 0, full[np.maximum(start - 1, 0)], 0.)
+        out[a] = full - carry * np.power(a, k + 1.)
+
+    if np.ndim(autocorr) == 0:
+        return out[autocorr]
+    return out
+
+
+def decorrelation_time(autocorr, thres=1/np.e):
+    """
+    Number of obs needed for the autocorrelation of an AR(1) process to drop below a threshold
+
+    Parameters
+    ----------
+    autocorr : float or np.array
+        Autocorrelation value(s)
+    thres : float, optional
+        Autocorrelation threshold
+
+    Returns
+    -------
+    float or np.array
+        Decorrelation time (in obs). 0 for autocorr = 0
+
+    """
+
+    a = np.asarray(autocorr, dtype=float)
+    with np.errstate(divide='ignore'):
+        out = np.where(a > 0, np.log(thres) / np.log(np.where(a > 0, a, 0.5)), 0.)
+
+    if out.ndim == 0:
+        return float(out)
+    return out
+
+
+def decorrelation_table(autocorr, thres=[1/np.e, 0.01, 0.001]):
+    """
+    Decorrelation times for several autocorrelation values and thresholds
+
+    Parameters
+    ----------
+    autocorr : list of floats
+        Autocorrelation values
+    thres : list of floats, optional
+        Autocorrelation thresholds
+
+    Returns
+    -------
+    dictionary
+        Decorrelation times, keyed by (autocorr, thres)
+
+    """
+
+    times = decorrelation_time(np.array(autocorr)[:, np.newaxis], np.array(thres)[np.newaxis, :])
+    return {(a, t): times[i, j] for i, a in enumerate(autocorr) for j, t in enumerate(thres)}
+
+
+"""
+End obs_errors.py
+"""
@@ -0,0 +1,474 @@
+"""
+Phase Timing and Memory Instrumentation for the Figure Scripts
+
+When the OSSE_PROFILE environment variable is set, functions in the metplus_OSSE_scripts and
+pyDA_utils modules used by the figure scripts (as well as the osse_utils readers, cartopy feature
+loading, and savefig) are wrapped so that each call records:
+
+    wall time       : inclusive (including calls to other instrumented functions) and self time
+    call count      : number of (outermost) calls
+    bytes read      : bytes passed through read system calls during the call (process-wide)
+    peak RSS        : high-water mark of the process resident set size at the end of the call
+
+Each phase is also assigned to a category (read, subset, stats, plot, cartopy, savefig, or other).
+Summing self times by category splits the run time of a script into non-overlapping pieces. At exit,
+a JSON report is written to {OSSE_PROFILE}/{script}.json and a summary table is printed. If
+OSSE_PROFILE is set to 1, reports are written to logs/profile.
+
+make_all_plots.py runs every figure script through this module when OSSE_PROFILE is set (rebuilding
+all requested figures, even if they are up to date) and then combines the reports written during
+that build into {OSSE_PROFILE}/summary.json. Individual scripts can also be profiled
+(from the directory containing the script):
+
+    OSSE_PROFILE=1 PYTHONPATH=.. python -m osse_utils.profiling full_troposphere_verif_vprof.py
+
+Bytes read are counted for the whole process, so reads from background threads (e.g., verif_store
+prefetching) are included in whichever phase is active in the main thread. Phases that run on
+background threads are also timed, so category totals can add up to more than the run time.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import runpy
+import atexit
+import inspect
+import resource
+import importlib
+import functools
+import threading
+import contextlib
+
+import psutil
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Environment variable that switches instrumentation on (and sets the report directory)
+env_var = 'OSSE_PROFILE'
+
+# Default report directory (used if OSSE_PROFILE = 1)
+default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs',
+                           'profile')
+
+# Modules to instrument. All public functions (and the __init__ method of public classes) defined in
+# each module are wrapped. Phases are named {alias}.{function}
+modules = {'metplus_OSSE_scripts.plotting.metplus_plots': 'metplus_plots',
+           'metplus_OSSE_scripts.plotting.metplus_tools': 'metplus_tools',
+           'pyDA_utils.gsi_fcts': 'gsi_fcts',
+           'pyDA_utils.bufr': 'bufr',
+           'pyDA_utils.plot_model_data': 'plot_model_data',
+           'osse_utils.met_cache': 'met_cache',
+           'osse_utils.verif_subset': 'verif_subset',
+           'osse_utils.gsi_diag': 'gsi_diag',
+           'osse_utils.bufr_io': 'bufr_io',
+           'osse_utils.confidence_intervals': 'confidence_intervals',
+           'osse_utils.bootstrap': 'bootstrap'}
+
+# Individual attributes to instrument: (module, attribute path, phase name)
+extra_targets = [('osse_utils.verif_store', 'VerificationStore.read_ascii',
+                  'verif_store.read_ascii'),
+                 ('matplotlib.figure', 'Figure.savefig', 'savefig'),
+                 ('cartopy.feature', 'NaturalEarthFeature.geometries', 'cartopy.geometries'),
+                 ('cartopy.feature', 'NaturalEarthFeature.intersecting_geometries',
+                  'cartopy.intersecting_geometries'),
+                 ('osse_utils.map_features', 'feature_geometries', 'cartopy.feature_geometries')]
+
+# Phase categories, checked in order. Each entry is (category, substrings of the phase name)
+categories = [('savefig', ['savefig']),
+              ('cartopy', ['cartopy.']),
+              ('subset', ['subset']),
+              ('stats', ['stat', 'confidence', 'bootstrap', 'mean_ci', 'vert_avg', '_ci']),
+              ('read', ['read', 'load', 'open', 'bufrCSV', 'diag']),
+              ('plot', ['plot'])]
+
+# Statistics for each phase, keyed by phase name
+_phases = {}
+_lock = threading.Lock()
+
+# Stack of active phases for each thread
+_local = threading.local()
+
+# Original attributes replaced by install(), as (owner, attribute name, original) tuples
+_installed = []
+
+_process = psutil.Process()
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def enabled():
+    """
+    Check whether the OSSE_PROFILE environment variable is set
+    """
+
+    return os.environ.get(env_var, '') not in ['', '0']
+
+
+def report_dir():
+    """
+    Directory for JSON reports
+    """
+
+    val = os.environ.get(env_var, '')
+    return default_dir if val in ['', '0', '1'] else os.path.abspath(val)
+
+
+def category(name):
+    """
+    Category of a phase (read, subset, stats, plot, cartopy, savefig, or other)
+    """
+
+    for cat, keys in categories:
+        if any(k in name for k in keys):
+            return cat
+    return 'other'
+
+
+def _bytes_read():
+    """
+    Bytes read by this process so far
+    """
+
+    try:
+        io = _process.io_counters()
+    except (AttributeError, psutil.Error):
+        return 0
+
+    # read_chars (Linux only) includes reads served from the page cache
+    return getattr(io, 'read_chars', io.read_bytes)
+
+
+def _peak_rss():
+    """
+    Peak resident set size of this process so far (bytes)
+    """
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Record the time, bytes read, and peak RSS of a block of code
+
+    Nested calls to the same phase (e.g., read_ascii calling the original read_ascii) are only
+    counted once.
+
+    Parameters
+    ----------
+    name : string
+        Phase name
+
+    """
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    if any(entry[0] == name for entry in stack):
+        yield
+        return
+
+    # Each stack entry is [name, time spent in child phases]
+    stack.append([name, 0.])
+    start = time.perf_counter()
+    nbytes = _bytes_read()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nbytes = _bytes_read() - nbytes
+        rss = _peak_rss()
+        _, child = stack.pop()
+        if len(stack) > 0:
+            stack[-1][1] += elapsed
+        with _lock:
+            if name not in _phases:
+                _phases[name] = {'category': category(name), 'calls': 0, 'time': 0.,
+                                 'self_time': 0., 'bytes_read': 0, 'peak_rss': 0}
+            stats = _phases[name]
+            stats['calls'] += 1
+            stats['time'] += elapsed
+            stats['self_time'] += elapsed - child
+            stats['bytes_read'] += nbytes
+            stats['peak_rss'] = max(stats['peak_rss'], rss)
+
+
+def timed(name):
+    """
+    Decorator that records each call to a function as a phase
+
+    Parameters
+    ----------
+    name : string
+        Phase name
+
+    """
+
+    def decorator(fct):
+        @functools.wraps(fct)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fct(*args, **kwargs)
+        wrapper._profiling_phase = name
+        return wrapper
+
+    return decorator
+
+
+def _wrap(owner, attr, name):
+    """
+    Replace owner.attr with a timed version
+    """
+
+    fct = inspect.getattr_static(owner, attr)
+    if hasattr(fct, '_profiling_phase'):
+        return
+    if isinstance(fct, (staticmethod, classmethod)):
+        wrapped = type(fct)(timed(name)(fct.__func__))
+    else:
+        wrapped = timed(name)(fct)
+    setattr(owner, attr, wrapped)
+    _installed.append((owner, attr, fct))
+
+
+def install():
+    """
+    Instrument the modules in modules and extra_targets. Modules that cannot be imported are skipped
+
+    Must be called before the figure script imports anything with "from module import function".
+
+    Returns
+    -------
+    None
+
+    """
+
+    for modname, alias in modules.items():
+        try:
+            mod = importlib.import_module(modname)
+        except ImportError:
+            continue
+        for attr, obj in list(vars(mod).items()):
+            if attr.startswith('_') or getattr(obj, '__module__', None) != modname:
+                continue
+            if inspect.isfunction(obj):
+                _wrap(mod, attr, f"{alias}.{attr}")
+            elif inspect.isclass(obj) and ('__init__' in vars(obj)):
+                _wrap(obj, '__init__', f"{alias}.{attr}")
+
+    for modname, path, name in extra_targets:
+        try:
+            owner = importlib.import_module(modname)
+        except ImportError:
+            continue
+        parts = path.split('.')
+        for p in parts[:-1]:
+            owner = getattr(owner, p)
+        if hasattr(owner, parts[-1]):
+            _wrap(owner, parts[-1], name)
+
+
+def uninstall():
+    """
+    Restore all functions replaced by install()
+    """
+
+    while len(_installed) > 0:
+        owner, attr, fct = _installed.pop()
+        setattr(owner, attr, fct)
+
+
+def summarize(phases, total):
+    """
+    Format phase statistics as a table
+
+    Parameters
+    ----------
+    phases : dictionary
+        Statistics for each phase (see phase)
+    total : float
+        Total wall time (s)
+
+    Returns
+    -------
+    string
+        Summary table
+
+    """
+
+    lines = [f"{'phase':50s} {'category':>8s} {'calls':>8s} {'time (s)':>10s} {'self (s)':>10s} "
+             f"{'% total':>8s} {'MB read':>10s} {'peak MB':>9s}"]
+    for name in sorted(phases, key=lambda n: phases[n]['self_time'], reverse=True):
+        s = phases[name]
+        pct = 100 * s['self_time'] / total if total > 0 else 0
+        lines.append(f"{name:50s} {s['category']:>8s} {s['calls']:8d} {s['time']:10.2f} "
+                     f"{s['self_time']:10.2f} {pct:8.1f} {s['bytes_read'] / 1e6:10.1f} "
+                     f"{s['peak_rss'] / 1e6:9.0f}")
+
+    cats = {}
+    for s in phases.values():
+        cats[s['category']] = cats.get(s['category'], 0) + s['self_time']
+    lines.append('')
+    lines.append(f"{'category':50s} {'self (s)':>10s} {'% total':>8s}")
+    for cat in sorted(cats, key=cats.get, reverse=True):
+        pct = 100 * cats[cat] / total if total > 0 else 0
+        lines.append(f"{cat:50s} {cats[cat]:10.2f} {pct:8.1f}")
+
+    return '\n'.join(lines)
+
+
+def write_report(script, total, fname=None):
+    """
+    Write a JSON report for a script and print a summary table
+
+    Parameters
+    ----------
+    script : string
+        Script name
+    total : float
+        Total wall time of the script (s)
+    fname : string, optional
+        Output file name. Defaults to {report_dir()}/{script}.json
+
+    Returns
+    -------
+    None
+
+    """
+
+    if fname is None:
+        fname = os.path.join(report_dir(), f"{os.path.splitext(os.path.basename(script))[0]}.json")
+    with _lock:
+        phases = {n: dict(s) for n, s in _phases.items()}
+    report = {'script': script, 'time': total, 'bytes_read': _bytes_read(),
+              'peak_rss': _peak_rss(), 'written': time.time(), 'phases': phases}
+
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    with open(tmp_fname, 'w') as fptr:
+        json.dump(report, fptr, indent=2)
+    os.replace(tmp_fname, fname)
+
+    print(f"\nProfile for {script} (total = {total:.1f} s, peak RSS = "
+          f"{report['peak_rss'] / 1e6:.0f} MB, read = {report['bytes_read'] / 1e6:.1f} MB)")
+    print(summarize(phases, total))
+    print(f"Profile saved to {fname}")
+
+
+def combine_reports(dirname=None, fname=None, scripts=None, since=None):
+    """
+    Combine the JSON reports from several scripts into a single summary
+
+    Parameters
+    ----------
+    dirname : string, optional
+        Directory containing the reports. Defaults to report_dir()
+    fname : string, optional
+        Output file name. Defaults to {dirname}/summary.json
+    scripts : list of strings, optional
+        Only combine reports for these scripts (names without .py). Set to None to combine reports
+        for all scripts
+    since : float, optional
+        Only combine reports written after this time (s since 1970-01-01), so that reports left
+        over from earlier runs are skipped. Set to None to combine all reports
+
+    Returns
+    -------
+    dictionary
+        Total time, bytes read, and peak RSS for each script, and the self time for each phase
+        category in each script
+
+    """
+
+    if dirname is None:
+        dirname = report_dir()
+    if fname is None:
+        fname = os.path.join(dirname, 'summary.json')
+
+    summary = {}
+    if not os.path.isdir(dirname):
+        return summary
+    for f in sorted(os.listdir(dirname)):
+        if (not f.endswith('.json')) or (os.path.join(dirname, f) == fname):
+            continue
+        if (scripts is not None) and (os.path.splitext(f)[0] not in scripts):
+            continue
+        with open(os.path.join(dirname, f), 'r') as fptr:
+            report = json.load(fptr)
+        if (since is not None) and (report.get('written', 0) < since):
+            continue
+        cats = {}
+        for s in report['phases'].values():
+            cats[s['category']] = cats.get(s['category'], 0) + s['self_time']
+        summary[os.path.splitext(f)[0]] = {'time': report['time'],
+                                           'bytes_read': report['bytes_read'],
+                                           'peak_rss': report['peak_rss'], 'categories': cats}
+
+    with open(fname, 'w') as fptr:
+        json.dump(summary, fptr, indent=2)
+
+    return summary
+
+
+def run_script(script, args=[]):
+    """
+    Run a figure script with instrumentation, writing a report when the script exits
+
+    Parameters
+    ----------
+    script : string
+        Script file name
+    args : list of strings, optional
+        Command-line arguments for the script
+
+    Returns
+    -------
+    None
+
+    """
+
+    install()
+    start = time.perf_counter()
+    atexit.register(lambda: write_report(script, time.perf_counter() - start))
+
+    sys.argv = [script] + list(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    with phase('script'):
+        runpy.run_path(script, run_name='__main__')
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        print(f"usage: {env_var}=1 python -m osse_utils.profiling script.py [args]")
+        sys.exit(1)
+
+    if enabled():
+        run_script(sys.argv[1], sys.argv[2:])
+    else:
+        sys.argv = sys.argv[1:]
+        runpy.run_path(sys.argv[0], run_name='__main__')
+
+
+"""
+End profiling.py
+"""
@@ -0,0 +1,526 @@
+"""
+Synthetic MET, GSI, and Prepbufr Data for Benchmarks
+
+Most of the input data used by the figure scripts is not included in this repo, so this module
+generates synthetic data with the same layout and formats:
+
+    GridStat output     : {out_dir}/MET_output_unzipped/{exp}/{subtyp}/output/GridStat/*_sl1l2.txt
+                          and *_vl1l2.txt (one file per forecast lead and valid time)
+    UAS site locations  : {out_dir}/UAS_sites/uas_site_locs_{spacing}km.txt
+    GSI diag files      : {out_dir}/GSI_diag/{exp}/diag_conv_t_ges.{cycle}.nc4
+    Prepbufr CSVs       : {out_dir}/UAS_obs/uas_obs_{spacing}km/{cycle}.rap.fake.prepbufr.csv
+
+Data volume is set by the number of experiments, cycles, vertical levels, and the UAS network
+spacing (35-400 km). The number of UAS sites scales with the inverse square of the spacing (about
+350 sites at 150 km spacing and 6500 sites at 35 km spacing, as in data/UAS_sites). Values are
+random but physically plausible, and RMSEs decrease as UAS spacing decreases.
+
+Example:
+
+    import osse_utils.synthetic_data as sd
+    info = sd.make_dataset('/tmp/osse_bench', n_exp=4, n_cycles=24, n_levels=20, uas_spacing=35)
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import datetime as dt
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+import osse_utils.met_schema as ms
+import osse_utils.bufr_io as bio
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Domain used for UAS sites and obs (roughly the RRFS CONUS domain)
+lon_range = (-124., -68.)
+lat_range = (25., 49.)
+
+# Area of the domain covered by UAS sites (km^2). Chosen to match the number of sites in
+# data/UAS_sites
+site_area = 8.e6
+
+# UAS network spacings (km) used in the paper
+uas_spacings = [35, 75, 100, 150, 200, 250, 300, 400]
+
+# GridStat file prefix and verification subtype for upper-air output
+file_prefix = 'grid_stat_FV3_TMP_vs_NR_TMP'
+subtyp = 'lower_atm_below_sfc_mask'
+
+# Verification masks
+vx_masks = ['FULL', 'data_mask']
+
+# Forecast variables for each line type: (FCST_VAR, units, typical value at 1000 hPa, typical
+# error)
+gridstat_vars = {'sl1l2': [('TMP', 'K', 288., 1.0), ('SPFH', 'kg/kg', 0.01, 1.e-3)],
+                 'vl1l2': [('UGRD_VGRD', 'm/s', 8., 2.5)]}
+
+# GSI observation types for UAS (thermodynamic) and commercial aircraft
+uas_typ = 136
+aircft_typ = [130, 131, 133, 134, 135]
+
+# Prepbufr CSV columns, in the order written by pyDA_utils.bufr.df_to_csv
+bufr_cols = ['nmsg', 'subset', 'cycletime', 'ntb', 'SID', 'XOB', 'YOB', 'DHR', 'TYP', 'ELV', 'SAID',
+             'T29', 'POB', 'QOB', 'TOB', 'ZOB', 'UOB', 'VOB', 'PWO', 'MXGS', 'HOVI', 'CEILING',
+             'MXTM', 'MNTM', 'TOCC', 'PMO', 'XDR', 'YDR', 'HRDR', 'PQM', 'QQM', 'TQM', 'ZQM', 'WQM',
+             'PWQ', 'PMQ', 'POE', 'QOE', 'TOE', 'WOE', 'PWE', 'TDO', 'RHOB', 'WSPD', 'WDIR']
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def n_uas_sites(spacing):
+    """
+    Number of UAS sites for a network spacing (km)
+    """
+
+    return int(round(site_area / spacing**2))
+
+
+def pressure_levels(n_levels, pmin=100., pmax=1000.):
+    """
+    Pressure levels (hPa) evenly spaced between pmax and pmin, rounded to the nearest 25 hPa when
+    possible
+    """
+
+    plev = np.linspace(pmax, pmin, n_levels)
+    if n_levels <= (pmax - pmin) / 25 + 1:
+        plev = 25 * np.round(plev / 25)
+    return np.unique(plev.astype(int))[::-1]
+
+
+def uas_sites(spacing, seed=0):
+    """
+    UAS site locations drawn uniformly at random over the domain. The number of sites is set so that
+    the site density matches a regular grid with the given spacing
+
+    Parameters
+    ----------
+    spacing : float
+        Distance between sites (km)
+    seed : integer, optional
+        Random seed
+
+    Returns
+    -------
+    lon, lat : np.array
+        Site locations (deg E, deg N)
+
+    """
+
+    rng = np.random.default_rng(seed)
+    n = n_uas_sites(spacing)
+    lat = rng.uniform(lat_range[0], lat_range[1], n)
+    lon = rng.uniform(lon_range[0], lon_range[1], n)
+
+    # Sort by rounded lon/lat so that nearby sites have nearby indices (like the real files)
+    order = np.lexsort((np.round(lat), np.round(lon)))
+    return np.round(lon[order], 3), np.round(lat[order], 3)
+
+
+def write_uas_sites(fname, spacing, seed=0):
+    """
+    Write UAS site locations in the format used in data/UAS_sites
+    """
+
+    lon, lat = uas_sites(spacing, seed=seed)
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    pd.DataFrame({'lon (deg E)': lon, 'lat (deg N)': lat}).to_csv(fname, index=False)
+
+
+def _error_scale(spacing):
+    """
+    Relative forecast error for a UAS network spacing (None = no UAS)
+    """
+
+    if spacing is None:
+        return 1.
+    return 0.7 + 0.3 * min(spacing / 400., 1.)
+
+
+def _gridstat_rows(line_type, lead, valid, plev, err_scale, desc, rng):
+    """
+    Rows of one synthetic GridStat ASCII file
+    """
+
+    lead_str = f"{lead:02d}0000"
+    valid_str = valid.strftime(ms.time_fmt)
+    rows = []
+    for var, units, val, err in gridstat_vars[line_type]:
+        for p in plev:
+            for mask in vx_masks:
+                if mask == 'FULL':
+                    total = int(rng.integers(1.5e6, 2.e6))
+                else:
+                    total = int(rng.integers(1.e5, 3.e5))
+                e = err * err_scale * (1 + 0.05 * lead) * rng.uniform(0.8, 1.2)
+                hdr = ['V11.1.0', 'FV3', desc, lead_str, valid_str, valid_str, '000000', valid_str,
+                       valid_str, var, units, f"P{p}", var, units, f"P{p}", 'NR', mask, 'NEAREST',
+                       '1', 'NA', 'NA', 'NA', 'NA', line_type.upper(), str(total)]
+                if line_type == 'sl1l2':
+                    obar = val * (p / 1000.)**0.3
+                    fbar = obar + rng.normal(0, 0.2 * e)
+                    oobar = obar**2 + (0.1 * obar)**2
+                    ffbar = fbar**2 + (0.1 * obar)**2 + e**2
+                    fobar = 0.5 * (ffbar + oobar - e**2)
+                    stats = [fbar, obar, fobar, ffbar, oobar, 0.8 * e]
+                else:
+                    uo, vo = rng.normal(val, 2., 2)
+                    uf, vf = uo + rng.normal(0, 0.2 * e), vo + rng.normal(0, 0.2 * e)
+                    uvoo = uo**2 + vo**2 + 4.
+                    uvff = uf**2 + vf**2 + 4. + e**2
+                    uvfo = 0.5 * (uvff + uvoo - e**2)
+                    stats = [uf, vf, uo, vo, uvfo, uvff, uvoo, np.hypot(uf, vf), np.hypot(uo, vo)]
+                rows.append(hdr + [f"{s:.5f}" for s in stats])
+    return rows
+
+
+def write_gridstat_file(fname, line_type, lead, valid, plev, err_scale=1., desc='synthetic',
+                        seed=0):
+    """
+    Write one synthetic GridStat ASCII (.txt) file
+
+    Parameters
+    ----------
+    fname : string
+        Output file name
+    line_type : string
+        'sl1l2' or 'vl1l2'
+    lead : integer
+        Forecast lead time (hr)
+    valid : dt.datetime
+        Valid time
+    plev : list of integers
+        Pressure levels (hPa)
+    err_scale : float, optional
+        Relative size of the forecast errors
+    desc : string, optional
+        DESC column
+    seed : integer or list of integers, optional
+        Random seed
+
+    Returns
+    -------
+    None
+
+    """
+
+    rng = np.random.default_rng(seed)
+    cols = ms.header_cols + ['TOTAL'] + {'sl1l2': ms.line_type_cols['sl1l2'],
+                                          'vl1l2': ms.line_type_cols['vl1l2'][:9]}[line_type]
+    rows = _gridstat_rows(line_type, lead, valid, plev, err_scale, desc, rng)
+    with open(fname, 'w') as fptr:
+        fptr.write(' '.join(cols) + '\n')
+        for r in rows:
+            fptr.write(' '.join(r) + '\n')
+
+
+def write_gridstat_tree(out_dir, experiments, valid_times, leads, plev, seed=0):
+    """
+    Write synthetic GridStat output for several experiments
+
+    Parameters
+    ----------
+    out_dir : string
+        Output directory (MET_output_unzipped is created inside this directory)
+    experiments : dictionary
+        UAS network spacing (km) for each experiment (None for no UAS)
+    valid_times : list of dt.datetime
+        Valid times
+    leads : list of integers
+        Forecast lead times (hr)
+    plev : list of integers
+        Pressure levels (hPa)
+    seed : integer, optional
+        Random seed
+
+    Returns
+    -------
+    dictionary
+        Simulation info in the format used in plot_code/verif_sim_info.yml (the 'dir' entries
+        include {typ} and {subtyp} placeholders)
+
+    """
+
+    sim_dict = {}
+    colors = ['k', 'b', 'r', 'g', 'orange', 'purple', 'gray', 'c']
+    for i, (exp, spacing) in enumerate(experiments.items()):
+        gs_dir = os.path.join(out_dir, 'MET_output_unzipped', exp, subtyp, 'output', 'GridStat')
+        os.makedirs(gs_dir, exist_ok=True)
+        for j, valid in enumerate(valid_times):
+            for lead in leads:
+                for k, line_type in enumerate(['sl1l2', 'vl1l2']):
+                    fname = (f"{gs_dir}/{file_prefix}_{lead:02d}0000L_"
+                             f"{valid.strftime(ms.time_fmt)}V_{line_type}.txt")
+                    write_gridstat_file(fname, line_type, lead, valid, plev,
+                                        err_scale=_error_scale(spacing), desc=exp,
+                                        seed=[seed, i, j, lead, k])
+        sim_dict[exp] = {'dir': os.path.join(out_dir, 'MET_output_unzipped', exp, '{subtyp}',
+                                             'output', '{typ}'),
+                         'color': colors[i % len(colors)],
+                         'ls': '-'}
+
+    return sim_dict
+
+
+def _ob_profiles(spacing, n_levels, n_aircft, rng):
+    """
+    Locations and pressures of synthetic UAS and aircraft obs
+
+    Returns
+    -------
+    dictionary
+        Arrays of site index, level within each profile, observation type, lon, lat, elevation,
+        and pressure
+
+    """
+
+    if spacing is None:
+        n_sites = 0
+        lon, lat = np.array([]), np.array([])
+    else:
+        lon, lat = uas_sites(spacing, seed=int(rng.integers(2**31)))
+        n_sites = len(lon)
+
+    # UAS profiles from the surface to 2 km AGL (roughly 1000-800 hPa)
+    elv = rng.uniform(0, 1500, n_sites)
+    psfc = 1013. * np.exp(-elv / 8000.)
+    frac = np.linspace(0, 1, n_levels)
+    pres = (psfc[:, np.newaxis] * (1 - 0.2 * frac[np.newaxis, :])).ravel()
+    site = np.repeat(np.arange(n_sites), n_levels)
+
+    # Aircraft obs anywhere in the troposphere
+    out = {'site': np.concatenate([site, n_sites + np.arange(n_aircft)]),
+           'level': np.concatenate([np.tile(np.arange(n_levels), n_sites), np.zeros(n_aircft)]),
+           'typ': np.concatenate([np.full(len(site), uas_typ),
+                                  rng.choice(aircft_typ, n_aircft)]),
+           'lon': np.concatenate([lon[site], rng.uniform(lon_range[0], lon_range[1], n_aircft)]),
+           'lat': np.concatenate([lat[site], rng.uniform(lat_range[0], lat_range[1], n_aircft)]),
+           'elv': np.concatenate([elv[site], np.zeros(n_aircft)]),
+           'pres': np.concatenate([pres, rng.uniform(150, 1000, n_aircft)])}
+    return out
+
+
+def write_gsi_diag(fname, cycle, spacing, n_levels=50, n_aircft=20000, seed=0):
+    """
+    Write a synthetic conventional temperature GSI netCDF diag file
+
+    Parameters
+    ----------
+    fname : string
+        Output file name
+    cycle : dt.datetime
+        Analysis time
+    spacing : float
+        UAS network spacing (km). Set to None for no UAS obs
+    n_levels : integer, optional
+        Number of obs in each UAS profile
+    n_aircft : integer, optional
+        Number of aircraft obs
+    seed : integer, optional
+        Random seed
+
+    Returns
+    -------
+    None
+
+    """
+
+    rng = np.random.default_rng(seed)
+    obs = _ob_profiles(spacing, n_levels, n_aircft, rng)
+    nobs = len(obs['typ'])
+    hgt = 8000. * np.log(1013. / obs['pres'])
+    tob = 288. - 0.0065 * hgt + rng.normal(0, 2, nobs)
+    omf = rng.normal(0, np.where(obs['typ'] == uas_typ, 0.8, 1.1))
+    use = np.where(rng.uniform(size=nobs) < 0.95, 1, -1)
+    sid = np.array([f"UA{s:06d}" if t == uas_typ else f"AC{s:06d}"
+                    for s, t in zip(obs['site'], obs['typ'])])
+
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    with nc.Dataset(fname, 'w') as ds:
+        ds.setncattr('date_time', int(cycle.strftime('%Y%m%d%H')))
+        ds.createDimension('nobs', nobs)
+        ds.createDimension('Station_ID_maxstrlen', 8)
+        ds.createDimension('Observation_Class_maxstrlen', 7)
+        v = ds.createVariable('Station_ID', 'S1', ('nobs', 'Station_ID_maxstrlen'))
+        v[:] = sid.astype('S8').view('S1').reshape(nobs, 8)
+        v = ds.createVariable('Observation_Class', 'S1', ('nobs', 'Observation_Class_maxstrlen'))
+        v[:] = np.full(nobs, '      t', dtype='S7').view('S1').reshape(nobs, 7)
+        fields = {'Observation_Type': (obs['typ'], 'i4'),
+                  'Observation_Subtype': (np.zeros(nobs), 'i4'),
+                  'Latitude': (obs['lat'], 'f4'),
+                  'Longitude': (obs['lon'] % 360, 'f4'),
+                  'Station_Elevation': (obs['elv'], 'f4'),
+                  'Pressure': (obs['pres'], 'f4'),
+                  'Height': (hgt, 'f4'),
+                  'Time': (rng.uniform(-1, 1, nobs), 'f4'),
+                  'Prep_QC_Mark': (np.full(nobs, 2), 'f4'),
+                  'Prep_Use_Flag': (np.zeros(nobs), 'f4'),
+                  'Analysis_Use_Flag': (use, 'f4'),
+                  'Errinv_Input': (np.full(nobs, 1.), 'f4'),
+                  'Errinv_Adjust': (np.full(nobs, 1.), 'f4'),
+                  'Errinv_Final': (np.where(use > 0, 1., 0.), 'f4'),
+                  'Observation': (tob, 'f4'),
+                  'Obs_Minus_Forecast_adjusted': (omf, 'f4'),
+                  'Obs_Minus_Forecast_unadjusted': (omf, 'f4')}
+        for name, (vals, dtype) in fields.items():
+            v = ds.createVariable(name, dtype, ('nobs',))
+            v[:] = vals
+
+
+def make_bufr_df(cycle, spacing, n_levels=50, n_aircft=20000, seed=0):
+    """
+    Create synthetic prepbufr observations (in the format returned by bufr_io.read_bufr_csv)
+
+    Parameters
+    ----------
+    cycle : dt.datetime
+        Analysis time
+    spacing : float
+        UAS network spacing (km). Set to None for no UAS obs
+    n_levels : integer, optional
+        Number of obs in each UAS profile
+    n_aircft : integer, optional
+        Number of aircraft obs
+    seed : integer, optional
+        Random seed
+
+    Returns
+    -------
+    pd.DataFrame
+        Observations
+
+    """
+
+    rng = np.random.default_rng(seed)
+    obs = _ob_profiles(spacing, n_levels, n_aircft, rng)
+    nobs = len(obs['typ'])
+    hgt = 8000. * np.log(1013. / obs['pres'])
+    tob = 15. - 0.0065 * hgt + rng.normal(0, 2, nobs)
+
+    df = pd.DataFrame({c: np.full(nobs, np.nan) for c in bufr_cols})
+    df['nmsg'] = obs['site'] + 1
+    df['subset'] = np.where(obs['typ'] == uas_typ, 1, 2)
+    df['cycletime'] = float(cycle.strftime('%Y%m%d%H'))
+    df['ntb'] = obs['level'] + 1
+    df['SID'] = [f"'UA{s:06d}'" if t == uas_typ else f"'AC{s:06d}'"
+                 for s, t in zip(obs['site'], obs['typ'])]
+    df['XOB'] = np.round(obs['lon'] % 360, 3)
+    df['YOB'] = np.round(obs['lat'], 3)
+    df['DHR'] = np.round(rng.uniform(-1, 1, nobs), 3)
+    df['TYP'] = obs['typ']
+    df['ELV'] = np.round(obs['elv'], 1)
+    df['T29'] = np.where(obs['typ'] == uas_typ, 31., 41.)
+    df['POB'] = np.round(obs['pres'], 1)
+    df['QOB'] = np.round(10000 * np.exp(-hgt / 2500.), 0)
+    df['TOB'] = np.round(tob, 2)
+    df['ZOB'] = np.round(hgt, 0)
+    for c in ['PQM', 'QQM', 'TQM', 'ZQM']:
+        df[c] = 2.
+    df['POE'] = 1.
+    df['QOE'] = 2.
+    df['TOE'] = np.where(obs['typ'] == uas_typ, 0.8, 1.1)
+
+    for c in bio.int_cols:
+        df[c] = df[c].astype(np.int64)
+    return df
+
+
+def write_bufr_csv(fname, df):
+    """
+    Write prepbufr observations to a CSV in the format written by pyDA_utils.bufr.df_to_csv (one
+    trailing comma on each line)
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    out = df.copy()
+    out[''] = ''
+    out.to_csv(fname, index=False, na_rep='nan')
+
+
+def make_dataset(out_dir, n_exp=4, n_cycles=24, n_levels=20, uas_spacing=35, leads=[0, 1, 2, 3, 6],
+                 start=dt.datetime(2022, 4, 29, 21), seed=0):
+    """
+    Create a full synthetic dataset
+
+    Experiments are named ctrl (no UAS) and uas_{spacing}km. The first UAS experiment uses
+    uas_spacing, and the others use increasingly sparse networks from uas_spacings.
+
+    Parameters
+    ----------
+    out_dir : string
+        Output directory
+    n_exp : integer, optional
+        Number of experiments (including ctrl)
+    n_cycles : integer, optional
+        Number of hourly cycles (valid times)
+    n_levels : integer, optional
+        Number of pressure levels in the GridStat output and obs in each UAS profile
+    uas_spacing : float, optional
+        Spacing of the densest UAS network (km)
+    leads : list of integers, optional
+        Forecast lead times (hr)
+    start : dt.datetime, optional
+        First valid time
+    seed : integer, optional
+        Random seed
+
+    Returns
+    -------
+    dictionary
+        Info about the dataset: 'sim_dict' (verif_sim_info.yml format), 'valid_times', 'leads',
+        'plev', 'experiments' (UAS spacing for each experiment), 'diag_fnames' (keyed by
+        experiment), 'bufr_fnames' (keyed by experiment), and 'site_fnames' (keyed by spacing)
+
+    """
+
+    spacings = [s for s in uas_spacings if s > uas_spacing]
+    experiments = {'ctrl': None}
+    for s in ([uas_spacing] + spacings)[:max(n_exp - 1, 0)]:
+        experiments[f"uas_{s:d}km"] = s
+    valid_times = [start + dt.timedelta(hours=i) for i in range(n_cycles)]
+    plev = pressure_levels(n_levels)
+
+    info = {'experiments': experiments, 'valid_times': valid_times, 'leads': list(leads),
+            'plev': plev, 'diag_fnames': {}, 'bufr_fnames': {}, 'site_fnames': {}}
+    info['sim_dict'] = write_gridstat_tree(out_dir, experiments, valid_times, leads, plev,
+                                           seed=seed)
+
+    # Obs are only written for the first few cycles. They are much larger than the GridStat files
+    ob_cycles = valid_times[:min(3, n_cycles)]
+    for i, (exp, spacing) in enumerate(experiments.items()):
+        info['diag_fnames'][exp] = []
+        info['bufr_fnames'][exp] = []
+        for j, c in enumerate(ob_cycles):
+            tstr = c.strftime('%Y%m%d%H')
+            fname = os.path.join(out_dir, 'GSI_diag', exp, f"diag_conv_t_ges.{tstr}.nc4")
+            write_gsi_diag(fname, c, spacing, n_levels=n_levels, seed=seed + 100*i + j)
+            info['diag_fnames'][exp].append(fname)
+            if spacing is None:
+                continue
+            fname = os.path.join(out_dir, 'UAS_obs', f"uas_obs_{spacing:d}km",
+                                 f"{c.strftime('%Y%m%d%H%M')}.rap.fake.prepbufr.csv")
+            bufr_df = make_bufr_df(c, spacing, n_levels=n_levels, seed=seed + 100*i + j)
+            write_bufr_csv(fname, bufr_df)
+            info['bufr_fnames'][exp].append(fname)
+        if spacing is not None:
+            fname = os.path.join(out_dir, 'UAS_sites', f"uas_site_locs_{spacing:d}km.txt")
+            write_uas_sites(fname, spacing, seed=seed)
+            info['site_fnames'][spacing] = fname
+
+    return info
+
+
+"""
+End synthetic_data.py
+"""
@@ -0,0 +1,470 @@
+"""
+Catalog of UAS Site Networks with Spatial Queries
+
+UAS site locations are stored in data/UAS_sites as one CSV per network spacing
+(uas_site_locs_{spacing}km.txt), with the 35-km network split across several files
+(uas_site_locs_35km.txt1, .txt2, ...). A SiteCatalog holds every network as NumPy arrays and is
+saved to a binary file (.uas_site_catalog.npz) in the same directory, which is rebuilt whenever one
+of the CSVs changes.
+
+Each network also gets a KD-tree built on 3D unit vectors, so that straight-line (chord) distances
+map directly to great-circle distances. This makes the following queries logarithmic in the number
+of sites:
+
+    within_radius   : sites within a great-circle distance of a point
+    in_box          : sites within a lat/lon box
+    nearest         : nearest site(s) to a point
+    per_grid_cell   : number of sites closest to each point of a model grid
+
+Example:
+
+    import osse_utils.uas_sites as us
+    cat = us.load_catalog()
+    sites = cat.sites(35)                       # DataFrame with 'lon (deg E)' and 'lat (deg N)'
+    idx = cat.in_box(35, [-87, -80], [32, 37])
+    dist, idx = cat.nearest(150, 35.2, -97.4)
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import re
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Directory with UAS site CSVs
+sites_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data',
+                         'UAS_sites')
+
+# Binary catalog file name (within the site directory)
+catalog_fname = '.uas_site_catalog.npz'
+
+# Catalog format version. Increment if the layout of the catalog changes
+catalog_version = 1
+
+# Site file names: uas_site_locs_{spacing}km.txt{part}
+fname_re = re.compile(r'^uas_site_locs_(?P<spacing>\d+)km\.txt(?P<part>\d*)$')
+
+# Column names in the site CSVs
+lon_col = 'lon (deg E)'
+lat_col = 'lat (deg N)'
+
+# Earth radius (km)
+R_earth = 6371.
+
+# Catalogs that have already been loaded, keyed by directory
+_catalogs = {}
+
+
+#---------------------------------------------------------------------------------------------------
+# Classes
+#---------------------------------------------------------------------------------------------------
+
+class SiteCatalog():
+    """
+    UAS site locations for several network spacings
+
+    Parameters
+    ----------
+    networks : dictionary
+        (lon, lat) arrays (deg E, deg N) for each network spacing (km)
+
+    """
+
+    def __init__(self, networks):
+
+        self.networks = {int(s): (np.asarray(lon, dtype=np.float64),
+                                  np.asarray(lat, dtype=np.float64))
+                         for s, (lon, lat) in networks.items()}
+        self._trees = {}
+
+
+    def spacings(self):
+        """
+        Network spacings (km) in the catalog, sorted from densest to sparsest
+        """
+
+        return sorted(self.networks.keys())
+
+
+    def __len__(self):
+        return len(self.networks)
+
+
+    def lonlat(self, spacing):
+        """
+        Site longitudes and latitudes (deg E, deg N) for one network
+        """
+
+        return self.networks[int(spacing)]
+
+
+    def sites(self, spacing, idx=None):
+        """
+        Site locations for one network in the same format as the site CSVs
+
+        Parameters
+        ----------
+        spacing : integer
+            Network spacing (km)
+        idx : array of integers, optional
+            Sites to return. Set to None to return all sites
+
+        Returns
+        -------
+        pd.DataFrame
+            Site locations
+
+        """
+
+        lon, lat = self.lonlat(spacing)
+        if idx is not None:
+            lon, lat = lon[idx], lat[idx]
+        return pd.DataFrame({lon_col: lon, lat_col: lat})
+
+
+    def tree(self, spacing):
+        """
+        KD-tree for one network (built the first time it is needed)
+        """
+
+        spacing = int(spacing)
+        if spacing not in self._trees:
+            lon, lat = self.networks[spacing]
+            self._trees[spacing] = cKDTree(to_xyz(lat, lon))
+        return self._trees[spacing]
+
+
+    def within_radius(self, spacing, lat, lon, radius):
+        """
+        Sites within a great-circle distance of a point
+
+        Parameters
+        ----------
+        spacing : integer
+            Network spacing (km)
+        lat, lon : float
+            Point (deg N, deg E)
+        radius : float
+            Great-circle distance (km)
+
+        Returns
+        -------
+        np.array
+            Sorted site indices
+
+        """
+
+        idx = self.tree(spacing).query_ball_point(to_xyz(lat, lon), chord_distance(radius))
+        return np.sort(np.array(idx, dtype=np.int64))
+
+
+    def in_box(self, spacing, lon_lim, lat_lim):
+        """
+        Sites within a lat/lon box
+
+        Parameters
+        ----------
+        spacing : integer
+            Network spacing (km)
+        lon_lim : list of floats
+            Minimum and maximum longitudes (deg E)
+        lat_lim : list of floats
+            Minimum and maximum latitudes (deg N)
+
+        Returns
+        -------
+        np.array
+            Sorted site indices
+
+        """
+
+        # Find candidates within a circle that encloses the box, then check the box exactly
+        clat = 0.5 * (lat_lim[0] + lat_lim[1])
+        clon = 0.5 * (lon_lim[0] + lon_lim[1])
+        corners_lat = np.array([lat_lim[0], lat_lim[0], lat_lim[1], lat_lim[1], lat_lim[0],
+                                lat_lim[1]])
+        corners_lon = np.array([lon_lim[0], lon_lim[1], lon_lim[0], lon_lim[1], clon, clon])
+        radius = great_circle_distance(clat, clon, corners_lat, corners_lon).max()
+        idx = self.within_radius(spacing, clat, clon, radius * 1.0001)
+
+        lon, lat = self.lonlat(spacing)
+        keep = ((lon[idx] >= lon_lim[0]) & (lon[idx] <= lon_lim[1]) &
+                (lat[idx] >= lat_lim[0]) & (lat[idx] <= lat_lim[1]))
+        return idx[keep]
+
+
+    def nearest(self, spacing, lat, lon, k=1):
+        """
+        Nearest site(s) to one or more points
+
+        Parameters
+        ----------
+        spacing : integer
+            Network spacing (km)
+        lat, lon : float or array
+            Points (deg N, deg E)
+        k : integer, optional
+            Number of sites to return for each point
+
+        Returns
+        -------
+        dist : np.array
+            Great-circle distance to each site (km)
+        idx : np.array
+            Site indices
+
+        """
+
+        chord, idx = self.tree(spacing).query(to_xyz(lat, lon), k=k)
+        return arc_distance(chord), idx
+
+
+    def per_grid_cell(self, spacing, grid_lat, grid_lon, max_dist=None):
+        """
+        Number of sites in each cell of a model grid. Each site is assigned to the closest grid
+        point
+
+        Parameters
+        ----------
+        spacing : integer
+            Network spacing (km)
+        grid_lat, grid_lon : np.array
+            Grid point latitudes and longitudes (deg N, deg E), e.g., 2D arrays from a UPP file
+        max_dist : float, optional
+            Sites farther than this distance (km) from every grid point (i.e., outside the grid)
+            are not counted. Set to None to count every site
+
+        Returns
+        -------
+        counts : np.array
+            Number of sites at each grid point (same shape as grid_lat)
+        cell : np.array
+            Flattened grid index for each site (-1 for sites outside the grid)
+
+        """
+
+        grid_lat = np.asarray(grid_lat)
+        lon, lat = self.lonlat(spacing)
+        grid_tree = cKDTree(to_xyz(grid_lat.ravel(), np.asarray(grid_lon).ravel()))
+        chord, cell = grid_tree.query(to_xyz(lat, lon))
+        cell = cell.astype(np.int64)
+        if max_dist is not None:
+            cell[arc_distance(chord) > max_dist] = -1
+
+        counts = np.bincount(cell[cell >= 0], minlength=grid_lat.size)
+        return counts.reshape(grid_lat.shape), cell
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def to_xyz(lat, lon):
+    """
+    Convert latitudes and longitudes (deg) to 3D unit vectors
+    """
+
+    lat = np.deg2rad(np.asarray(lat, dtype=np.float64))
+    lon = np.deg2rad(np.asarray(lon, dtype=np.float64))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_distance(dist):
+    """
+    Convert a great-circle distance (km) to a chord distance on the unit sphere
+    """
+
+    return 2 * np.sin(np.minimum(np.asarray(dist) / R_earth, np.pi) / 2)
+
+
+def arc_distance(chord):
+    """
+    Convert a chord distance on the unit sphere to a great-circle distance (km)
+    """
+
+    return 2 * R_earth * np.arcsin(np.minimum(np.asarray(chord) / 2, 1))
+
+
+def great_circle_distance(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance (km) between points
+    """
+
+    return arc_distance(np.linalg.norm(to_xyz(lat1, lon1) - to_xyz(lat2, lon2), axis=-1))
+
+
+def _site_files(dirname):
+    """
+    Site CSVs in a directory, grouped by network spacing and sorted by part number
+    """
+
+    files = {}
+    for f in os.listdir(dirname):
+        m = fname_re.match(f)
+        if m is None:
+            continue
+        s = int(m.group('spacing'))
+        part = int(m.group('part')) if m.group('part') else 0
+        files.setdefault(s, []).append((part, os.path.join(dirname, f)))
+
+    return {s: [f for _, f in sorted(files[s])] for s in sorted(files)}
+
+
+def _stamp(files):
+    """
+    Names, sizes, and modification times of the site CSVs (used to detect stale catalogs)
+    """
+
+    stamp = []
+    for s in files:
+        for f in files[s]:
+            st = os.stat(f)
+            stamp.append(f"{os.path.basename(f)}|{st.st_size}|{st.st_mtime_ns}")
+    return '\n'.join(stamp)
+
+
+def read_site_csvs(files):
+    """
+    Read site CSVs, concatenating the parts of each network
+
+    Parameters
+    ----------
+    files : dictionary
+        Site CSV names for each network spacing (km)
+
+    Returns
+    -------
+    SiteCatalog
+        Site catalog
+
+    """
+
+    networks = {}
+    for s, fnames in files.items():
+        df = pd.concat([pd.read_csv(f) for f in fnames], ignore_index=True)
+        networks[s] = (df[lon_col].values, df[lat_col].values)
+
+    return SiteCatalog(networks)
+
+
+def save_catalog(cat, fname, stamp=''):
+    """
+    Save a site catalog to a binary (.npz) file
+
+    Parameters
+    ----------
+    cat : SiteCatalog
+        Site catalog
+    fname : string
+        Output file name
+    stamp : string, optional
+        Description of the site CSVs used to build the catalog
+
+    Returns
+    -------
+    None
+
+    """
+
+    spacings = np.array(cat.spacings(), dtype=np.int64)
+    counts = np.array([len(cat.lonlat(s)[0]) for s in spacings], dtype=np.int64)
+    lon = np.concatenate([cat.lonlat(s)[0] for s in spacings] + [np.zeros(0)])
+    lat = np.concatenate([cat.lonlat(s)[1] for s in spacings] + [np.zeros(0)])
+
+    # np.savez adds .npz to file names that do not end in .npz, so the temporary file does too
+    tmp_fname = f"{fname[:-4]}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_fname, version=catalog_version, stamp=stamp, spacings=spacings, counts=counts,
+             lon=lon, lat=lat)
+    os.replace(tmp_fname, fname)
+
+
+def read_catalog(fname):
+    """
+    Read a binary site catalog
+
+    Parameters
+    ----------
+    fname : string
+        Catalog file name
+
+    Returns
+    -------
+    SiteCatalog
+        Site catalog
+    string
+        Description of the site CSVs used to build the catalog
+
+    """
+
+    with np.load(fname) as data:
+        if int(data['version']) != catalog_version:
+            raise ValueError(f"{fname} has catalog version {int(data['version'])}")
+        stops = np.cumsum(data['counts'])
+        starts = stops - data['counts']
+        networks = {}
+        for s, i1, i2 in zip(data['spacings'], starts, stops):
+            networks[int(s)] = (data['lon'][i1:i2], data['lat'][i1:i2])
+        stamp = str(data['stamp'])
+
+    return SiteCatalog(networks), stamp
+
+
+def load_catalog(dirname=sites_dir, rebuild=False):
+    """
+    Load the UAS site catalog, building it from the site CSVs if it is missing or out of date
+
+    Parameters
+    ----------
+    dirname : string, optional
+        Directory with the site CSVs
+    rebuild : boolean, optional
+        Option to rebuild the catalog even if it is up to date
+
+    Returns
+    -------
+    SiteCatalog
+        Site catalog
+
+    """
+
+    dirname = os.path.abspath(dirname)
+    files = _site_files(dirname)
+    stamp = _stamp(files)
+    if (not rebuild) and (dirname in _catalogs) and (_catalogs[dirname][0] == stamp):
+        return _catalogs[dirname][1]
+
+    fname = os.path.join(dirname, catalog_fname)
+    cat = None
+    if (not rebuild) and os.path.isfile(fname):
+        try:
+            cat, saved_stamp = read_catalog(fname)
+            if saved_stamp != stamp:
+                cat = None
+        except (OSError, ValueError, KeyError):
+            cat = None
+
+    if cat is None:
+        cat = read_site_csvs(files)
+        try:
+            save_catalog(cat, fname, stamp=stamp)
+        except OSError as err:
+            print(f"Unable to write UAS site catalog {fname}: {err}")
+
+    _catalogs[dirname] = (stamp, cat)
+    return cat
+
+
+"""
+End uas_sites.py
+"""
@@ -0,0 +1,284 @@
+"""
+Derive Coarser UAS Networks by Thinning the Densest Network
+
+Rather than generating obs from the nature run separately for each UAS network, coarser networks
+can be derived from the 35-km superob UAS obs:
+
+    1. Build a lattice of target points with the desired spacing over the 35-km network
+    2. Select the 35-km site closest to each target point (using the KD-tree in
+       osse_utils.uas_sites), dropping target points that are outside the network
+    3. Drop selected sites that are closer than a minimum separation (0.75 times the target spacing
+       by default) to another selected site, keeping the sites closest to their target points
+    4. Assign each UAS ob to its 35-km site and keep the obs from the selected sites
+
+Steps 2 and 4 are vectorized, so a new network can be created in a few seconds. Instead of a
+lattice, the target points can also be an existing network (e.g., the 150-km sites in the site
+catalog) to create a 35-km-site analog of that network.
+
+Note that the selected sites are 35-km sites, so they are up to ~25 km from the lattice points. For
+target spacings that are not much larger than 35 km, neighboring lattice points often snap to
+nearby 35-km sites, which is why step 3 is needed. The spacing between neighboring sites is
+therefore only approximately the target spacing, but never less than the minimum separation.
+
+Example:
+
+    import osse_utils.uas_sites as us
+    import osse_utils.uas_thinning as uth
+    cat = us.load_catalog()
+    idx = uth.thin_sites(cat, 120)
+    df_120 = uth.thin_obs(df_35, cat, idx)
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+import osse_utils.uas_sites as us
+import osse_utils.bufr_io as bio
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Spacing (km) of the network that is thinned
+base_spacing = 35
+
+# Prepbufr type for UAS thermodynamic obs
+uas_typ = 136
+
+# Distance (km) between 1 deg of latitude
+km_per_deg = np.pi * us.R_earth / 180.
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def lattice(spacing, lon_lim, lat_lim):
+    """
+    Points spaced approximately evenly within a lat/lon box
+
+    Rows are spaced evenly in latitude, and the longitude spacing within each row is scaled by
+    1 / cos(lat) so that points within a row are spacing km apart
+
+    Parameters
+    ----------
+    spacing : float
+        Distance between neighboring points (km)
+    lon_lim : list of floats
+        Minimum and maximum longitudes (deg E)
+    lat_lim : list of floats
+        Minimum and maximum latitudes (deg N)
+
+    Returns
+    -------
+    lon, lat : np.array
+        Lattice points (deg E, deg N)
+
+    """
+
+    row_lat = np.arange(lat_lim[0], lat_lim[1] + 1e-9, spacing / km_per_deg)
+    dlon = spacing / (km_per_deg * np.cos(np.deg2rad(row_lat)))
+    nlon = np.floor((lon_lim[1] - lon_lim[0]) / dlon).astype(np.int64) + 1
+
+    row = np.repeat(np.arange(len(row_lat)), nlon)
+    col = np.arange(nlon.sum()) - np.repeat(np.cumsum(nlon) - nlon, nlon)
+    return lon_lim[0] + col * dlon[row], row_lat[row]
+
+
+def thin_sites(cat, spacing, targets=None, base=base_spacing, max_dist=None, min_sep=None):
+    """
+    Select a subset of sites from the base network with approximately the desired spacing
+
+    Parameters
+    ----------
+    cat : us.SiteCatalog
+        Site catalog
+    spacing : float
+        Target spacing (km)
+    targets : tuple of arrays, optional
+        (lon, lat) of target points (deg E, deg N). Set to None to use a lattice covering the base
+        network
+    base : integer, optional
+        Spacing of the network that is thinned (km)
+    max_dist : float, optional
+        Target points farther than this distance (km) from every base site are dropped. Defaults
+        to half the target spacing
+    min_sep : float, optional
+        Minimum distance (km) between selected sites. Sites closer than this to a site that is
+        closer to its target point are dropped. Defaults to 0.75 times the target spacing. Set to 0
+        to keep all sites
+
+    Returns
+    -------
+    np.array
+        Sorted indices of the selected sites in the base network
+
+    """
+
+    if max_dist is None:
+        max_dist = 0.5 * spacing
+
+    if targets is None:
+        lon, lat = cat.lonlat(base)
+        targets = lattice(spacing, [lon.min(), lon.max()], [lat.min(), lat.max()])
+
+    if min_sep is None:
+        min_sep = 0.75 * spacing
+
+    dist, idx = cat.nearest(base, targets[1], targets[0])
+    keep = dist <= max_dist
+    dist = dist[keep]
+    idx = idx[keep]
+
+    # Each site is only selected once, using its distance to the closest target point
+    order = np.argsort(dist, kind='stable')
+    idx, first = np.unique(idx[order], return_index=True)
+    idx = idx[np.argsort(first)]
+    if (min_sep <= 0) or (len(idx) < 2):
+        return np.sort(idx)
+
+    # Greedily keep sites (closest to their target point first), dropping sites that are within
+    # min_sep of a site that has already been kept
+    lon, lat = cat.lonlat(base)
+    xyz = us.to_xyz(lat[idx], lon[idx])
+    neighbors = cKDTree(xyz).query_ball_point(xyz, us.chord_distance(min_sep) * (1 - 1e-9))
+    dropped = np.zeros(len(idx), dtype=bool)
+    selected = []
+    for i in range(len(idx)):
+        if dropped[i]:
+            continue
+        selected.append(idx[i])
+        dropped[neighbors[i]] = True
+
+    return np.sort(np.array(selected, dtype=np.int64))
+
+
+def ob_sites(df, cat, base=base_spacing, max_dist=None):
+    """
+    Assign each UAS ob to a site in the base network
+
+    Obs are grouped by station ID, and the mean location of each station is matched to the
+    closest site.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Prepbufr observations. Must contain SID, XOB, YOB, and TYP
+    cat : us.SiteCatalog
+        Site catalog
+    base : integer, optional
+        Spacing of the base network (km)
+    max_dist : float, optional
+        Stations farther than this distance (km) from every site are not assigned. Defaults to
+        half the base spacing
+
+    Returns
+    -------
+    np.array
+        Site index for each ob (-1 for obs that are not UAS obs or not assigned to a site)
+
+    """
+
+    if max_dist is None:
+        max_dist = 0.5 * base
+
+    site = np.full(len(df), -1, dtype=np.int64)
+    is_uas = df['TYP'].values == uas_typ
+    if not is_uas.any():
+        return site
+
+    # Mean location of each station
+    codes, sids = pd.factorize(df['SID'].values[is_uas])
+    n = np.bincount(codes, minlength=len(sids))
+    xob = df['XOB'].values[is_uas]
+    xob = np.where(xob > 180, xob - 360, xob)
+    lon = np.bincount(codes, weights=xob, minlength=len(sids)) / n
+    lat = np.bincount(codes, weights=df['YOB'].values[is_uas], minlength=len(sids)) / n
+
+    dist, sid_site = cat.nearest(base, lat, lon)
+    sid_site = np.where(dist <= max_dist, sid_site, -1)
+    site[is_uas] = sid_site[codes]
+
+    return site
+
+
+def thin_obs(df, cat, sites, base=base_spacing, keep_other=False):
+    """
+    Keep UAS obs from a subset of sites
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Prepbufr observations from the base network
+    cat : us.SiteCatalog
+        Site catalog
+    sites : array of integers
+        Indices of the sites to keep in the base network (e.g., output from thin_sites)
+    base : integer, optional
+        Spacing of the base network (km)
+    keep_other : boolean, optional
+        Option to keep obs that are not UAS obs
+
+    Returns
+    -------
+    pd.DataFrame
+        Thinned observations
+
+    """
+
+    site = ob_sites(df, cat, base=base)
+    keep = np.zeros(len(cat.lonlat(base)[0]), dtype=bool)
+    keep[sites] = True
+    mask = (site >= 0) & keep[np.maximum(site, 0)]
+    if keep_other:
+        mask = mask | (df['TYP'].values != uas_typ)
+
+    return df.loc[mask].reset_index(drop=True)
+
+
+def thin_bufr_file(fname, cat, spacing, targets=None, base=base_spacing, keep_other=False):
+    """
+    Read a prepbufr CSV from the base network and thin it to the desired spacing
+
+    Parameters
+    ----------
+    fname : string
+        Prepbufr CSV file name (the binary version is used if available, see bufr_io.read_bufr)
+    cat : us.SiteCatalog
+        Site catalog
+    spacing : float
+        Target spacing (km)
+    targets : tuple of arrays, optional
+        (lon, lat) of target points. See thin_sites
+    base : integer, optional
+        Spacing of the base network (km)
+    keep_other : boolean, optional
+        Option to keep obs that are not UAS obs
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Thinned observations
+    sites : np.array
+        Indices of the selected sites in the base network
+
+    """
+
+    sites = thin_sites(cat, spacing, targets=targets, base=base)
+    filters = {} if keep_other else {'TYP': uas_typ}
+    df = bio.read_bufr(fname, filters=filters)
+
+    return thin_obs(df, cat, sites, base=base, keep_other=keep_other), sites
+
+
+"""
+End uas_thinning.py
+"""
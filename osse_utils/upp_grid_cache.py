@@ -0,0 +1,311 @@
+"""
+Terrain Height and Vertical Level Cache for UPP Output
+
+Several figures look up pressure levels with np.where and recompute heights AGL from full 3D height
+fields in every file, and gsi_fcts.compute_height_agl_diag re-reads an entire natlev GRIB2 file
+just to get the terrain height. Terrain height and the vertical level tables only depend on the
+grid, so they are saved here once per grid in a small NPZ sidecar file and reused afterwards.
+
+Sidecar files are written to data/grid_cache by default (set the OSSE_GRID_CACHE environment
+variable to use a different directory).
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import hashlib
+import numpy as np
+import xarray as xr
+import scipy.spatial as sp
+
+import pyDA_utils.upp_postprocess as uppp
+import pyDA_utils.gsi_fcts as gsi
+from osse_utils.upp_region import dataset_grid_key, lat_name, lon_name
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Directory for sidecar files
+cache_dir = os.environ.get('OSSE_GRID_CACHE',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                                        'grid_cache'))
+
+# UPP field names
+sfc_hgt_name = 'HGT_P0_L1_GLC0'
+prs_hgt_name = 'HGT_P0_L100_GLC0'
+prs_lvl_name = 'lv_ISBL0'
+
+# In-memory caches
+_terrain = {}
+_level_tables = {}
+_kdtrees = {}
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def grid_id(ds):
+    """
+    Short identifier for the grid of a UPP dataset (based on the shape and corner lat/lons). Only
+    the corner points of the 2D lat/lon fields are read
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        UPP output
+
+    Returns
+    -------
+    string
+        Grid identifier
+
+    """
+
+    key = dataset_grid_key(ds)
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+
+
+def _sidecar_fname(gid):
+    return os.path.join(cache_dir, f"{gid}.npz")
+
+
+def _write_sidecar(gid, ds):
+    """
+    Save terrain height and vertical level tables for a grid to a sidecar file
+    """
+
+    out = {'hgt_sfc': _terrain[gid]}
+    for name in ds.coords:
+        if name.startswith('lv_'):
+            out[name] = ds[name].values
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_fname = f"{_sidecar_fname(gid)}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_fname, **out)
+        os.replace(tmp_fname, _sidecar_fname(gid))
+    except OSError as err:
+        print(f"Unable to write grid cache for {gid}: {err}")
+
+
+def level_index(ds, level, level_name=prs_lvl_name):
+    """
+    Find the index of a vertical level using a precomputed lookup table
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        UPP output
+    level : float
+        Vertical level (e.g., pressure in Pa)
+    level_name : string, optional
+        Name of the vertical coordinate
+
+    Returns
+    -------
+    integer
+        Index of the level
+
+    """
+
+    key = (level_name, tuple(ds[level_name].values.tolist()))
+    if key not in _level_tables:
+        _level_tables[key] = {v: i for i, v in enumerate(key[1])}
+    try:
+        return _level_tables[key][level]
+    except KeyError:
+        raise ValueError(f"level {level} not found in {level_name}")
+
+
+def terrain_height(ds, field=sfc_hgt_name):
+    """
+    Get terrain height for the grid of a UPP dataset, using the cache if possible
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        UPP output. Must contain the terrain height field if the grid has not been cached
+    field : string, optional
+        Name of the terrain height field
+
+    Returns
+    -------
+    np.array
+        2D terrain height (m MSL)
+
+    """
+
+    gid = grid_id(ds)
+    if gid in _terrain:
+        return _terrain[gid]
+
+    if os.path.isfile(_sidecar_fname(gid)):
+        with np.load(_sidecar_fname(gid)) as sidecar:
+            _terrain[gid] = sidecar['hgt_sfc']
+            for name in sidecar.files:
+                if name.startswith('lv_'):
+                    levels = tuple(sidecar[name].tolist())
+                    _level_tables[(name, levels)] = {v: i for i, v in enumerate(levels)}
+        return _terrain[gid]
+
+    if field not in ds:
+        raise ValueError(f"{field} is not in the dataset and grid {gid} has not been cached")
+    _terrain[gid] = ds[field].values
+    _write_sidecar(gid, ds)
+
+    return _terrain[gid]
+
+
+def height_agl(ds, level, field=prs_hgt_name, level_name=prs_lvl_name):
+    """
+    Compute the height AGL of a pressure level
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        UPP output
+    level : float
+        Pressure level (Pa)
+    field : string, optional
+        Name of the geopotential height field on pressure levels
+    level_name : string, optional
+        Name of the vertical coordinate
+
+    Returns
+    -------
+    np.array
+        2D height AGL (m)
+
+    """
+
+    zind = level_index(ds, level, level_name=level_name)
+    return ds[field][zind, :, :].values - terrain_height(ds)
+
+
+def compute_ceil_agl(ds, field=sfc_hgt_name, **kwargs):
+    """
+    Wrapper for upp_postprocess.compute_ceil_agl that adds cached terrain height to datasets that
+    do not have it
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        UPP output
+    field : string, optional
+        Name of the terrain height field
+    kwargs : optional
+        Other keyword arguments passed to upp_postprocess.compute_ceil_agl
+
+    Returns
+    -------
+    xr.Dataset
+        UPP output with ceilings AGL
+
+    """
+
+    hgt = terrain_height(ds, field=field)
+    if field not in ds:
+        ds[field] = xr.DataArray(hgt, dims=ds[lat_name].dims)
+
+    return uppp.compute_ceil_agl(ds, **kwargs)
+
+
+def _unit_xyz(lat, lon):
+    """
+    Convert lat/lon (deg) to Cartesian coordinates on the unit sphere
+    """
+
+    lat = np.deg2rad(lat)
+    lon = np.deg2rad(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def compute_height_agl_diag(diag_df, upp_fname, engine='pynio', method='gsi'):
+    """
+    Add a 'Height_AGL' column to a GSI diag DataFrame
+
+    By default (method = 'gsi'), gsi_fcts.compute_height_agl_diag is used (no caching). With
+    method = 'nearest', terrain height at each ob is taken from the nearest gridpoint of the cached
+    terrain, so only the 2D lat/lon fields are read from upp_fname once the grid has been cached.
+    This is not guaranteed to match gsi_fcts.compute_height_agl_diag exactly, but the difference
+    for each ob is bounded by the terrain height variation within one grid cell (use
+    compare_height_agl_diag to check before switching a figure to 'nearest').
+
+    Parameters
+    ----------
+    diag_df : pd.DataFrame
+        GSI diag output (from gsi_fcts.read_diag)
+    upp_fname : string
+        UPP GRIB2 file on the model grid
+    engine : string, optional
+        Engine used to open upp_fname
+    method : string, optional
+        'gsi' or 'nearest'
+
+    Returns
+    -------
+    pd.DataFrame
+        GSI diag output with Height_AGL
+
+    """
+
+    if method == 'gsi':
+        return gsi.compute_height_agl_diag(diag_df, upp_fname)
+    elif method != 'nearest':
+        raise ValueError(f"method must be 'gsi' or 'nearest', not {method}")
+
+    with xr.open_dataset(upp_fname, engine=engine) as ds:
+        gid = grid_id(ds)
+        hgt = terrain_height(ds)
+
+        # Nearest gridpoint, computed using 3D Cartesian coordinates on the unit sphere
+        if gid not in _kdtrees:
+            _kdtrees[gid] = sp.cKDTree(_unit_xyz(ds[lat_name].values.ravel(),
+                                                 ds[lon_name].values.ravel()))
+    _, idx = _kdtrees[gid].query(_unit_xyz(diag_df['Latitude'].values, diag_df['Longitude'].values))
+
+    diag_df['Height_AGL'] = diag_df['Height'].values - hgt.ravel()[idx]
+
+    return diag_df
+
+
+def compare_height_agl_diag(diag_df, upp_fname, engine='pynio'):
+    """
+    Compare heights AGL from the cached nearest-gridpoint terrain with those from
+    gsi_fcts.compute_height_agl_diag
+
+    Parameters
+    ----------
+    diag_df : pd.DataFrame
+        GSI diag output (from gsi_fcts.read_diag)
+    upp_fname : string
+        UPP GRIB2 file on the model grid
+    engine : string, optional
+        Engine used to open upp_fname
+
+    Returns
+    -------
+    dictionary
+        Maximum and mean absolute differences (m) and the number of obs compared
+
+    """
+
+    near = compute_height_agl_diag(diag_df.copy(), upp_fname, engine=engine, method='nearest')
+    ref = compute_height_agl_diag(diag_df.copy(), upp_fname, method='gsi')
+    diff = np.abs(near['Height_AGL'].values - ref['Height_AGL'].values)
+    diff = diff[np.isfinite(diff)]
+
+    return {'max': float(diff.max()) if len(diff) > 0 else np.nan,
+            'mean': float(diff.mean()) if len(diff) > 0 else np.nan,
+            'n': len(diff)}
+
+
+"""
+End upp_grid_cache.py
+"""
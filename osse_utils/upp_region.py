@@ -0,0 +1,219 @@
+"""
+Regional Subsets of UPP GRIB2 Output
+
+Case-study figures only show a small part of the CONUS domain, but reading full GRIB2 files and
+post-processing every gridpoint is slow and uses a lot of memory. The functions here determine the
+grid index window that covers a lat/lon box (once per grid) and open UPP output lazily (with
+dask-backed arrays) so that only that window is read and post-processed.
+
+Example:
+
+    import osse_utils.upp_region as ur
+    window = ur.region_window(fname, [32, 37], [-87, -80])
+    ds = ur.open_upp_region(fname, window, load=True)
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import xarray as xr
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Names of the 2D latitude and longitude fields in UPP output read using PyNIO
+lat_name = 'gridlat_0'
+lon_name = 'gridlon_0'
+
+# Windows that have already been computed, keyed by grid definition and lat/lon box
+_window_cache = {}
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def _grid_key(lat2d, lon2d, shape=None):
+    """
+    Key that identifies a grid using its shape and corner points. lat2d and lon2d can be the full
+    2D fields or only the 2x2 corner points (in which case the grid shape must be provided)
+    """
+
+    if shape is None:
+        shape = lat2d.shape
+    corners = [lat2d[0, 0], lat2d[0, -1], lat2d[-1, 0], lat2d[-1, -1],
+               lon2d[0, 0], lon2d[0, -1], lon2d[-1, 0], lon2d[-1, -1]]
+    return (tuple(shape),) + tuple(np.round(np.array(corners, dtype=float), 4))
+
+
+def dataset_grid_key(ds):
+    """
+    Key that identifies the grid of a UPP dataset. Only the corner points of the 2D lat/lon fields
+    are read
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        UPP output
+
+    Returns
+    -------
+    tuple
+        Grid key
+
+    """
+
+    ydim, xdim = ds[lat_name].dims
+    corners = {ydim: [0, -1], xdim: [0, -1]}
+    return _grid_key(ds[lat_name].isel(corners).values, ds[lon_name].isel(corners).values,
+                     shape=ds[lat_name].shape)
+
+
+def grid_window(lat2d, lon2d, lat_lim, lon_lim, pad=2):
+    """
+    Find the smallest index window that contains all gridpoints within a lat/lon box
+
+    Parameters
+    ----------
+    lat2d, lon2d : np.array
+        2D latitude and longitude (deg)
+    lat_lim : list of floats
+        Minimum and maximum latitude (deg N)
+    lon_lim : list of floats
+        Minimum and maximum longitude (deg E). Can use either the -180 to 180 or 0 to 360 convention
+    pad : integer, optional
+        Number of extra gridpoints to include on each side of the window
+
+    Returns
+    -------
+    list of integers
+        [ystart, ystop, xstart, xstop], suitable for slicing (i.e., stop is exclusive)
+
+    """
+
+    lon2d = np.asarray(lon2d) % 360
+    lon_lim = np.array(lon_lim) % 360
+    inside = ((lat2d >= lat_lim[0]) & (lat2d <= lat_lim[1]) &
+              (lon2d >= lon_lim[0]) & (lon2d <= lon_lim[1]))
+    if not np.any(inside):
+        raise ValueError(f"no gridpoints within lat = {lat_lim}, lon = {lon_lim}")
+
+    rows = np.where(np.any(inside, axis=1))[0]
+    cols = np.where(np.any(inside, axis=0))[0]
+    ny, nx = lat2d.shape
+
+    return [max(rows[0] - pad, 0), min(rows[-1] + pad + 1, ny),
+            max(cols[0] - pad, 0), min(cols[-1] + pad + 1, nx)]
+
+
+def region_window(ds, lat_lim, lon_lim, pad=2, engine='pynio'):
+    """
+    Find the index window covering a lat/lon box for UPP output. Windows are cached by grid, so
+    only the first call for a given grid and box reads the full 2D lat/lon fields (later calls only
+    read the corner points)
+
+    Parameters
+    ----------
+    ds : xr.Dataset or string
+        UPP output or a UPP GRIB2 file name
+    lat_lim, lon_lim : list of floats
+        Latitude and longitude limits (see grid_window)
+    pad : integer, optional
+        Number of extra gridpoints to include on each side of the window
+    engine : string, optional
+        Engine used to open the file (if ds is a file name)
+
+    Returns
+    -------
+    list of integers
+        [ystart, ystop, xstart, xstop]
+
+    """
+
+    if isinstance(ds, str):
+        with xr.open_dataset(ds, engine=engine) as opened:
+            return region_window(opened, lat_lim, lon_lim, pad=pad)
+
+    key = dataset_grid_key(ds) + (tuple(lat_lim), tuple(lon_lim), pad)
+    if key not in _window_cache:
+        _window_cache[key] = grid_window(ds[lat_name].values, ds[lon_name].values, lat_lim,
+                                         lon_lim, pad=pad)
+
+    return list(_window_cache[key])
+
+
+def nested_window(window, start, step):
+    """
+    Map a window on a coarse grid to the corresponding window on a finer grid
+
+    Assumes coarse[j, i] = fine[start[0] + step*j, start[1] + step*i] (e.g., the 3-km RRFS grid is
+    every third point of the 1-km nature run grid). Slicing the fine-grid window with [::step]
+    returns the same points as the coarse-grid window.
+
+    Parameters
+    ----------
+    window : list of integers
+        [ystart, ystop, xstart, xstop] on the coarse grid
+    start : list of integers
+        [y, x] index on the fine grid of the first coarse gridpoint
+    step : integer
+        Ratio of the coarse and fine grid spacings
+
+    Returns
+    -------
+    list of integers
+        [ystart, ystop, xstart, xstop] on the fine grid
+
+    """
+
+    return [start[0] + step*window[0], start[0] + step*(window[1] - 1) + 1,
+            start[1] + step*window[2], start[1] + step*(window[3] - 1) + 1]
+
+
+def open_upp_region(fname, window, fields=None, engine='pynio', chunks={}, load=False):
+    """
+    Open a UPP GRIB2 file, only retaining a window of gridpoints
+
+    Parameters
+    ----------
+    fname : string
+        UPP GRIB2 file name
+    window : list of integers
+        [ystart, ystop, xstart, xstop] (e.g., from region_window)
+    fields : list of strings, optional
+        Fields to keep (2D lat/lon are always kept). Set to None to keep all fields
+    engine : string, optional
+        Engine used to open the file
+    chunks : dictionary, optional
+        Dask chunks. Default ({}) uses the chunking of the file. Set to None to disable dask
+    load : boolean, optional
+        Option to read the window into memory. Needed before modifying field values in place
+
+    Returns
+    -------
+    xr.Dataset
+        UPP output within the window
+
+    """
+
+    ds = xr.open_dataset(fname, engine=engine, chunks=chunks)
+    if fields is not None:
+        ds = ds[list(fields) + [v for v in [lat_name, lon_name] if v not in fields]]
+
+    ydim, xdim = ds[lat_name].dims
+    ds = ds.isel({ydim: slice(window[0], window[1]), xdim: slice(window[2], window[3])})
+    if load:
+        ds = ds.load()
+
+    return ds
+
+
+"""
+End upp_region.py
+"""
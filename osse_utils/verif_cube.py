@@ -0,0 +1,375 @@
+"""
+Pre-Aggregated Verification Statistics Cubes
+
+Most figures reduce SL1L2 or VL1L2 partial sums from the same GridStat output, starting from the
+raw text files every time. The functions here gather the partial sums for one season and
+verification subtype into a single N-dimensional array (a "cube") with dimensions
+
+    experiment x FCST_LEAD x FCST_VALID_BEG x FCST_LEV x VX_MASK x FCST_VAR
+
+which is saved as a chunked, compressed netCDF file. Statistics are then computed by slicing the
+cube and aggregating partial sums with NumPy, rather than by filtering DataFrames.
+
+Partial sums are aggregated the same way as in MET: each partial sum is averaged using TOTAL as the
+weight, and statistics (e.g., RMSE) are computed from the aggregated partial sums. Missing
+combinations (e.g., valid times that were not verified) are NaN and do not contribute.
+
+Example:
+
+    import osse_utils.verif_cube as vc
+    cube = vc.open_cube('../data/verif_cubes/spring_lower_atm_below_sfc_mask_sl1l2.nc')
+    sub = cube.sel(FCST_LEAD=3, FCST_VAR='TMP').drop_sel(VX_MASK='FULL')
+    rmse = vc.compute_stats(vc.vert_avg(sub, vmin=600, vmax=1000, dims=['VX_MASK']))['RMSE']
+
+Cubes are built using other_code/build_verif_cubes.py.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import re
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import osse_utils.met_cache as mc
+import osse_utils.met_archive as ma
+import osse_utils.confidence_intervals as oci
+from osse_utils.verif_store import gridstat_re
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Cube dimensions (in order)
+cube_dims = ['experiment', 'FCST_LEAD', 'FCST_VALID_BEG', 'FCST_LEV', 'VX_MASK', 'FCST_VAR']
+
+# Partial sums saved for each line type. Partial sums that are not in the MET output are skipped
+partial_sums = {'sl1l2': ['TOTAL', 'FBAR', 'OBAR', 'FOBAR', 'FFBAR', 'OOBAR', 'MAE'],
+                'vl1l2': ['TOTAL', 'UFBAR', 'VFBAR', 'UOBAR', 'VOBAR', 'UVFOBAR', 'UVFFBAR',
+                          'UVOOBAR', 'F_SPEED_BAR', 'O_SPEED_BAR']}
+
+# Number of valid times per chunk in the netCDF file
+valid_chunk = 24
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def level_value(lev):
+    """
+    Numeric value of a MET level string (e.g., 'P850' -> 850, 'Z80' -> 80). NaN if the level does
+    not contain a number
+    """
+
+    m = re.search(r'[-+]?\d*\.?\d+', str(lev))
+    return float(m.group(0)) if m is not None else np.nan
+
+
+def _read_gridstat(sim_dir, file_prefix, line_type):
+    """
+    Read all GridStat output for one file prefix and line type in a directory
+
+    Returns a DataFrame with the partial sums and cube coordinates (FCST_LEAD is taken from the
+    file names, in hours)
+    """
+
+    fnames = sorted(ma.glob(f"{sim_dir}/{file_prefix}_*0000L_*V_{line_type}.txt"))
+    if len(fnames) == 0:
+        return pd.DataFrame()
+    df, row_fnames = mc.read_ascii(fnames, verbose=False, return_fnames=True,
+                                   columns=cube_dims[2:] + partial_sums[line_type])
+    if len(df) == 0:
+        return df
+
+    leads = {}
+    for f in np.unique(row_fnames):
+        m = gridstat_re.match(os.path.basename(f))
+        if (m is not None) and (m.group('prefix') == file_prefix):
+            leads[f] = int(m.group('lead'))
+    df = df.assign(FCST_LEAD=pd.Series(row_fnames).map(leads).values)
+    df = df.loc[df['FCST_LEAD'].notna()]
+
+    # Partial sums that are not in the MET output are all NaN
+    cols = [c for c in partial_sums[line_type] if df[c].notna().any()]
+    out = df[cube_dims[1:] + cols].copy()
+    out['FCST_LEAD'] = out['FCST_LEAD'].astype(int)
+    for c in cols:
+        out[c] = out[c].astype(np.float64)
+
+    return out
+
+
+def build_cube(sim_dirs, file_prefixes, line_type, verbose=True):
+    """
+    Build a partial-sums cube from GridStat output
+
+    Parameters
+    ----------
+    sim_dirs : dictionary
+        GridStat output directory for each experiment
+    file_prefixes : list of strings
+        GridStat file prefixes to include (e.g., ['grid_stat_FV3_TMP_vs_NR_TMP'])
+    line_type : string
+        MET line type ('sl1l2' or 'vl1l2')
+    verbose : boolean, optional
+        Option to print progress
+
+    Returns
+    -------
+    xr.Dataset
+        Partial sums with dimensions cube_dims
+
+    """
+
+    dfs = []
+    for exp, sim_dir in sim_dirs.items():
+        for prefix in file_prefixes:
+            df = _read_gridstat(sim_dir, prefix, line_type)
+            if verbose:
+                print(f"{exp} {prefix}: {len(df)} rows")
+            if len(df) > 0:
+                dfs.append(df.assign(experiment=exp))
+    if len(dfs) == 0:
+        raise ValueError(f"no {line_type} output found")
+    df = pd.concat(dfs, ignore_index=True)
+    cols = [c for c in partial_sums[line_type] if c in df.columns]
+
+    # Convert each dimension to integer codes, then scatter the partial sums into the cube
+    coords = {}
+    codes = []
+    for d in cube_dims:
+        if d == 'experiment':
+            cat = pd.Categorical(df[d], categories=list(sim_dirs.keys()))
+        else:
+            cat = pd.Categorical(np.asarray(df[d]))
+        coords[d] = np.asarray(cat.categories)
+        codes.append(cat.codes)
+    shape = tuple(len(coords[d]) for d in cube_dims)
+    flat = np.ravel_multi_index(codes, shape)
+    if len(np.unique(flat)) < len(flat):
+        raise ValueError('GridStat output has more than one row for some cube coordinates')
+
+    data_vars = {}
+    for c in cols:
+        arr = np.full(np.prod(shape), np.nan)
+        arr[flat] = df[c].values
+        data_vars[c] = (cube_dims, arr.reshape(shape))
+
+    cube = xr.Dataset(data_vars, coords=coords)
+    cube = cube.assign_coords(LEV_VALUE=('FCST_LEV', [level_value(l) for l in coords['FCST_LEV']]))
+    cube.attrs['line_type'] = line_type
+    cube.attrs['file_prefixes'] = ' '.join(file_prefixes)
+
+    return cube
+
+
+def write_cube(cube, fname):
+    """
+    Save a partial-sums cube to a chunked, compressed netCDF file
+
+    Parameters
+    ----------
+    cube : xr.Dataset
+        Partial sums (from build_cube)
+    fname : string
+        Output file name
+
+    Returns
+    -------
+    None
+
+    """
+
+    chunks = tuple(min(valid_chunk, n) if d == 'FCST_VALID_BEG' else n
+                   for d, n in zip(cube_dims, [cube.sizes[d] for d in cube_dims]))
+    encoding = {v: {'zlib': True, 'complevel': 4, 'chunksizes': chunks} for v in cube.data_vars}
+
+    # Write to a temporary file first so readers never see a partial file
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    cube.to_netcdf(tmp_fname, encoding=encoding)
+    os.replace(tmp_fname, fname)
+
+
+def open_cube(fname, load=True):
+    """
+    Open a partial-sums cube
+
+    Parameters
+    ----------
+    fname : string
+        Cube file name
+    load : boolean, optional
+        Option to read the entire cube into memory. Otherwise, data are read lazily as they are
+        sliced
+
+    Returns
+    -------
+    xr.Dataset
+        Partial sums
+
+    """
+
+    cube = xr.open_dataset(fname)
+    if load:
+        cube = cube.load()
+        cube.close()
+
+    return cube
+
+
+def aggregate(cube, dims):
+    """
+    Aggregate partial sums over one or more dimensions, weighting by TOTAL
+
+    Parameters
+    ----------
+    cube : xr.Dataset
+        Partial sums
+    dims : string or list of strings
+        Dimensions to aggregate over
+
+    Returns
+    -------
+    xr.Dataset
+        Aggregated partial sums. TOTAL is the sum of TOTAL over dims
+
+    """
+
+    total = cube['TOTAL'].fillna(0)
+    sum_total = total.sum(dim=dims)
+    out = {'TOTAL': sum_total.where(sum_total > 0)}
+    for v in cube.data_vars:
+        if v == 'TOTAL':
+            continue
+        wsum = (cube[v] * total).sum(dim=dims, skipna=True)
+        out[v] = wsum / out['TOTAL']
+
+    return xr.Dataset(out, attrs=cube.attrs)
+
+
+def vert_avg(cube, vmin=None, vmax=None, dims=[]):
+    """
+    Aggregate partial sums over a layer (e.g., 1000-600 hPa)
+
+    Parameters
+    ----------
+    cube : xr.Dataset
+        Partial sums
+    vmin, vmax : float, optional
+        Minimum and maximum level values (e.g., pressure in hPa) to include. Set to None for no limit
+    dims : list of strings, optional
+        Other dimensions to aggregate over at the same time (e.g., ['VX_MASK'])
+
+    Returns
+    -------
+    xr.Dataset
+        Aggregated partial sums
+
+    """
+
+    keep = np.ones(cube.sizes['FCST_LEV'], dtype=bool)
+    if vmin is not None:
+        keep = keep & (cube['LEV_VALUE'].values >= vmin)
+    if vmax is not None:
+        keep = keep & (cube['LEV_VALUE'].values <= vmax)
+
+    return aggregate(cube.isel(FCST_LEV=keep), ['FCST_LEV'] + list(dims))
+
+
+def compute_stats(cube):
+    """
+    Compute statistics from (possibly aggregated) partial sums
+
+    SL1L2 statistics: TOTAL, RMSE, BIAS_DIFF (mean forecast minus mean obs), and MAE
+    VL1L2 statistics: TOTAL, VECT_RMSE, and MAG_BIAS_DIFF (mean forecast speed minus mean obs speed)
+
+    Parameters
+    ----------
+    cube : xr.Dataset
+        Partial sums
+
+    Returns
+    -------
+    xr.Dataset
+        Statistics
+
+    """
+
+    out = {'TOTAL': cube['TOTAL']}
+    if cube.attrs.get('line_type', 'sl1l2') == 'vl1l2':
+        mse = cube['UVFFBAR'] - 2*cube['UVFOBAR'] + cube['UVOOBAR']
+        out['VECT_RMSE'] = np.sqrt(mse.clip(min=0))
+        if ('F_SPEED_BAR' in cube) and ('O_SPEED_BAR' in cube):
+            out['MAG_BIAS_DIFF'] = cube['F_SPEED_BAR'] - cube['O_SPEED_BAR']
+    else:
+        mse = cube['FFBAR'] - 2*cube['FOBAR'] + cube['OOBAR']
+        out['RMSE'] = np.sqrt(mse.clip(min=0))
+        out['BIAS_DIFF'] = cube['FBAR'] - cube['OBAR']
+        if 'MAE' in cube:
+            out['MAE'] = cube['MAE']
+
+    return xr.Dataset(out)
+
+
+def pct_diff(stat, ctrl='ctrl'):
+    """
+    Percent difference of a statistic relative to the control experiment
+
+    Parameters
+    ----------
+    stat : xr.DataArray
+        Statistic with an experiment dimension
+    ctrl : string, optional
+        Name of the control experiment
+
+    Returns
+    -------
+    xr.DataArray
+        100 * (stat - ctrl) / ctrl
+
+    """
+
+    ref = stat.sel(experiment=ctrl)
+    return 100 * (stat - ref) / ref
+
+
+def mean_ci(stat, level=0.95, dim='FCST_VALID_BEG', ci_kw={'acct_lag_corr':True}):
+    """
+    Time-mean of a statistic and the t-distribution confidence interval for the mean
+
+    Parameters
+    ----------
+    stat : xr.DataArray
+        Statistic (e.g., the output from pct_diff)
+    level : float, optional
+        Confidence level
+    dim : string, optional
+        Time dimension
+    ci_kw : dictionary, optional
+        Keyword arguments passed to confidence_intervals.confidence_interval_mean_batch
+
+    Returns
+    -------
+    tuple of xr.DataArray
+        Mean, lower bound, and upper bound
+
+    """
+
+    stat = stat.transpose(..., dim)
+    ci = oci.confidence_interval_mean_batch(stat.values, level=level, ci_kw=ci_kw, axis=-1)
+    template = stat.isel({dim: 0}, drop=True)
+
+    return (stat.mean(dim=dim, skipna=True), template.copy(data=ci[..., 0]),
+            template.copy(data=ci[..., 1]))
+
+
+"""
+End verif_cube.py
+"""
@@ -0,0 +1,390 @@
+"""
+In-Memory Store for MET Verification Output
+
+Profile and dieoff figures call metplus_plots.plot_ua_vprof and plot_sfc_dieoff many times for the
+same experiments, and each call re-reads the same GridStat files. A VerificationStore reads each
+(directory, line_type, lead, file_prefix) slice of GridStat output once and serves all later
+requests for that slice from memory.
+
+If prefetch > 0, slices queued using schedule() are read on a pool of background threads, at most
+prefetch slices ahead of the slice currently being used. This way, the next experiment or forecast
+lead is read while the statistics for the current one are being computed. Slices are still handed
+out in the order they are requested, so figures do not depend on the prefetch setting.
+
+Typical usage in a plotting script:
+
+    import osse_utils.verif_store as vs
+    store = vs.VerificationStore(prefetch=2)
+    store.install()   # metplus_plots functions now read MET output through the store
+    store.schedule(input_sims, fcst_lead, 'grid_stat_FV3_TMP_vs_NR_TMP', 'sl1l2')
+    mp.plot_ua_vprof(input_sims, valid_times, fcst_lead=fcst_lead, ...)
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import re
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+import osse_utils.met_cache as mc
+import osse_utils.gridstat_manifest as gm
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# GridStat ASCII output file names: {file_prefix}_{lead}0000L_{valid}V_{line_type}.txt
+gridstat_re = re.compile(r'^(?P<prefix>.+)_(?P<lead>\d+)0000L_(?P<valid>\d{8}_\d{6})V_(?P<line_type>[a-z0-9]+)\.txt$')
+
+
+#---------------------------------------------------------------------------------------------------
+# Classes
+#---------------------------------------------------------------------------------------------------
+
+class VerificationStore():
+    """
+    Class that holds GridStat output in memory, keyed by GridStat directory, line type, forecast
+    lead time, and file prefix
+
+    Parameters
+    ----------
+    verbose : boolean, optional
+        Option to print when slices are loaded
+    prefetch : integer, optional
+        Maximum number of scheduled slices to read in the background. Set to 0 to read every slice
+        when it is first requested
+
+    """
+
+    def __init__(self, verbose=False, prefetch=0):
+
+        self.verbose = verbose
+        self.prefetch = prefetch
+
+        # Each slice is a dictionary with the following entries:
+        #     'df': DataFrame with output from all files in the slice
+        #     'rows': Dictionary with the (start, stop) rows for each file in df
+        self.slices = {}
+
+        # Slices (key, dirname) queued by schedule() in the order they will be used, and background
+        # reads that are in progress (keyed by slice key)
+        self._queue = []
+        self._pending = {}
+        self._pool = ThreadPoolExecutor(max_workers=prefetch) if prefetch > 0 else None
+
+        self._installed = None
+
+
+    def parse_fname(self, fname):
+        """
+        Determine the slice that a GridStat file belongs to
+
+        Slices are keyed on the absolute directory, so directories with the same experiment and
+        subtyp names under different roots (or with different typs) never share a slice.
+
+        Parameters
+        ----------
+        fname : string
+            GridStat output file name
+
+        Returns
+        -------
+        tuple or None
+            Slice key (dirname, line_type, lead, file_prefix) and the (absolute) directory, or None
+            if the file name does not match the GridStat naming convention
+
+        """
+
+        m = gridstat_re.match(os.path.basename(fname))
+        if m is None:
+            return None
+        dirname = os.path.dirname(os.path.abspath(fname))
+        key = (dirname, m.group('line_type'), int(m.group('lead')), m.group('prefix'))
+        return key, dirname
+
+
+    def _read(self, key, dirname):
+        """
+        Read all files for a slice (called from background threads when prefetching)
+        """
+
+        _, line_type, lead, prefix = key
+        fnames = gm.get_manifest(dirname).files(prefix, line_type, lead)
+        if self.verbose:
+            print(f"loading {len(fnames)} files for {key}")
+        df, row_fnames = mc.read_ascii(fnames, verbose=False, return_fnames=True)
+
+        # Files are read in order, so the rows for each file are contiguous
+        rows = {}
+        if len(row_fnames) > 0:
+            names, starts, counts = np.unique(row_fnames, return_index=True, return_counts=True)
+            for f, s, n in zip(names, starts, counts):
+                rows[f] = (s, s + n)
+        for f in fnames:
+            rows.setdefault(os.path.abspath(f), (0, 0))
+
+        return {'df': df, 'rows': rows}
+
+
+    def _fill(self):
+        """
+        Start background reads for the next queued slices, keeping at most prefetch reads in
+        progress
+        """
+
+        if self._pool is None:
+            return
+
+        # Keep slices that have finished reading. Failed reads are dropped and retried (raising the
+        # error) when the slice is requested
+        for key in list(self._pending.keys()):
+            if self._pending[key].done():
+                fut = self._pending.pop(key)
+                if fut.exception() is None:
+                    self.slices[key] = fut.result()
+        self._queue = [q for q in self._queue if q[0] not in self.slices]
+
+        for key, dirname in self._queue:
+            if len(self._pending) >= self.prefetch:
+                break
+            if key not in self._pending:
+                self._pending[key] = self._pool.submit(self._read, key, dirname)
+
+
+    def load(self, key, dirname):
+        """
+        Read all files for a slice into memory (if not already loaded)
+
+        Parameters
+        ----------
+        key : tuple
+            Slice key (dirname, line_type, lead, file_prefix)
+        dirname : string
+            Directory containing GridStat output for this slice
+
+        Returns
+        -------
+        dictionary
+            Slice
+
+        """
+
+        if key in self.slices:
+            return self.slices[key]
+
+        # Wait for the background read if this slice is being prefetched
+        if key in self._pending:
+            self.slices[key] = self._pending.pop(key).result()
+        else:
+            self.slices[key] = self._read(key, dirname)
+        self._fill()
+
+        return self.slices[key]
+
+
+    def read_ascii(self, fnames, verbose=False):
+        """
+        Read a series of MET output ASCII files, using the store whenever possible
+
+        Drop-in replacement for metplus_tools.read_ascii. Files that do not follow the GridStat
+        naming convention are read using met_cache.read_ascii.
+
+        Parameters
+        ----------
+        fnames : list of strings
+            MET output file names
+        verbose : boolean, optional
+            Option to print extra output
+
+        Returns
+        -------
+        pd.DataFrame
+            Output from all MET files, in the same order as fnames
+
+        """
+
+        # Consecutive files from the same slice are extracted using a single integer indexer
+        runs = []
+        for f in fnames:
+            parsed = self.parse_fname(f)
+            if parsed is None:
+                runs.append((None, [f]))
+                continue
+            key, dirname = parsed
+            slc = self.load(key, dirname)
+            f = os.path.abspath(f)
+            if f not in slc['rows']:
+                if verbose:
+                    print(f"file not found: {f}")
+                continue
+            if (len(runs) == 0) or (runs[-1][0] != key):
+                runs.append((key, []))
+            start, stop = slc['rows'][f]
+            runs[-1][1].append(np.arange(start, stop))
+
+        pieces = []
+        for key, idx in runs:
+            if key is None:
+                pieces.append(mc.read_ascii(idx, verbose=verbose))
+            else:
+                idx = np.concatenate(idx)
+                if len(idx) > 0:
+                    pieces.append(self.slices[key]['df'].iloc[idx])
+        pieces = [p for p in pieces if len(p) > 0]
+        if len(pieces) == 0:
+            return pd.DataFrame()
+
+        return pd.concat(pieces, ignore_index=True)
+
+
+    def get(self, sim_dir, file_prefix, line_type, fcst_lead, valid_times=None):
+        """
+        Extract GridStat output for one experiment and forecast lead time
+
+        Parameters
+        ----------
+        sim_dir : string
+            Directory containing GridStat output (the 'dir' entry in verif_sim_info.yml, with the
+            {typ} and {subtyp} placeholders filled)
+        file_prefix : string
+            GridStat output file prefix
+        line_type : string
+            MET line type (e.g., 'sl1l2')
+        fcst_lead : integer
+            Forecast lead time (hr)
+        valid_times : list of dt.datetime, optional
+            Valid times to extract. Set to None to extract all valid times
+
+        Returns
+        -------
+        pd.DataFrame
+            GridStat output
+
+        """
+
+        if valid_times is None:
+            fname = f"{sim_dir}/{file_prefix}_{fcst_lead:02d}0000L_00000000_000000V_{line_type}.txt"
+            key, dirname = self.parse_fname(fname)
+            return self.load(key, dirname)['df'].copy()
+
+        fnames = ['%s/%s_%02d0000L_%sV_%s.txt' % (sim_dir, file_prefix, fcst_lead,
+                                                  t.strftime('%Y%m%d_%H%M%S'), line_type)
+                  for t in valid_times]
+        return self.read_ascii(fnames)
+
+
+    def schedule(self, sims, fcst_lead, file_prefix, line_type):
+        """
+        Queue slices to be read in the background (only used if prefetch > 0)
+
+        Slices are queued in the order that metplus_plots reads them: each experiment in sims, and
+        within each experiment, each forecast lead time.
+
+        Parameters
+        ----------
+        sims : dictionary
+            Simulation info, as passed to metplus_plots.plot_ua_vprof or plot_sfc_dieoff. The 'dir'
+            entry must have the {typ} and {subtyp} placeholders filled
+        fcst_lead : integer or list of integers
+            Forecast lead times (hr)
+        file_prefix : string
+            GridStat output file prefix
+        line_type : string
+            MET line type (e.g., 'sl1l2')
+
+        Returns
+        -------
+        None
+
+        """
+
+        if self._pool is None:
+            return
+
+        queued = set(q[0] for q in self._queue)
+        for info in sims.values():
+            for lead in np.atleast_1d(fcst_lead):
+                fname = (f"{info['dir']}/{file_prefix}_{int(lead):02d}0000L_00000000_000000V_"
+                         f"{line_type}.txt")
+                key, dirname = self.parse_fname(fname)
+                if (key not in self.slices) and (key not in queued):
+                    self._queue.append((key, dirname))
+                    queued.add(key)
+        self._fill()
+
+
+    def keys(self):
+        """
+        Slices currently held in memory
+        """
+
+        return list(self.slices.keys())
+
+
+    def clear(self):
+        """
+        Remove all slices from memory and drop any queued slices
+        """
+
+        for fut in self._pending.values():
+            fut.cancel()
+        self.slices = {}
+        self._queue = []
+        self._pending = {}
+
+
+    def close(self):
+        """
+        Stop the background threads used for prefetching
+        """
+
+        self.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+    def install(self):
+        """
+        Replace metplus_tools.read_ascii with VerificationStore.read_ascii
+
+        After this is called, metplus_plots functions like plot_ua_vprof and plot_sfc_dieoff read
+        GridStat output through this store.
+
+        Returns
+        -------
+        None
+
+        """
+
+        if self._installed is None:
+            self._installed = mt.read_ascii
+        mt.read_ascii = self.read_ascii
+
+
+    def uninstall(self):
+        """
+        Restore the metplus_tools.read_ascii function that was in place before install()
+
+        Returns
+        -------
+        None
+
+        """
+
+        if self._installed is not None:
+            mt.read_ascii = self._installed
+            self._installed = None
+
+
+"""
+End verif_store.py
+"""
@@ -0,0 +1,370 @@
+"""
+Categorical, Index-Backed Subsetting of MET Verification DataFrames
+
+metplus_tools.subset_verif_df is called repeatedly on the same large DataFrames with parameters
+like {'FCST_VAR': 'TMP', 'not_VX_MASK': 'FULL', 'OBTYPE': 'NR'}, and each call scans every row of
+each (object dtype) column. A verification frame (from as_verif_frame) stores the string key
+columns (FCST_VAR, VX_MASK, OBTYPE, FCST_LEV) as pandas Categoricals. The first time a verification
+frame is subset, its rows are grouped by the category codes of these columns and FCST_LEAD.
+Subsets on the key columns then only need to check which groups match, so each subset costs
+roughly the size of the result rather than the size of the DataFrame. Conditions on other columns
+are only evaluated for rows in the matching groups.
+
+Subset parameters follow metplus_tools.subset_verif_df:
+    {'COL': value}          : rows where COL == value
+    {'not_COL': value}      : rows where COL != value
+
+subset_verif_df only uses the index for verification frames and scalar values. Other DataFrames
+and list-valued parameters are passed to the original metplus_tools.subset_verif_df. Verification
+frames are treated as immutable: an index is rebuilt if the number of rows changes or a key column
+is replaced (e.g., df['FCST_VAR'] = ...), but element-wise writes into a key column (e.g.,
+df.loc[0, 'FCST_VAR'] = ...) are not detected. Checking this is O(1), so each subset costs roughly
+the size of the result.
+
+Building the index costs about as much as one subset, so this only helps when each DataFrame is
+subset several times. Typical usage in a plotting script (reading each set of files once and
+subsetting the result for each variable):
+
+    import osse_utils.verif_subset as vsub
+    vsub.install()   # metplus_tools.read_ascii returns verification frames and
+                     # metplus_tools.subset_verif_df uses the index
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import weakref
+import numpy as np
+import pandas as pd
+
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Columns used to group rows
+index_cols = ['FCST_VAR', 'VX_MASK', 'OBTYPE', 'FCST_LEV', 'FCST_LEAD']
+
+# Key columns stored as Categoricals in verification frames. FCST_LEAD stays numeric so that
+# arithmetic and ordering comparisons still work
+categorical_cols = ['FCST_VAR', 'VX_MASK', 'OBTYPE', 'FCST_LEV']
+
+# Original metplus_tools functions
+_subset_verif_df_orig = mt.subset_verif_df
+_read_ascii_orig = None
+
+# Indices for DataFrames that have already been subset, keyed by id(df)
+_indices = {}
+
+
+#---------------------------------------------------------------------------------------------------
+# Classes
+#---------------------------------------------------------------------------------------------------
+
+class VerifIndex():
+    """
+    Rows of a verification frame grouped by the key columns
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Verification frame (see as_verif_frame)
+
+    """
+
+    def __init__(self, df):
+
+        self.nrows = len(df)
+        self.cols = [c for c in index_cols if c in df.columns]
+        self.arrays = _key_arrays(df)
+
+        # Integer codes for each key column. Missing values get code 0, other values are offset
+        # by one
+        codes = []
+        self.uniques = {}
+        for c in self.cols:
+            if isinstance(df[c].dtype, pd.CategoricalDtype):
+                cd = df[c].cat.codes.values
+                uniq = df[c].cat.categories
+            else:
+                cd, uniq = pd.factorize(df[c])
+            codes.append(cd.astype(np.int64) + 1)
+            self.uniques[c] = np.asarray(uniq, dtype=object)
+        shape = tuple(len(self.uniques[c]) + 1 for c in self.cols)
+
+        # Sort rows by group so each group is a contiguous block of row positions. A stable sort
+        # keeps rows within each group in their original order
+        if len(self.cols) > 0:
+            gid = np.ravel_multi_index(codes, shape)
+        else:
+            gid = np.zeros(self.nrows, dtype=np.int64)
+        self.order = np.argsort(gid, kind='stable')
+        groups, self.starts, counts = np.unique(gid[self.order], return_index=True,
+                                                return_counts=True)
+        self.stops = self.starts + counts
+        self.group_codes = np.unravel_index(groups, shape) if len(self.cols) > 0 else ()
+
+
+    def _allowed(self, col, value, negate):
+        """
+        Boolean array indicating which codes of a key column satisfy a condition
+        """
+
+        match = np.array([u == value for u in self.uniques[col]], dtype=bool)
+
+        # Missing values never equal anything, so they are only kept for negated conditions
+        allowed = np.concatenate([[False], match])
+        return ~allowed if negate else allowed
+
+
+    def rows(self, param):
+        """
+        Row positions that satisfy the conditions on the key columns
+
+        Parameters
+        ----------
+        param : dictionary
+            Subset parameters. Only conditions on the key columns are used
+
+        Returns
+        -------
+        np.array
+            Sorted row positions
+
+        """
+
+        keep = np.ones(len(self.starts), dtype=bool)
+        for key, value in param.items():
+            negate = key.startswith('not_')
+            col = key[4:] if negate else key
+            if col in self.cols:
+                i = self.cols.index(col)
+                keep = keep & self._allowed(col, value, negate)[self.group_codes[i]]
+
+        pieces = [self.order[s:e] for s, e in zip(self.starts[keep], self.stops[keep])]
+        if len(pieces) == 0:
+            return np.array([], dtype=np.int64)
+
+        return np.sort(np.concatenate(pieces))
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def is_verif_frame(df):
+    """
+    Check whether a DataFrame is a verification frame (all key columns that are present are
+    Categoricals)
+    """
+
+    cols = [c for c in categorical_cols if c in df.columns]
+    return (len(cols) > 0) and all(isinstance(df[c].dtype, pd.CategoricalDtype) for c in cols)
+
+
+def _key_arrays(df):
+    """
+    Arrays backing the key columns of a DataFrame (Categoricals or NumPy arrays)
+    """
+
+    return {c: (df[c].array if isinstance(df[c].dtype, pd.CategoricalDtype) else df[c].values)
+            for c in index_cols if c in df.columns}
+
+
+def _same_array(a, b):
+    """
+    Check whether two arrays are the same object (or NumPy views of the same memory)
+    """
+
+    if isinstance(a, np.ndarray) and isinstance(b, np.ndarray):
+        return ((a.__array_interface__['data'][0] == b.__array_interface__['data'][0]) and
+                (a.shape == b.shape) and (a.strides == b.strides) and (a.dtype == b.dtype))
+    return a is b
+
+
+def _index_valid(index, df):
+    """
+    O(1) check that an index still describes a DataFrame (same length and key column arrays)
+    """
+
+    if len(df) != index.nrows:
+        return False
+    arrays = _key_arrays(df)
+    return ((arrays.keys() == index.arrays.keys()) and
+            all(_same_array(arrays[c], index.arrays[c]) for c in arrays))
+
+
+def _supported(df, param):
+    """
+    Check whether subset parameters can be handled using the index
+    """
+
+    if not is_verif_frame(df):
+        return False
+    for key, value in param.items():
+        col = key[4:] if key.startswith('not_') else key
+        if col not in df.columns:
+            return False
+        if not pd.api.types.is_scalar(value):
+            return False
+    return True
+
+
+def get_index(df):
+    """
+    Get the group index for a DataFrame, building it if needed
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Verification frame
+
+    Returns
+    -------
+    VerifIndex
+        Group index
+
+    """
+
+    key = id(df)
+    if key in _indices:
+        ref, index = _indices[key]
+        if (ref() is df) and _index_valid(index, df):
+            return index
+
+    index = VerifIndex(df)
+    _indices[key] = (weakref.ref(df, lambda r, k=key: _indices.pop(k, None)), index)
+    return index
+
+
+def as_verif_frame(df):
+    """
+    Convert the string key columns of a verification DataFrame to pandas Categoricals
+
+    Categorical key columns use much less memory than object columns, and subset_verif_df can use
+    an index built from the category codes.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        MET verification output
+
+    Returns
+    -------
+    pd.DataFrame
+        df if it is already a verification frame, otherwise a copy of df with categorical key
+        columns
+
+    """
+
+    if is_verif_frame(df) or not any(c in df.columns for c in categorical_cols):
+        return df
+
+    out = df.copy()
+    for c in categorical_cols:
+        if (c in out.columns) and not isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype('category')
+
+    return out
+
+
+def subset_verif_df(df, param):
+    """
+    Subset a verification DataFrame, using the group index for verification frames
+
+    Drop-in replacement for metplus_tools.subset_verif_df. DataFrames that are not verification
+    frames, and parameters that cannot be handled using the index (e.g., columns that are not in
+    df or values that are not scalars), are passed to the original function.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        MET verification output
+    param : dictionary
+        Subset parameters (see module docstring)
+
+    Returns
+    -------
+    pd.DataFrame
+        Subset of df. Unused categories are removed from the key columns, so that grouping by a key
+        column only gives groups that are in the subset
+
+    """
+
+    if (len(df) == 0) or (not _supported(df, param)):
+        return _subset_verif_df_orig(df, param)
+
+    index = get_index(df)
+    rows = index.rows(param)
+
+    # Conditions on columns that are not in the index are only checked for the remaining rows
+    other = {k: v for k, v in param.items()
+             if (k[4:] if k.startswith('not_') else k) not in index.cols}
+    if len(other) > 0:
+        mask = np.ones(len(rows), dtype=bool)
+        for key, value in other.items():
+            negate = key.startswith('not_')
+            m = (df[key[4:] if negate else key].values[rows] == value)
+            mask = mask & (~m if negate else m)
+        rows = rows[mask]
+
+    out = df.iloc[rows]
+    return out.assign(**{c: out[c].cat.remove_unused_categories() for c in categorical_cols
+                         if c in out.columns})
+
+
+def read_ascii(*args, **kwargs):
+    """
+    Wrapper for metplus_tools.read_ascii (as installed when install() was called) that returns
+    verification frames
+    """
+
+    out = _read_ascii_orig(*args, **kwargs)
+    if isinstance(out, tuple):
+        return (as_verif_frame(out[0]),) + out[1:]
+    return as_verif_frame(out)
+
+
+def install():
+    """
+    Make metplus_tools.read_ascii return verification frames and replace
+    metplus_tools.subset_verif_df with the index-backed version
+
+    Call after any other module that replaces metplus_tools.read_ascii (e.g., met_cache.install).
+
+    Returns
+    -------
+    None
+
+    """
+
+    global _read_ascii_orig
+    if mt.read_ascii is not read_ascii:
+        _read_ascii_orig = mt.read_ascii
+        mt.read_ascii = read_ascii
+    mt.subset_verif_df = subset_verif_df
+
+
+def uninstall():
+    """
+    Restore the original metplus_tools.read_ascii and subset_verif_df
+
+    Returns
+    -------
+    None
+
+    """
+
+    if (mt.read_ascii is read_ascii) and (_read_ascii_orig is not None):
+        mt.read_ascii = _read_ascii_orig
+    mt.subset_verif_df = _subset_verif_df_orig
+
+
+"""
+End verif_subset.py
+"""
@@ -10,10 +10,12 @@ shawn.s.murdzek@noaa.gov
 
 import yaml
 import copy
-import glob
 import numpy as np
 
 import metplus_OSSE_scripts.plotting.metplus_tools as mt
+import osse_utils.met_cache as mc
+import osse_utils.gridstat_manifest as gm
+import osse_utils.verif_subset as vsub
 
 
 #---------------------------------------------------------------------------------------------------
@@ -45,22 +47,32 @@ subset = {'VX_MASK': 'FULL'}
 # Main Program
 #---------------------------------------------------------------------------------------------------
 
+# Reuse previously parsed MET output when the files have not changed
+mc.install()
+
+# Subset MET output using an index over the key columns (read_ascii now returns categorical frames)
+vsub.install()
+
 # Open MET verification output
 verif_df = {}
 for s in sim_dict:
     print(f"Extracting files for {s}")
     verif_df[s] = {}
+
+    # TMP and SPFH come from the same files, so each set of files is only read (and indexed) once
+    frames = {}
     for v in fcst_vars:
         print(v)
         verif_df[s][v] = {}
         for age in sim_dict[s]:
             verif_df[s][v][age] = {}
             for fl in fcst_leads:
-                fnames = glob.glob(f"{sim_dict[s][age]}/grid_stat_FV3_TMP_vs_NR_TMP_{fl:02d}0000L_*V_{fcst_vars[v]}.txt")
-                tmp = mt.read_ascii(fnames, verbose=False)
+                fnames = gm.get_manifest(sim_dict[s][age]).files('grid_stat_FV3_TMP_vs_NR_TMP', fcst_vars[v], fl)
+                if tuple(fnames) not in frames:
+                    frames[tuple(fnames)] = mt.read_ascii(fnames, verbose=False)
                 subset_copy = copy.deepcopy(subset)
                 subset_copy['FCST_VAR'] = v
-                tmp2 = mt.subset_verif_df(tmp, subset_copy)
+                tmp2 = mt.subset_verif_df(frames[tuple(fnames)], subset_copy)
                 verif_df[s][v][age][fl] = tmp2.sort_values(['FCST_VALID_BEG', 'FCST_LEV'], ignore_index=True)
 
 # Compute percent differences
@@ -74,7 +86,9 @@ for s in sim_dict:
         for fl in fcst_leads:
             cond = True
             for f in ['FCST_VALID_BEG', 'FCST_LEV']:
-                chk = np.all(verif_df[s][v]['old'][fl][f].values == verif_df[s][v]['new'][fl][f].values)
+                # FCST_LEV is categorical, so compare plain arrays (categories may differ)
+                chk = np.all(np.asarray(verif_df[s][v]['old'][fl][f], dtype=object) ==
+                             np.asarray(verif_df[s][v]['new'][fl][f], dtype=object))
                 cond = np.logical_and(cond, chk)
             if cond:
                 all_stats = mt.compute_stats_entire_df(verif_df[s][v]['old'][fl], 
@@ -0,0 +1,78 @@
+"""
+Build Gridded Observation Density Cubes
+
+Counts UAS superobs (or any obs in prepbufr CSVs or GSI diag files) in each tile of the RRFS grid,
+pressure layer, and cycle, and saves the counts as netCDF cubes (see osse_utils/ob_density.py).
+Cubes are only rebuilt if they are older than the input obs.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import datetime as dt
+import numpy as np
+
+import osse_utils.ob_density as od
+
+
+#---------------------------------------------------------------------------------------------------
+# Input Parameters
+#---------------------------------------------------------------------------------------------------
+
+# UPP file on the RRFS grid
+grid_fname = '../data/GRIB2_output/winter/rrfs.t22z.prslev.f000.conus_3km.grib2'
+
+# Number of RRFS gridpoints in each direction combined into one tile (1 = every model column)
+coarsen = 10
+
+# Pressure layer edges (hPa)
+pbins = np.arange(480, 1050, 10)
+
+# Ob types counted separately (None = count all obs together)
+ob_types = [136]
+
+# Obs to count. Each entry has a list of files, the time of each file, the type of file ('bufr' or
+# 'diag'), and row filters (see osse_utils/filters.py)
+times = [dt.datetime(2022, 4, 29, 21)]
+obs = {}
+for d in [300, 150, 100, 75, 35]:
+    obs[f"uas_obs_{d}km"] = {'fnames': [f"../data/UAS_obs/uas_obs_{d}km/superob_uas/"
+                                        f"{t.strftime('%Y%m%d%H%M')}.rap.fake.prepbufr.csv"
+                                        for t in times],
+                             'times': times,
+                             'source': 'bufr',
+                             'filters': {'TYP': 136}}
+
+# Output directory
+out_dir = '../data/ob_density'
+
+# Option to rebuild cubes that are up to date
+overwrite = False
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+os.makedirs(out_dir, exist_ok=True)
+grid = od.DensityGrid.from_upp(grid_fname, pbins=pbins, ob_types=ob_types, coarsen=coarsen)
+
+for name, info in obs.items():
+    out_fname = f"{out_dir}/{name}.nc"
+    if ((not overwrite) and os.path.isfile(out_fname) and
+        all(os.path.getmtime(out_fname) >= os.path.getmtime(f) for f in info['fnames'])):
+        print(f"{out_fname} is up to date")
+        continue
+
+    print(f"\nBuilding {out_fname}")
+    od.build_density(grid, info['fnames'], info['times'], out_fname, source=info['source'],
+                     filters=info['filters'])
+
+
+"""
+End build_ob_density.py
+"""
@@ -0,0 +1,82 @@
+"""
+Build Pre-Aggregated Verification Statistics Cubes
+
+Gathers GridStat partial sums for each season and verification subtype into netCDF cubes (see
+osse_utils/verif_cube.py). Cubes are only rebuilt if they are older than the MET output.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import yaml
+
+import osse_utils.verif_cube as vc
+import osse_utils.met_archive as ma
+
+
+#---------------------------------------------------------------------------------------------------
+# Input Parameters
+#---------------------------------------------------------------------------------------------------
+
+# YAML file with simulation info
+yml_fname = '../plot_code/verif_sim_info.yml'
+
+# Seasons (sim_dict_{season} in yml_fname)
+seasons = ['spring', 'winter']
+
+# Verification subtypes, with the file prefixes and line types for each
+subtyps = {'lower_atm_below_sfc_mask': {'sl1l2': ['grid_stat_FV3_TMP_vs_NR_TMP'],
+                                        'vl1l2': ['grid_stat_FV3_TMP_vs_NR_TMP']},
+           'upper_air_below_sfc_mask': {'sl1l2': ['grid_stat_FV3_TMP_vs_NR_TMP'],
+                                        'vl1l2': ['grid_stat_FV3_TMP_vs_NR_TMP']},
+           'severe_wx_env': {'sl1l2': ['grid_stat_FV3_vs_NR'],
+                             'vl1l2': ['grid_stat_FV3_vs_NR']}}
+
+# Output directory
+out_dir = '../data/verif_cubes'
+
+# Option to rebuild cubes that are up to date
+overwrite = False
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+with open(yml_fname, 'r') as fptr:
+    param = yaml.safe_load(fptr)
+
+os.makedirs(out_dir, exist_ok=True)
+
+for season in seasons:
+    for subtyp in subtyps:
+        sim_dirs = {}
+        for key, info in param[f'sim_dict_{season}'].items():
+            sim_dirs[key] = info['dir'].format(typ='GridStat', subtyp=subtyp)
+
+        for line_type, prefixes in subtyps[subtyp].items():
+            out_fname = f"{out_dir}/{season}_{subtyp}_{line_type}.nc"
+
+            # Skip cubes that are newer than all input files
+            if (not overwrite) and os.path.isfile(out_fname):
+                newest = 0
+                for d in sim_dirs.values():
+                    for f in ma.glob(f"{d}/*_{line_type}.txt"):
+                        newest = max(newest, ma.getmtime(f))
+                if os.path.getmtime(out_fname) >= newest:
+                    print(f"{out_fname} is up to date")
+                    continue
+
+            print(f"\nBuilding {out_fname}")
+            cube = vc.build_cube(sim_dirs, prefixes, line_type)
+            vc.write_cube(cube, out_fname)
+            print(dict(cube.sizes))
+
+
+"""
+End build_verif_cubes.py
+"""
@@ -0,0 +1,396 @@
+"""
+Benchmarks for the Figure Pipeline Using Synthetic Data
+
+Generates a synthetic dataset (GridStat output, GSI diag files, and prepbufr CSVs, see
+osse_utils/synthetic_data.py) and times the main steps used by the figure scripts:
+
+    read_ascii              : metplus_tools.read_ascii, met_cache.read_ascii (cold, warm, and with
+                              column projection)
+    subset_verif_df         : metplus_tools.subset_verif_df and verif_subset.subset_verif_df
+    compute_stats_vert_avg  : metplus_tools.compute_stats_vert_avg
+    plot_ua_vprof           : metplus_plots.plot_ua_vprof (with and without a VerificationStore)
+    read_diag               : gsi_fcts.read_diag and gsi_diag.read_diag_stream
+    bufrCSV                 : bufr.bufrCSV, bufr_io.read_bufr_csv, and bufr_io.read_bufr (binary)
+
+Each benchmark is run several times, and the min, max, mean, median, and standard deviation are
+saved to a JSON file. Passing a previous JSON file with --compare prints the change in the median
+time for each benchmark and flags regressions. Benchmarks that need a submodule that is not
+available (e.g., pyDA_utils) are skipped.
+
+Run from this directory:
+
+    PYTHONPATH=.. python run_benchmarks.py --experiments 4 --cycles 24 --levels 20 --uas-spacing 35
+    PYTHONPATH=.. python run_benchmarks.py --compare ../logs/benchmarks_old.json
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import datetime as dt
+import numpy as np
+
+import osse_utils.synthetic_data as sd
+import osse_utils.bufr_io as bio
+import osse_utils.gsi_diag as gd
+import osse_utils.met_schema as ms
+
+
+#---------------------------------------------------------------------------------------------------
+# Input Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Default directory for synthetic data
+default_data_dir = '../data/synthetic'
+
+# Default output file
+default_out_fname = '../logs/benchmarks.json'
+
+# Benchmarks whose median time increases by more than this fraction are flagged as regressions
+regression_thres = 0.1
+
+# Subset parameters used for subset_verif_df benchmarks (as in plot_code/verif_sim_info.yml)
+subset_params = [{'FCST_VAR': 'TMP', 'not_VX_MASK': 'FULL', 'OBTYPE': 'NR'},
+                 {'FCST_VAR': 'SPFH', 'not_VX_MASK': 'FULL', 'OBTYPE': 'NR'},
+                 {'FCST_VAR': 'TMP', 'VX_MASK': 'FULL', 'FCST_LEV': 'P850'}]
+
+# Keyword arguments for plot_ua_vprof (as in the lower_atm TMP entry of verif_sim_info.yml)
+vprof_kw = {'file_prefix': sd.file_prefix,
+            'line_type': 'sl1l2',
+            'toggle_pts': False,
+            'mean_legend': False,
+            'include_ctrl': False,
+            'ci': True,
+            'ci_lvl': 0.95,
+            'ci_opt': 't_dist',
+            'ci_kw': {'acct_lag_corr': True},
+            'diff_kw': {'var': ['RMSE', 'TOTAL', 'BIAS_DIFF'],
+                        'match': ['FCST_LEAD', 'FCST_VAR', 'FCST_VALID_BEG', 'FCST_LEV',
+                                  'FCST_UNITS', 'VX_MASK', 'OBTYPE']},
+            'plot_param': {'not_VX_MASK': 'FULL', 'OBTYPE': 'NR', 'FCST_VAR': 'TMP'}}
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def bench(name, fct, rounds=5, warmup=1, setup=None):
+    """
+    Time a function
+
+    Parameters
+    ----------
+    name : string
+        Benchmark name
+    fct : function
+        Function to time (called with no arguments)
+    rounds : integer, optional
+        Number of timed calls
+    warmup : integer, optional
+        Number of untimed calls before the timed calls
+    setup : function, optional
+        Function called (untimed) before every call to fct
+
+    Returns
+    -------
+    dictionary
+        Timing statistics (s)
+
+    """
+
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fct()
+
+    times = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fct()
+        times.append(time.perf_counter() - start)
+
+    times = np.array(times)
+    stats = {'min': times.min(), 'max': times.max(), 'mean': times.mean(),
+             'median': np.median(times), 'stddev': times.std(ddof=1) if rounds > 1 else 0.,
+             'rounds': rounds}
+    print(f"{name:45s} {stats['min']:10.4f} {stats['median']:10.4f} {stats['mean']:10.4f} "
+          f"{stats['stddev']:10.4f} {rounds:7d}")
+    return {k: float(v) for k, v in stats.items()}
+
+
+def skipped(name, reason):
+    """
+    Record a benchmark that could not be run
+    """
+
+    print(f"{name:45s} skipped ({reason})")
+    return {'skipped': reason}
+
+
+def clear_read_ascii_cache(data_dir):
+    """
+    Remove met_cache files from the synthetic GridStat output
+    """
+
+    for f in glob.glob(os.path.join(data_dir, 'MET_output_unzipped', '**', '.read_ascii_cache_*'),
+                       recursive=True):
+        os.remove(f)
+
+
+def run_all(info, data_dir, rounds):
+    """
+    Run all benchmarks
+
+    Parameters
+    ----------
+    info : dictionary
+        Synthetic dataset info (from synthetic_data.make_dataset)
+    data_dir : string
+        Directory containing the synthetic dataset
+    rounds : integer
+        Number of timed calls for each benchmark
+
+    Returns
+    -------
+    dictionary
+        Timing statistics for each benchmark
+
+    """
+
+    results = {}
+    valid_times = info['valid_times']
+    sim_dict = {}
+    for key, sim in info['sim_dict'].items():
+        sim_dict[key] = dict(sim)
+        sim_dict[key]['dir'] = sim['dir'].format(typ='GridStat', subtyp=sd.subtyp)
+
+    # Use the experiment with the densest UAS network
+    uas_exps = [k for k in sim_dict if info['experiments'][k] is not None]
+    exp = uas_exps[0] if len(uas_exps) > 0 else list(sim_dict.keys())[0]
+    fnames = ['%s/%s_%02d0000L_%sV_sl1l2.txt' % (sim_dict[exp]['dir'], sd.file_prefix, 0,
+                                                 t.strftime('%Y%m%d_%H%M%S')) for t in valid_times]
+
+    try:
+        import metplus_OSSE_scripts.plotting.metplus_tools as mt
+    except ImportError:
+        mt = None
+
+    # read_ascii
+    if mt is None:
+        for key in ['read_ascii[metplus_tools]', 'read_ascii[met_cache,cold]',
+                    'read_ascii[met_cache,warm]', 'read_ascii[met_cache,columns]',
+                    'subset_verif_df[metplus_tools]', 'subset_verif_df[verif_subset]',
+                    'compute_stats_vert_avg']:
+            results[key] = skipped(key, 'metplus_OSSE_scripts not available')
+    else:
+        import osse_utils.met_cache as mc
+        import osse_utils.verif_subset as vsub
+        results['read_ascii[metplus_tools]'] = bench(
+            'read_ascii[metplus_tools]', lambda: mc._read_ascii_uncached(fnames, verbose=False),
+            rounds=rounds)
+        results['read_ascii[met_cache,cold]'] = bench(
+            'read_ascii[met_cache,cold]', lambda: mc.read_ascii(fnames, verbose=False),
+            rounds=rounds, setup=lambda: (clear_read_ascii_cache(data_dir), mc._mem_cache.clear()))
+        results['read_ascii[met_cache,warm]'] = bench(
+            'read_ascii[met_cache,warm]', lambda: mc.read_ascii(fnames, verbose=False),
+            rounds=rounds)
+
+        # Caches are cleared before each round, so this times parsing only the requested columns
+        results['read_ascii[met_cache,columns]'] = bench(
+            'read_ascii[met_cache,columns]',
+            lambda: mc.read_ascii(fnames, verbose=False, columns=ms.partial_sum_cols['sl1l2']),
+            rounds=rounds, setup=lambda: (clear_read_ascii_cache(data_dir), mc._mem_cache.clear(),
+                                          mc._typed.clear()))
+
+        # subset_verif_df
+        df = mc._read_ascii_uncached(fnames, verbose=False)
+        vdf = vsub.as_verif_frame(df)
+        results['subset_verif_df[metplus_tools]'] = bench(
+            'subset_verif_df[metplus_tools]',
+            lambda: [vsub._subset_verif_df_orig(df, p) for p in subset_params], rounds=rounds)
+        results['subset_verif_df[verif_subset]'] = bench(
+            'subset_verif_df[verif_subset]',
+            lambda: [vsub.subset_verif_df(vdf, p) for p in subset_params], rounds=rounds)
+
+        # compute_stats_vert_avg
+        if hasattr(mt, 'compute_stats_vert_avg'):
+            subset = vsub._subset_verif_df_orig(df, subset_params[0])
+            results['compute_stats_vert_avg'] = bench(
+                'compute_stats_vert_avg',
+                lambda: mt.compute_stats_vert_avg(subset, vmin=600, vmax=1000, line_type='sl1l2',
+                                                  stats_kw={'agg': True}),
+                rounds=rounds)
+        else:
+            results['compute_stats_vert_avg'] = skipped('compute_stats_vert_avg',
+                                                        'not in metplus_tools')
+
+    # plot_ua_vprof
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        import metplus_OSSE_scripts.plotting.metplus_plots as mp
+        import osse_utils.verif_store as vs
+    except ImportError as err:
+        results['plot_ua_vprof'] = skipped('plot_ua_vprof', str(err))
+    else:
+        def vprof():
+            fig, ax = plt.subplots()
+            mp.plot_ua_vprof(sim_dict, valid_times, fcst_lead=0, plot_stat='RMSE', ax=ax,
+                             verbose=False, diffs=True, include_zero=True, **vprof_kw)
+            plt.close(fig)
+        results['plot_ua_vprof'] = bench('plot_ua_vprof', vprof, rounds=rounds)
+        store = vs.VerificationStore()
+        store.install()
+        results['plot_ua_vprof[verif_store]'] = bench('plot_ua_vprof[verif_store]', vprof,
+                                                      rounds=rounds)
+        store.uninstall()
+
+    # read_diag
+    diag_fnames = info['diag_fnames'][exp]
+    try:
+        import pyDA_utils.gsi_fcts as gsi
+        results['read_diag[gsi_fcts]'] = bench('read_diag[gsi_fcts]',
+                                               lambda: gsi.read_diag(diag_fnames), rounds=rounds)
+    except ImportError:
+        results['read_diag[gsi_fcts]'] = skipped('read_diag[gsi_fcts]', 'pyDA_utils not available')
+    results['read_diag[gsi_diag]'] = bench(
+        'read_diag[gsi_diag]',
+        lambda: gd.read_diag_stream(diag_fnames,
+                                    ['Observation_Type', 'Obs_Minus_Forecast_adjusted'],
+                                    filters={'Pressure': (700, 1050), 'Observation_Type': [136]}),
+        rounds=rounds)
+
+    # bufrCSV
+    if len(info['bufr_fnames'][exp]) == 0:
+        results['bufrCSV'] = skipped('bufrCSV', 'no UAS experiments')
+        return results
+    bufr_fname = info['bufr_fnames'][exp][0]
+    try:
+        from pyDA_utils import bufr
+        results['bufrCSV[bufr]'] = bench('bufrCSV[bufr]', lambda: bufr.bufrCSV(bufr_fname),
+                                         rounds=rounds)
+    except ImportError:
+        results['bufrCSV[bufr]'] = skipped('bufrCSV[bufr]', 'pyDA_utils not available')
+    results['bufrCSV[bufr_io,csv]'] = bench(
+        'bufrCSV[bufr_io,csv]',
+        lambda: bio.read_bufr_csv(bufr_fname, columns=['SID', 'POB', 'TOB'], filters={'TYP': 136}),
+        rounds=rounds)
+    if not os.path.isfile(bio.npy_fname(bufr_fname)):
+        bio.write_bufr_npy(bio.read_bufr_csv(bufr_fname), bio.npy_fname(bufr_fname))
+    results['bufrCSV[bufr_io,npy]'] = bench(
+        'bufrCSV[bufr_io,npy]',
+        lambda: bio.read_bufr(bufr_fname, columns=['SID', 'POB', 'TOB'], filters={'TYP': 136}),
+        rounds=rounds)
+
+    return results
+
+
+def compare(results, old_fname):
+    """
+    Print the change in median time relative to a previous run
+
+    Returns
+    -------
+    list of strings
+        Benchmarks that are slower by more than regression_thres
+
+    """
+
+    with open(old_fname, 'r') as fptr:
+        old = json.load(fptr)['results']
+
+    regressions = []
+    print(f"\n{'benchmark':45s} {'old (s)':>10s} {'new (s)':>10s} {'change':>8s}")
+    for name in results:
+        if ('median' not in results[name]) or ('median' not in old.get(name, {})):
+            continue
+        t_old = old[name]['median']
+        t_new = results[name]['median']
+        change = (t_new - t_old) / t_old
+        flag = ''
+        if change > regression_thres:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:45s} {t_old:10.4f} {t_new:10.4f} {100*change:7.1f}%{flag}")
+
+    return regressions
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the figure pipeline on synthetic data')
+    parser.add_argument('--data-dir', default=default_data_dir, help='Synthetic data directory')
+    parser.add_argument('--experiments', type=int, default=4, help='Number of experiments')
+    parser.add_argument('--cycles', type=int, default=24, help='Number of hourly cycles')
+    parser.add_argument('--levels', type=int, default=20, help='Number of vertical levels')
+    parser.add_argument('--uas-spacing', type=int, default=35,
+                        help='Spacing of the densest UAS network (km, 35-400)')
+    parser.add_argument('--rounds', type=int, default=5, help='Timed calls per benchmark')
+    parser.add_argument('--regenerate', action='store_true', help='Regenerate synthetic data')
+    parser.add_argument('-o', '--output', default=default_out_fname, help='Output JSON file')
+    parser.add_argument('--compare', default=None, help='JSON file from a previous run')
+    args = parser.parse_args()
+
+    # The synthetic data are only regenerated if the size parameters change
+    size = {'experiments': args.experiments, 'cycles': args.cycles, 'levels': args.levels,
+            'uas_spacing': args.uas_spacing}
+    size_fname = os.path.join(args.data_dir, 'size.json')
+    try:
+        with open(size_fname, 'r') as fptr:
+            old_size = json.load(fptr)
+    except (FileNotFoundError, json.JSONDecodeError):
+        old_size = None
+    info_fname = os.path.join(args.data_dir, 'info.json')
+    if args.regenerate or (old_size != size):
+        print(f"Generating synthetic data in {args.data_dir}")
+        if os.path.isdir(args.data_dir):
+            shutil.rmtree(args.data_dir)
+        start = time.time()
+        info = sd.make_dataset(args.data_dir, n_exp=args.experiments, n_cycles=args.cycles,
+                               n_levels=args.levels, uas_spacing=args.uas_spacing)
+        print(f"Done generating data ({time.time() - start:.1f} s)")
+        with open(info_fname, 'w') as fptr:
+            json.dump(info, fptr, indent=2,
+                      default=lambda x: x.isoformat() if isinstance(x, dt.datetime) else x.tolist())
+        with open(size_fname, 'w') as fptr:
+            json.dump(size, fptr)
+    else:
+        with open(info_fname, 'r') as fptr:
+            info = json.load(fptr)
+        info['valid_times'] = [dt.datetime.fromisoformat(t) for t in info['valid_times']]
+
+    print(f"\n{'benchmark':45s} {'min (s)':>10s} {'median (s)':>10s} {'mean (s)':>10s} "
+          f"{'stddev (s)':>10s} {'rounds':>7s}")
+    results = run_all(info, args.data_dir, args.rounds)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as fptr:
+        json.dump({'date': dt.datetime.now().isoformat(), 'size': size, 'results': results}, fptr,
+                  indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.compare is not None:
+        regressions = compare(results, args.compare)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+"""
+End run_benchmarks.py
+"""
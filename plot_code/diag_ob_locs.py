@@ -13,11 +13,14 @@ shawn.s.murdzek@noaa.gov
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+import matplotlib.cm as mcm
 import datetime as dt
 import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 
 import pyDA_utils.gsi_fcts as gsi
+import osse_utils.upp_grid_cache as ugc
+import osse_utils.map_density as mden
+import osse_utils.map_features as mf
 
 
 #---------------------------------------------------------------------------------------------------
@@ -34,6 +37,19 @@ data_subset = 'all'
 # RRFS field (needed to extract surface terrain height so MSL can be converted to AGL)
 rrfs_fname = '/work2/noaa/wrfruc/murdzek/RRFS_OSSE/real_data_app_orion/winter/rrfs.20220201/NCO_dirs/ptmp/prod/rrfs.20220201/12/rrfs.t12z.natlev.f000.conus_3km.grib2'
 
+# Method used to get terrain height at each ob (see osse_utils/upp_grid_cache.py):
+#     'gsi' - gsi_fcts.compute_height_agl_diag (used for the published figure)
+#     'nearest' - nearest gridpoint of the cached terrain height (fast after the first run, but
+#                 only use once ugc.compare_height_agl_diag shows the figure does not change)
+hgt_agl_method = 'gsi'
+
+# How to draw ob locations (see osse_utils/map_density.py):
+#     'points' - one vector marker per ob
+#     'raster' - same markers, but drawn as a single image (much smaller PDF)
+#     'hist', 'hexbin' - number of obs in each bin
+#     'auto' - 'points' for small numbers of obs, 'hist' otherwise
+ob_plot_mode = 'raster'
+
 # Output file name
 out_fname = '../figs/TOBdist.pdf'
 
@@ -48,7 +64,7 @@ if data_subset == 'assim':
     diag_df = diag_df.loc[diag_df['Analysis_Use_Flag'] == 1, :]
 
 # Convert height from MSL to AGL
-diag_df = gsi.compute_height_agl_diag(diag_df, rrfs_fname)
+diag_df = ugc.compute_height_agl_diag(diag_df, rrfs_fname, method=hgt_agl_method)
 
 # Create plot
 use_filter = [False, False, True]
@@ -76,20 +92,15 @@ for i in range(3):
         print(f"{typ} (n = {len(red_df.loc[red_df['Observation_Type'] == typ])})")
 
     ax = fig.add_subplot(3, 1, i+1, projection=ccrs.LambertConformal())
-    ax.plot(red_df['Longitude'] , red_df['Latitude'], 'b.', markersize=2, transform=ccrs.PlateCarree())
-
-    ax.coastlines('50m', edgecolor='gray', linewidth=0.6)
-    borders = cfeature.NaturalEarthFeature(category='cultural',
-                                           scale='50m',
-                                           facecolor='none',
-                                           name='admin_1_states_provinces')
-    ax.add_feature(borders, edgecolor='gray', linewidth=0.4)
-    lakes = cfeature.NaturalEarthFeature(category='physical',
-                                         scale='50m',
-                                         facecolor='none',
-                                         name='lakes')
-    ax.add_feature(lakes, edgecolor='gray', linewidth=0.4)
     ax.set_extent([237, 291, 21.5, 50])
+    art = mden.plot_obs(ax, red_df['Longitude'].values, red_df['Latitude'].values,
+                        mode=ob_plot_mode)
+    if isinstance(art, mcm.ScalarMappable):
+        plt.colorbar(art, ax=ax, label='number of obs', shrink=0.8)
+
+    mf.coastlines(ax, '50m', edgecolor='gray', linewidth=0.6)
+    mf.add_feature(ax, 'admin_1_states_provinces', scale='50m', edgecolor='gray', linewidth=0.4)
+    mf.add_feature(ax, 'lakes', scale='50m', edgecolor='gray', linewidth=0.4)
 
     ax.set_title(f"{title[i]} (n = {len(red_df)})", size=16)
 
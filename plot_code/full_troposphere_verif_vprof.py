@@ -17,6 +17,7 @@ import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
 
 import metplus_OSSE_scripts.plotting.metplus_plots as mp
+import osse_utils.verif_store as vs
 
 
 #---------------------------------------------------------------------------------------------------
@@ -54,6 +55,11 @@ out_fname = '../figs/FullTropRMSE.pdf'
 # Main Program
 #---------------------------------------------------------------------------------------------------
 
+# Read each experiment and forecast lead once and reuse it for every subplot. The next experiment
+# is read in the background while statistics for the current one are computed
+store = vs.VerificationStore(prefetch=2)
+store.install()
+
 # Read in simulation and plotting information
 with open(yml_fname, 'r') as fptr:
     param = yaml.safe_load(fptr)
@@ -88,6 +94,8 @@ for i, (sim_dict, ttl, valid_times) in enumerate(zip([sim_dict_winter, sim_dict_
         input_sims = copy.deepcopy(sim_dict)
         for key in input_sims:
             input_sims[key]['dir'] = input_sims[key]['dir'].format(typ='GridStat', subtyp='upper_air_below_sfc_mask')
+        store.schedule(input_sims, fhr, plot_dict[v]['kwargs']['file_prefix'],
+                       plot_dict[v]['kwargs']['line_type'])
 
         # Difference plot
         _ = mp.plot_ua_vprof(input_sims,
@@ -17,8 +17,7 @@ import pandas as pd
 import numpy as np
 import copy
 
-import metplus_OSSE_scripts.plotting.metplus_tools as mt
-import metplus_OSSE_scripts.plotting.metplus_plots as mp
+import osse_utils.verif_cube as vc
 
 
 #---------------------------------------------------------------------------------------------------
@@ -43,6 +42,9 @@ itime_skip = {'winter':[dt.datetime(2022, 2, 4, 13),
 n_uas_dict = {'spring':{'ctrl':0, 'uas_300km':84, 'uas_150km':347, 'uas_100km':772, 'uas_75km':1381, 'uas_35km':6335},
               'winter':{'ctrl':0, 'uas_150km':347, 'uas_100km':772, 'uas_75km':1381, 'uas_35km':6335}}
 
+# Partial-sums cubes (built using other_code/build_verif_cubes.py)
+cube_fname = '../data/verif_cubes/{season}_lower_atm_below_sfc_mask_{line_type}.nc'
+
 # Output file name
 out_fname = '../figs/RMSEvsUAS.pdf'
 #out_fname = '../figs/RMSEvsUAS.png'
@@ -64,11 +66,16 @@ plt.subplots_adjust(left=0.1, bottom=0.17, right=0.98, top=0.94, hspace=0.22, ws
 letters = ['a', 'b', 'c', 'd', 'e', 'f']
 labelsize=14
 for i, s in enumerate(['winter', 'spring']):
+
+    # Partial-sums cubes for this season, keyed by line type. T and Q come from the same cube
+    cubes = {}
+
     for j, v in enumerate(plot_dict.keys()):
 
-        input_sims = copy.deepcopy(param[f'sim_dict_{s}'])
-        for key in input_sims:
-            input_sims[key]['dir'] = input_sims[key]['dir'].format(typ='GridStat', subtyp='lower_atm_below_sfc_mask')
+        line_type = plot_dict[v]['line_type']
+        if line_type not in cubes:
+            cubes[line_type] = vc.open_cube(cube_fname.format(season=s, line_type=line_type))
+        cube = cubes[line_type]
 
         for fl, c in zip(plot_dict[v]['fcst_leads'], ['#004D40', '#FFC107', '#1E88E5', '#D81B60']):
             print(f'\nCreating subplot for {s} {v} f{fl:02d}h')
@@ -81,41 +88,33 @@ for i, s in enumerate(['winter', 'spring']):
                 except ValueError:
                     print(f"Cannot remove {itime}")
 
-            # Read in data
-            print('Reading in data...')
-            verif_df = {}
-            for key in input_sims.keys():
-                fnames = ['%s/%s_%02d0000L_%sV_%s.txt' %
-                          (input_sims[key]['dir'], 
-                           plot_dict[v]['file_prefix'], 
-                           fl, 
-                           t.strftime('%Y%m%d_%H%M%S'), 
-                           plot_dict[v]['line_type']) for t in valid_tmp]
-                tmp = mt.read_ascii(fnames, verbose=False)
-                verif_df[key] = mt.subset_verif_df(tmp, plot_dict[v]['subset'])
-
-            # Compute stats for the entire 1000-600 hPa layer for each output time and each simulation
+            # Subset the cube
+            sub = cube.sel(FCST_LEAD=fl, experiment=list(n_uas_dict[s].keys()))
+            sub = sub.isel(FCST_VALID_BEG=np.isin(sub['FCST_VALID_BEG'].values,
+                                                  pd.DatetimeIndex(valid_tmp).values))
+            for key, val in plot_dict[v]['subset'].items():
+                if key[:4] == 'not_':
+                    sub = sub.drop_sel({key[4:]: val})
+                else:
+                    sub = sub.sel({key: val})
+
+            # Compute stats for the entire 1000-600 hPa layer (aggregated over all masks) for each
+            # output time and each simulation, then the time-mean percent difference from ctrl
             print('Computing stats...')
-            stats = {}
-            for key in verif_df.keys():
-                stats[key] = mt.compute_stats_vert_avg(verif_df[key], vmin=600, vmax=1000,
-                                                       line_type=plot_dict[v]['line_type'],
-                                                       stats_kw={'agg':True})
+            stat = vc.compute_stats(vc.vert_avg(sub, vmin=600, vmax=1000,
+                                                dims=['VX_MASK']))[plot_dict[v]['plot_stat']]
+            mean, lo, hi = vc.mean_ci(vc.pct_diff(stat), level=0.95,
+                                      ci_kw={'acct_lag_corr':True})
 
             # Make plot
             print('Making plot...')
             ax = axes[i, j]
-            _ = mp.plot_pct_diffs([stats[key] for key in n_uas_dict[s].keys()], 
-                                  [n_uas_dict[s][key] for key in n_uas_dict[s].keys()],
-                                  'number of UAS',
-                                  plot_stat=plot_dict[v]['plot_stat'],
-                                  ax=ax,
-                                  ci=True,
-                                  ci_lvl=0.95,
-                                  ci_opt='t_dist',
-                                  ci_kw={'acct_lag_corr':True, 'mats_ste':False},
-                                  plot_pct_diff_kw={'lw':2, 'c':c, 'label':f'{fl}-hr fcst'},
-                                  plot_ci_kw={'lw':0.75, 'c':c})
+            n_uas = [n_uas_dict[s][key] for key in n_uas_dict[s].keys()]
+            ax.plot(n_uas, mean.values, lw=2, c=c, label=f'{fl}-hr fcst')
+            ax.plot(n_uas, lo.values, lw=0.75, c=c)
+            ax.plot(n_uas, hi.values, lw=0.75, c=c)
+            ax.set_xlabel('number of UAS')
+            ax.set_ylabel(f"% diff {plot_dict[v]['plot_stat']}")
             if i == 0:
                 ax.set_xlabel('')
             if j > 0:
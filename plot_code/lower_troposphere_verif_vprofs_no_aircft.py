@@ -17,6 +17,7 @@ import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
 
 import metplus_OSSE_scripts.plotting.metplus_plots as mp
+import osse_utils.verif_store as vs
 
 
 #---------------------------------------------------------------------------------------------------
@@ -50,6 +51,11 @@ out_fname = '../figs/VprofNoAircft.pdf'
 # Main Program
 #---------------------------------------------------------------------------------------------------
 
+# Read each experiment and forecast lead once and reuse it for every subplot. The next experiment
+# is read in the background while statistics for the current one are computed
+store = vs.VerificationStore(prefetch=2)
+store.install()
+
 # Read in simulation and plotting information
 with open(yml_fname, 'r') as fptr:
     param = yaml.safe_load(fptr)
@@ -76,6 +82,8 @@ for istat, stat in enumerate(['RMSE']):
             ax = axes[i, j]
             for key in input_sims:
                 input_sims[key]['dir'] = input_sims[key]['dir'].format(typ='GridStat', subtyp='lower_atm_below_sfc_mask')
+            store.schedule(input_sims, fhr, plot_dict[v]['kwargs']['file_prefix'],
+                           plot_dict[v]['kwargs']['line_type'])
 
             _ = mp.plot_ua_vprof(input_sims,
                                  valid_times,
@@ -16,6 +16,7 @@ import numpy as np
 
 import metplus_OSSE_scripts.plotting.metplus_plots as mp
 import metplus_OSSE_scripts.plotting.metplus_tools as mt
+import osse_utils.bootstrap as bs
 
 
 #---------------------------------------------------------------------------------------------------
@@ -154,15 +155,25 @@ ax = axes[2, 0]
 ci_bs_param = {'bootstrap': {'n_resamples': 10000},
                'bootstrap paired': {'n_resamples': 10000,
                                     'paired': True}}
+ci_fast_param = {'fast paired': {'n_resamples': 10000,
+                                 'seed': 42},
+                 'fast paired 3-hr blocks': {'n_resamples': 10000,
+                                             'block_length': 3,
+                                             'seed': 42}}
 print('\nPct Diff 1')
 for i, key in enumerate(list(ci_bs_param.keys())):
     ci = mt.confidence_interval_bootstrap_pct_diff(uas_rmse, ctrl_rmse, level=level, fct=pct_diff_1, 
                                                    bootstrap_kw=ci_bs_param[key])
     ax.plot(ci, [i, i], lw=5)
     print(f'CI range ({key}) = {np.abs(ci[1] - ci[0])}')
+for i, key in enumerate(list(ci_fast_param.keys())):
+    ci = bs.bootstrap_ci(uas_rmse, ctrl_rmse, level=level, fct='pct_diff_1', **ci_fast_param[key])
+    ax.plot(ci, [i+len(ci_bs_param), i+len(ci_bs_param)], lw=5)
+    print(f'CI range ({key}) = {np.abs(ci[1] - ci[0])}')
 ax.set_xlabel('pct difference', size=14)
 #ax.set_xlim([-13.5, -8])
-ax.set_yticks(np.arange(len(ci_bs_param)), list(ci_bs_param.keys()), size=14)
+ax.set_yticks(np.arange(len(ci_bs_param) + len(ci_fast_param)), 
+              list(ci_bs_param.keys()) + list(ci_fast_param.keys()), size=14)
 ax.set_title(f"Pct Diff 1 CIs", size=16)
 ax.grid()
 
@@ -11,6 +11,8 @@ shawn.s.murdzek@noaa.gov
 import matplotlib.pyplot as plt
 import numpy as np
 
+import osse_utils.obs_errors as oe
+
 
 #---------------------------------------------------------------------------------------------------
 # Input Parameters
@@ -29,6 +31,9 @@ tchunk = 30
 # Number of iterations
 niter = 10000
 
+# Random seed (set to None for different errors each time)
+seed = None
+
 # Autocorrelation parameters
 autocorr = [0, 0.5, 0.95, 0.985, 0.995]
 colors = ['k', 'gray', '#1E88E5', '#D81B60', '#FFC107']
@@ -45,18 +50,9 @@ out_fname = '../figs/UASerrVSautocorr.pdf'
 if nobs % tchunk != 0:
     raise ValueError('nobs % tchunk must be 0!')
 
-# Create arrays to hold error profiles
-err_profiles = {}
-for a in autocorr:
-    err_profiles[a] = np.zeros([niter, nobs])
-
 # Create error profiles
-for i in range(niter):
-    gaussian = np.random.normal(scale=stdev, size=nobs)
-    for a in autocorr:
-        err_profiles[a][i, 0] = gaussian[0]
-        for j in range(1, nobs):
-            err_profiles[a][i, j] = gaussian[j] + (a * err_profiles[a][i, j-1]) 
+err_profiles = oe.ar1_profiles(autocorr, niter, nobs, stdev=stdev, seed=seed)
+decorr_times = oe.decorrelation_table(autocorr)
 
 # Plot histograms of errors from last time step
 fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(4, 4))
@@ -69,7 +65,7 @@ for a, c in zip(autocorr, colors):
     print()
     print(f"Autocorrelation = {a}")
     for thres in [1/np.e, 0.01, 0.001]:
-        print(f"Decorrelation time (thres = {thres:.3f}) = {np.log(thres) / np.log(a):.3f}")
+        print(f"Decorrelation time (thres = {thres:.3f}) = {decorr_times[(a, thres)]:.3f}")
 
     hist = np.histogram(err_profiles[a][:, -1], bins=ybins)[0]
     #ax.plot(errs, hist, c=c, ls='-', label=a)  # PDF
@@ -8,13 +8,13 @@ shawn.s.murdzek@noaa.gov
 # Import Modules
 #---------------------------------------------------------------------------------------------------
 
-import numpy as np
 import matplotlib.pyplot as plt
 import xarray as xr
-import cartopy.feature as cfeature
 import cartopy.crs as ccrs
 
 import pyDA_utils.plot_model_data as pmd
+import osse_utils.upp_grid_cache as ugc
+import osse_utils.map_features as mf
 
 
 #---------------------------------------------------------------------------------------------------
@@ -41,9 +41,9 @@ out_fname = f'../figs/hgt_agl_p{prs_lvl}.png'
 
 # Compute height AGL field
 ds = xr.open_dataset(upp_file, engine='pynio')
-zind = np.where(ds['lv_ISBL0'] == prs_lvl)[0][0]
+zind = ugc.level_index(ds, prs_lvl)
 print(f'Vertical index = {zind}')
-hgt = ds['HGT_P0_L100_GLC0'][zind, :, :].values - ds['HGT_P0_L1_GLC0'].values
+hgt = ugc.height_agl(ds, prs_lvl)
 
 # Make plot
 fig = plt.figure(figsize=(8, 8))
@@ -54,12 +54,8 @@ cbar = plt.colorbar(cax, ax=ax)
 cbar.set_label('height AGL (m)', size=14)
 
 ax.set_extent([lon[0], lon[1], lat[0], lat[1]])
-ax.coastlines('10m', edgecolor='k', linewidth=0.75)
-borders = cfeature.NaturalEarthFeature(category='cultural',
-                                       scale='10m',
-                                       facecolor='none',
-                                       name='admin_1_states_provinces')
-ax.add_feature(borders, linewidth=0.75, edgecolor='k')
+mf.coastlines(ax, '10m', edgecolor='k', linewidth=0.75)
+mf.add_feature(ax, 'admin_1_states_provinces', scale='10m', linewidth=0.75, edgecolor='k')
 
 plt.savefig(out_fname)
 
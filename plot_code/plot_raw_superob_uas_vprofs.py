@@ -18,7 +18,7 @@ import numpy as np
 import sys
 import yaml
 
-import pyDA_utils.bufr as bufr
+import osse_utils.bufr_io as bio
 import pyDA_utils.plot_model_data as pmd
 import pyDA_utils.map_proj as mp
 
@@ -47,15 +47,11 @@ out_fname = '../figs/UASRawVsSuperob.pdf'
 # Make Plots
 #---------------------------------------------------------------------------------------------------
 
-# Read in BUFR CSV files
-bufr_csv_raw = bufr.bufrCSV(bufr_file_raw)
-bufr_csv_superob = bufr.bufrCSV(bufr_file_superob)
-
-# Extract the desired SID
-raw_thermo = bufr_csv_raw.df.loc[(bufr_csv_raw.df['SID'] == sid) & 
-                                 (bufr_csv_raw.df['TYP'] == ob_typ_thermo)].copy()
-superob_thermo = bufr_csv_superob.df.loc[(bufr_csv_superob.df['SID'] == sid) & 
-                                         (bufr_csv_superob.df['TYP'] == ob_typ_thermo)].copy()
+# Read in BUFR CSV files, only retaining thermodynamic obs for the desired SID
+raw_thermo = bio.read_bufr(bufr_file_raw, columns=['SID', 'TYP', 'TOB', 'ZOB'],
+                           filters={'SID': sid, 'TYP': ob_typ_thermo})
+superob_thermo = bio.read_bufr(bufr_file_superob, columns=['SID', 'TYP', 'TOB', 'ZOB'],
+                               filters={'SID': sid, 'TYP': ob_typ_thermo})
 
 fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(6, 6))
 plt.subplots_adjust(left=0.15, bottom=0.1, right=0.98, top=0.98)
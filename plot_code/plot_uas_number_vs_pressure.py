@@ -14,7 +14,7 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 import numpy as np
 
-import pyDA_utils.bufr as bufr
+import osse_utils.bufr_io as bio
 
 
 #---------------------------------------------------------------------------------------------------
@@ -44,8 +44,8 @@ colors = ['#66CCEE', '#AA3377', '#228833', '#CCBB44', '#4477AA']
 n_uas = {}
 for d in uas_density:
     print(f'Binning UAS obs for the {d} km network')
-    df = bufr.bufrCSV(in_data.format(n=d)).df
-    uas_p = df.loc[df['TYP'] == 136, 'POB'].values
+    df = bio.read_bufr(in_data.format(n=d), columns=['POB'], filters={'TYP': 136})
+    uas_p = df['POB'].values
     n_uas[d] = np.histogram(uas_p, bins=pbins)[0]
 
 # Plot results
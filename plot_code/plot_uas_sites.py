@@ -11,26 +11,19 @@ shawn.s.murdzek@noaa.gov
 #---------------------------------------------------------------------------------------------------
 
 import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 import matplotlib.pyplot as plt
-import pandas as pd
+
+import osse_utils.uas_sites as us
+import osse_utils.map_features as mf
 
 
 #---------------------------------------------------------------------------------------------------
 # Input Parameters
 #---------------------------------------------------------------------------------------------------
 
-# Text files with UAS site locations
-uas_site_files = {'a) 150-km spacing': 
-                     {'fnames': 
-                         ['../data/UAS_sites/uas_site_locs_150km.txt'],
-                      'ms':3},
-                  'b) 35-km spacing': 
-                      {'fnames':
-                          ['../data/UAS_sites/uas_site_locs_35km.txt1',
-                           '../data/UAS_sites/uas_site_locs_35km.txt2',
-                           '../data/UAS_sites/uas_site_locs_35km.txt3'],
-                       'ms':1}}
+# UAS networks to plot (spacing in km, see osse_utils/uas_sites.py)
+uas_networks = {'a) 150-km spacing': {'spacing':150, 'ms':3},
+                'b) 35-km spacing': {'spacing':35, 'ms':1}}
 
 # Output file name
 out_fname = '../figs/SiteLocs.pdf'
@@ -40,35 +33,25 @@ out_fname = '../figs/SiteLocs.pdf'
 # Main Program
 #---------------------------------------------------------------------------------------------------
 
-# Read in site locations and stitch sites together if needed
+# Read in site locations
+site_cat = us.load_catalog()
 site_dfs = {}
-for key in uas_site_files.keys():
-    tmp = []
-    for f in uas_site_files[key]['fnames']:
-        tmp.append(pd.read_csv(f))
-    site_dfs[key] = pd.concat(tmp)
+for key in uas_networks.keys():
+    site_dfs[key] = site_cat.sites(uas_networks[key]['spacing'])
 
 # Plot site locations
 fig = plt.figure(figsize=(6, 1+3*len(site_dfs)))
 for i, key in enumerate(site_dfs.keys()):
     ax = fig.add_subplot(len(site_dfs), 1, i+1, projection=ccrs.LambertConformal())
+    ax.set_extent([-122, -69, 21, 50])
 
     ax.plot(site_dfs[key]['lon (deg E)'], site_dfs[key]['lat (deg N)'], 'r.', 
-            transform=ccrs.PlateCarree(), ms=uas_site_files[key]['ms'])
+            transform=ccrs.PlateCarree(), ms=uas_networks[key]['ms'])
 
     scale = '10m'
-    ax.coastlines(scale, lw=0.6)
-    borders = cfeature.NaturalEarthFeature(category='cultural',
-                                           scale=scale,
-                                           facecolor='none',
-                                           name='admin_1_states_provinces')
-    ax.add_feature(borders, lw=0.3)
-    lakes = cfeature.NaturalEarthFeature(category='physical',
-                                           scale=scale,
-                                           facecolor='none',
-                                           name='lakes')
-    ax.add_feature(lakes, lw=0.3)
-    ax.set_extent([-122, -69, 21, 50])
+    mf.coastlines(ax, scale, lw=0.6)
+    mf.add_feature(ax, 'admin_1_states_provinces', scale=scale, lw=0.3)
+    mf.add_feature(ax, 'lakes', scale=scale, lw=0.3)
 
     ax.set_title(f"{key} (n = {len(site_dfs[key])})", size=18)
 
@@ -14,14 +14,14 @@ import numpy as np
 import datetime as dt
 import matplotlib.pyplot as plt
 import matplotlib.cm as mcm
-import xarray as xr
-import cartopy.feature as cfeature
 import cartopy.crs as ccrs
 import pyart.graph.cm_colorblind as art_cm
-import pandas as pd
 
 import pyDA_utils.plot_model_data as pmd
-import pyDA_utils.upp_postprocess as uppp
+import osse_utils.upp_region as ur
+import osse_utils.upp_grid_cache as ugc
+import osse_utils.uas_sites as us
+import osse_utils.map_features as mf
 
 
 #---------------------------------------------------------------------------------------------------
@@ -46,11 +46,9 @@ sims = {'NR': [f"{NR_dir}/wrfprs_202202012200_er.grib2",
                       f"{uas35_dir}/rrfs.t22z.prslev.f002.conus_3km.grib2",
                       f"{uas35_dir}/rrfs.t22z.prslev.f004.conus_3km.grib2"]}
 
-# Files containing UAS sites
-uas_site_files = {'150-km UAS': ['../data/UAS_sites/uas_site_locs_150km.txt'],
-                  '35-km UAS': ['../data/UAS_sites/uas_site_locs_35km.txt1',
-                                '../data/UAS_sites/uas_site_locs_35km.txt2',
-                                '../data/UAS_sites/uas_site_locs_35km.txt3']}
+# UAS network spacing (km) for each simulation (see osse_utils/uas_sites.py)
+uas_spacing = {'150-km UAS': 150,
+               '35-km UAS': 35}
 
 # General parameters
 figsize = (8, 8.5)
@@ -61,6 +59,12 @@ fcst_col_titles = ['f00h', 'f02h', 'f04h']
 ceil_max = 4000
 ceil_field = 'CEIL_EXP2'
 
+# Only read gridpoints within the plotting domain (plus a buffer of grid_pad RRFS gridpoints). The
+# RRFS grid is every NR_step-th point of the NR grid, starting at NR_start
+grid_pad = 10
+NR_start = [2, 3]
+NR_step = 3
+
 # Figure-specific parameters
 # Atlanta sits at ~320 m MSL. Ceilings are a few 100 to ~1200 m AGL. So focus on P levels below 850 hPa
 fig_param = {'ceil22':{'fname':'../figs/Ceil22Fcst.png',
@@ -153,21 +157,26 @@ fig_param = {'ceil22':{'fname':'../figs/Ceil22Fcst.png',
 start = dt.datetime.now()
 print(f"start = {start.strftime('%Y%m%d %H:%M:%S')}")
 
-# Read in site locations and stitch sites together if needed
+# Extract site locations within the plotting domain
+site_cat = us.load_catalog()
 site_dfs = {}
-for key in uas_site_files.keys():
-    tmp = []
-    for f in uas_site_files[key]:
-        tmp.append(pd.read_csv(f))
-    site_dfs[key] = pd.concat(tmp)
+for key in uas_spacing.keys():
+    site_dfs[key] = site_cat.sites(uas_spacing[key], site_cat.in_box(uas_spacing[key], lon, lat))
+
+# Determine the RRFS and NR gridpoints needed to cover the plotting domain
+rrfs_window = ur.region_window(sims['no UAS'][0], lat, lon, pad=grid_pad)
+NR_window = ur.nested_window(rrfs_window, NR_start, NR_step)
+NR_indices = [[0, NR_window[1] - NR_window[0], NR_step], [0, NR_window[3] - NR_window[2], NR_step]]
+print(f"RRFS window = {rrfs_window}, NR window = {NR_window}")
 
 # Read in data and compute ceilings AGL
 sims_ds = {}
 for key in sims.keys():
     sims_ds[key] = []
+    window = NR_window if key == 'NR' else rrfs_window
     for fname in sims[key]:
-        tmp_ds = xr.open_dataset(fname, engine='pynio')
-        tmp_ds = uppp.compute_ceil_agl(tmp_ds, no_ceil=np.nan, fields={'CEIL_EXP2':'CEIL_P0_L2_GLC0'})
+        tmp_ds = ur.open_upp_region(fname, window, load=True)
+        tmp_ds = ugc.compute_ceil_agl(tmp_ds, no_ceil=np.nan, fields={'CEIL_EXP2':'CEIL_P0_L2_GLC0'})
         tmp_ds[ceil_field].values[tmp_ds[ceil_field].values > ceil_max] = np.nan  # Needed to prevent red outline around areas w/ cloud ceilings
         tmp_ds['SPFH_P0_L100_GLC0'].values = tmp_ds['SPFH_P0_L100_GLC0'].values * 1000  # Convert from kg/kg to g/kg
         sims_ds[key].append(tmp_ds)
@@ -192,8 +201,8 @@ for plot_name in fig_param.keys():
         else:
             P_Pa = fig_param[plot_name]['prs']
             if 'lv_ISBL0' in sims_ds[s][0]:
-                zind = np.where(sims_ds[s][0]['lv_ISBL0'] == P_Pa)[0][0]
-                zind_NR = np.where(sims_ds['NR'][0]['lv_ISBL0'] == P_Pa)[0][0]
+                zind = ugc.level_index(sims_ds[s][0], P_Pa)
+                zind_NR = ugc.level_index(sims_ds['NR'][0], P_Pa)
             else:
                 if sims_ds[s][0][fig_param[plot_name]['field']].attrs['level'][0] == P_Pa:
                     zind = np.nan
@@ -224,7 +233,7 @@ for plot_name in fig_param.keys():
 
                 out.contourf(fig_param[plot_name]['field'], cbar=False, 
                              ingest_kw={'zind':[zind, zind_NR], 'diff':True,
-                                        'indices':[None, [[2, 3180, 3], [3, 5400, 3]]]},
+                                        'indices':[None, NR_indices]},
                              cntf_kw=fig_param[plot_name]['cntf_diff_kw'])
 
                 cax_diff = out.cax
@@ -244,12 +253,9 @@ for plot_name in fig_param.keys():
                 cax = out.cax
 
             out.set_lim(lat[0], lat[1], lon[0], lon[1])
-            out.ax.coastlines('10m', edgecolor='k', linewidth=0.75)
-            borders = cfeature.NaturalEarthFeature(category='cultural',
-                                                   scale='10m',
-                                                   facecolor='none',
-                                                   name='admin_1_states_provinces')
-            out.ax.add_feature(borders, linewidth=0.75, edgecolor='k')
+            mf.coastlines(out.ax, '10m', edgecolor='k', linewidth=0.75)
+            mf.add_feature(out.ax, 'admin_1_states_provinces', scale='10m', linewidth=0.75,
+                           edgecolor='k')
             
             if j == 0:
                 out.ax.set_ylabel(s, size=16)
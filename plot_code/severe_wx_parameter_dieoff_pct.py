@@ -13,12 +13,12 @@ shawn.s.murdzek@noaa.gov
 #---------------------------------------------------------------------------------------------------
 
 import yaml
-import copy
 import datetime as dt
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 
-import metplus_OSSE_scripts.plotting.metplus_plots as mp
+import osse_utils.verif_cube as vc
 
 
 #---------------------------------------------------------------------------------------------------
@@ -36,6 +36,9 @@ ylabel = {'MLCAPE': 'MLCAPE % diff',
           'MLCIN': 'MLCIN % diff',
           'SRH03': '0$-$3 km SRH % diff'}
 
+# Partial-sums cube (built using other_code/build_verif_cubes.py)
+cube_fname = '../data/verif_cubes/spring_severe_wx_env_sl1l2.nc'
+
 # Output file
 out_fname = '../figs/SevereWxDieoffPct.pdf'
 #out_fname = '../figs/SevereWxDieoffPct.png'
@@ -48,56 +51,51 @@ out_fname = '../figs/SevereWxDieoffPct.pdf'
 # Read in simulation and plotting information
 with open(yml_fname, 'r') as fptr:
     param = yaml.safe_load(fptr)
-sim_dict = {}
-sim_dict['ctrl'] = param['sim_dict_spring']['ctrl']
-exp_name = []
-for key in param['sim_dict_spring'].keys():
-    if key[:3] == 'uas':
-        sim_dict[f'{key} $-$ ctrl'] = param['sim_dict_spring'][key]
-        exp_name.append(key)
+sim_dict = param['sim_dict_spring']
+exp_name = [key for key in sim_dict.keys() if key[:3] == 'uas']
 plot_dict = param['severe_wx_spring']['severe_wx_env']
 
+# Partial sums for the requested forecast leads and valid times
+fcst_lead = [0, 1, 2, 3, 6, 12]
+cube = vc.open_cube(cube_fname)
+cube = cube.sel(FCST_LEAD=fcst_lead, experiment=['ctrl'] + exp_name)
+cube = cube.isel(FCST_VALID_BEG=np.isin(cube['FCST_VALID_BEG'].values,
+                                        pd.DatetimeIndex(valid_times).values))
+
 # Make plot
 fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(6, 6), sharex=True)
 plt.subplots_adjust(left=0.12, bottom=0.29, right=0.99, top=0.93, hspace=0.08, wspace=0.35)
 letters = ['a', 'b', 'c', 'd']
-fcst_lead = [0, 1, 2, 3, 6, 12]
 for i, (v, c, ls) in enumerate(zip(list(plot_dict.keys()),
                                    ['k', 'gray', 'saddlebrown'],
                                    ['-', '-.', ':'])):
     print(f'Making plot for {v}')
-    input_sims = copy.deepcopy(sim_dict)
-    for key in input_sims:
-        input_sims[key]['dir'] = input_sims[key]['dir'].format(typ='GridStat', subtyp='severe_wx_env')
+    kwargs = plot_dict[v]['kwargs']
+    plot_stat = plot_dict[v]['plot_stat'][0]
+    sub = cube.sel(FCST_VAR=kwargs['plot_param']['FCST_VAR'],
+                   FCST_LEV=kwargs['plot_param']['FCST_LEV'],
+                   VX_MASK=kwargs['plot_param']['VX_MASK'])
+    stat = vc.compute_stats(sub)[plot_stat]
 
     # Control run
-    ctrl_sim = {}
     if v == 'SRH03':
         name = "ctrl 0$-$3 km SRH"
     else:
         name = f"ctrl {v}"
-    ctrl_sim[name] = input_sims['ctrl']
-    ctrl_sim[name]['color'] = c
-    ctrl_sim[name]['ls'] = ls
-    _ = mp.plot_sfc_dieoff(ctrl_sim, 
-                           valid_times,
-                           fcst_lead=fcst_lead,
-                           plot_stat=plot_dict[v]['plot_stat'][0],
-                           ax=axes[0, 0],
-                           verbose=False,
-                           **plot_dict[v]['kwargs'])
+    mean, lo, hi = vc.mean_ci(stat.sel(experiment='ctrl'), level=kwargs['ci_lvl'],
+                              ci_kw=kwargs['ci_kw'])
+    axes[0, 0].plot(fcst_lead, mean.values, c=c, ls=ls, label=name)
+    axes[0, 0].fill_between(fcst_lead, lo.values, hi.values, color=c, alpha=0.25, lw=0)
 
     # Percent differences
-    _ = mp.plot_sfc_dieoff(input_sims, 
-                           valid_times,
-                           fcst_lead=[0, 1, 2, 3, 6, 12],
-                           plot_stat=plot_dict[v]['plot_stat'][0],
-                           ax=axes[int((i+1) / 2), (i+1) % 2],
-                           verbose=False,
-                           diffs=True,
-                           include_ctrl=False,
-                           include_zero=True,
-                           **plot_dict[v]['kwargs'])
+    ax = axes[int((i+1) / 2), (i+1) % 2]
+    mean, lo, hi = vc.mean_ci(vc.pct_diff(stat), level=kwargs['ci_lvl'], ci_kw=kwargs['ci_kw'])
+    for key in exp_name:
+        ax.plot(fcst_lead, mean.sel(experiment=key).values, c=sim_dict[key]['color'],
+                label=f'{key} $-$ ctrl')
+        ax.fill_between(fcst_lead, lo.sel(experiment=key).values, hi.sel(experiment=key).values,
+                        color=sim_dict[key]['color'], alpha=0.25, lw=0)
+    ax.axhline(0, c='k', lw=0.75)
 
 # Formatting
 for i in range(4):
@@ -113,8 +111,6 @@ for i in range(4):
         ax.legend(ncols=3, fontsize=12, loc=(-0.1, -1.5))
     elif i == 1:
         ax.legend(ncols=2, fontsize=12, loc=(-1.15, -2))
-    else:
-        ax.get_legend().remove()
 
     # X label
     if i > 1: